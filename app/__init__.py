@@ -6,6 +6,25 @@ import threading
 
 db = SQLAlchemy()
 
+def init_database(app):
+    """テーブル作成・集計テーブルの初期化・作業ディレクトリ作成（何度実行しても安全）。"""
+    with app.app_context():
+        db.create_all()
+        from app.services.data_version_service import ensure_data_version_rows
+        ensure_data_version_rows()
+        from app.services.order_feature_store import ensure_order_stats
+        ensure_order_stats()
+        from app.services.stock_alert_service import rebuild_stock_alerts
+        rebuild_stock_alerts()
+        from app.services.change_feed_service import prune_product_changes
+        prune_product_changes(force=True)
+        from app.services.product_sync_service import ensure_product_sync_indexes, prune_tombstones
+        ensure_product_sync_indexes()
+        prune_tombstones()
+        os.makedirs('uploads', exist_ok=True)
+        os.makedirs('reports', exist_ok=True)
+        os.makedirs('models', exist_ok=True)
+
 def create_app():
     app = Flask(__name__)
     
@@ -45,12 +64,38 @@ def create_app():
     
     app.config['SQLALCHEMY_DATABASE_URI'] = database_url
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # 接続プール（サイズ・pre-ping・recycle・statement_timeout・PgBouncer 対応）
+    from app.services.db_pool_service import engine_options, register_pool_hooks
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(database_url)
     
     # CORS設定
     CORS(app)
     
     # データベース初期化
     db.init_app(app)
+    with app.app_context():
+        register_pool_hooks(db.engine)
+    
+    # Product 書き込み時にデータ版数を加算（レポートキャッシュのキー）
+    from app.services.data_version_service import register_data_version_hooks
+    register_data_version_hooks()
+    # 注文記録時に商品別の注文集計を差分更新
+    from app.services.order_feature_store import register_order_stats_hooks
+    register_order_stats_hooks()
+    # 商品の書き込みを検知して、在庫不足アラートの差分更新・変更フィードの記録を行う
+    # （do_orm_execute で文を実行するため最後に登録）
+    from app.services.product_write_hooks import register_product_write_hooks
+    from app.services.stock_alert_service import register_stock_alert_hooks
+    from app.services.change_feed_service import register_change_feed_hooks
+    from app.services.product_sync_service import register_product_sync_hooks
+    register_stock_alert_hooks()
+    register_change_feed_hooks()
+    register_product_sync_hooks()
+    register_product_write_hooks()
+    
+    # ルート別レイテンシ・SQL 回数/時間の計測と /metrics（Prometheus 形式）
+    from app.services.metrics_service import init_metrics
+    init_metrics(app, db)
     
     # ヘルスチェックを最初に登録（他インポートより前で、Railway等で確実に 200 を返す）
     @app.route('/health')
@@ -62,17 +107,15 @@ def create_app():
     app.register_blueprint(inventory_bp)
     
     # 起動をブロックしないよう、DB・ディレクトリ初期化はバックグラウンドで実行（/health がすぐ応答できるように）
-    def _init_db_and_dirs():
-        with app.app_context():
+    # Gunicorn（preload・複数ワーカー）ではマスターで 1 回だけ migrate.py を実行するため、ここでは行わない
+    if os.environ.get('DB_INIT_ON_STARTUP', '1') != '0':
+        def _init_db_and_dirs():
             try:
-                db.create_all()
-                os.makedirs('uploads', exist_ok=True)
-                os.makedirs('reports', exist_ok=True)
-                os.makedirs('models', exist_ok=True)
+                init_database(app)
             except Exception as e:
                 import sys
                 print(f"WARNING: Startup init (DB/dirs) failed: {e}", file=sys.stderr)
-    t = threading.Thread(target=_init_db_and_dirs, daemon=True)
-    t.start()
+        t = threading.Thread(target=_init_db_and_dirs, daemon=True)
+        t.start()
     
     return app
@@ -1,33 +1,66 @@
-from flask import Blueprint, request, jsonify, render_template, send_file
+from flask import Blueprint, Response, current_app, request, jsonify, render_template, send_file, stream_with_context
 from app.models.inventory import Product, OrderHistory
-from app.services.csv_service import CSVService
-from app.services.pdf_service import PDFService
-from app.services.delivery_pdf_import_service import DeliveryPdfImportService
+from app.services.lazy_service import LazyService
 from app.services.product_alias_service import on_product_renamed
-from app.services.product_merge_service import merge_products
+from app.services.product_merge_service import (
+    find_exact_duplicate_groups,
+    merge_duplicate_groups,
+    merge_product_groups,
+    merge_products,
+    remove_duplicate_system_dummies,
+)
+from app.services.data_version_service import get_data_version
+from app.services.report_cache import report_cache
+from app.services.db_pool_service import pool_status
+from app.services.stock_alert_service import get_stock_alerts
+from app.services.change_feed_service import (
+    acquire_stream_slot, latest_change_id, product_to_dict, release_stream_slot, stream_product_changes,
+)
+from app.services.inventory_page_service import (
+    dealer_names, get_initial_inventory, visible_product_filter, visible_products_query,
+)
+from app.services.bulk_patch_service import patch_products
+from app.services.product_delete_service import delete_products
+from app.services.settings_service import SETTINGS_FIELDS, apply_settings_changes
+from app.services.product_sync_service import (
+    DEFAULT_LIMIT as DEFAULT_SYNC_LIMIT, InvalidSyncToken, get_product_changes,
+)
+from app.services.reorder_service import (
+    compute_reorder_points, get_lead_times, set_lead_times, set_manual_min_quantity,
+)
 from app import db
 from datetime import datetime
+from urllib.parse import quote
 import os
 
-# 機械学習機能を条件付きでインポート
-try:
-    from app.services.ml_service import MLService
-    ml_service = MLService()
-    ML_AVAILABLE = True
-except ImportError:
-    ml_service = None
-    ML_AVAILABLE = False
+# pandas・reportlab・NumPy などを使うサービスは初回利用時に読み込む（起動時間・メモリ削減）
+csv_service = LazyService('app.services.csv_service', 'CSVService')
+pdf_service = LazyService('app.services.pdf_service', 'PDFService')
+delivery_pdf_import_service = LazyService('app.services.delivery_pdf_import_service', 'DeliveryPdfImportService')
+
+# 機械学習機能（依存が無い環境では available が False）
+ml_service = LazyService('app.services.ml_service', 'MLService')
+training_jobs = LazyService('app.services.training_jobs', 'training_jobs', instantiate=False)
+
+# Parquet/Arrow 機能（pyarrow が無い環境では無効）
+arrow_service = LazyService('app.services.arrow_service', 'ArrowService')
 
 inventory_bp = Blueprint('inventory', __name__)
-csv_service = CSVService()
-pdf_service = PDFService()
-delivery_pdf_import_service = DeliveryPdfImportService()
+
+_SETTINGS_FIELD_LABELS = {'category': 'カテゴリ', 'dealer': '取引会社', 'manufacturer': 'メーカー'}
 
 @inventory_bp.route('/')
 def index():
     """メインページ - 在庫一覧表示"""
-    products = Product.query.all()
-    return render_template('index.html', products=products)
+    dealer = request.args.get('dealer', '')
+    try:
+        initial_inventory = get_initial_inventory(dealer)
+    except Exception as e:
+        # 初期データを用意できなくてもページは返す（ブラウザが一覧 API で取得する）
+        current_app.logger.warning("初期表示データの取得に失敗: %s", e)
+        db.session.rollback()
+        initial_inventory = None
+    return render_template('index.html', initial_inventory=initial_inventory)
 
 @inventory_bp.route('/alerts')
 def alerts_page():
@@ -55,16 +88,7 @@ def get_products():
         dealer = request.args.get('dealer', '')
         
         # ベースクエリ（システム管理用ダミー商品を除外）
-        query = Product.query.filter(
-            db.not_(db.and_(
-                Product.product_name.like('取引会社管理用_%'),
-                Product.manufacturer == 'システム'
-            )),
-            db.not_(db.and_(
-                Product.product_name.like('カテゴリ管理用_%'),
-                Product.manufacturer == 'システム'
-            ))
-        )
+        query = visible_products_query()
         
         # 検索フィルタ
         if search:
@@ -86,22 +110,63 @@ def get_products():
         else:
             query = query.order_by(db.asc(getattr(Product, sort_by)))
         
+        # 一覧を読む前の変更フィードの位置（変更フィードはここから差分を送る）
+        version = latest_change_id()
         products = query.all()
         
-        return jsonify([{
-            'id': p.id,
-            'product_code': p.product_code,
-            'manufacturer': p.manufacturer,
-            'product_name': p.product_name,
-            'unit_price': p.unit_price,
-            'current_stock': p.current_stock,
-            'min_quantity': p.min_quantity,
-            'category': p.category,
-            'dealer': p.dealer
-        } for p in products])
+        response = jsonify([product_to_dict(p) for p in products])
+        response.headers['X-Products-Version'] = str(version)
+        return response
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 400
 
+@inventory_bp.route('/api/products/changes', methods=['GET'])
+def get_product_changes_api():
+    """前回の同期以降に追加・更新・削除された商品（差分同期）
+
+    since: 前回のレスポンスの version（初回は一覧 API の X-Products-Version、または ISO 形式の時刻）
+    reset=true のときは差分を作れないため、一覧を取り直してから version を使う。
+    """
+    try:
+        since = request.args.get('since', '')
+        if not since:
+            return jsonify({'success': False, 'error': 'since を指定してください'}), 400
+        limit = request.args.get('limit', DEFAULT_SYNC_LIMIT, type=int)
+        include_products = request.args.get('ids_only', '') not in ('1', 'true')
+        result = get_product_changes(since, limit, include_products)
+        return jsonify(dict(result, success=True))
+    except InvalidSyncToken as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@inventory_bp.route('/api/products/stream', methods=['GET'])
+def stream_products():
+    """商品の変更フィード（Server-Sent Events）
+
+    since（または再接続時の Last-Event-ID）以降の変更を products イベントで送る。
+    一覧 API の X-Products-Version を since に渡すと、一覧取得後の変更だけを受け取れる。
+    """
+    if not acquire_stream_slot():
+        return jsonify({'success': False, 'error': '変更フィードの同時接続数が上限に達しています'}), 503
+    try:
+        since = request.args.get('since', type=int)
+        if since is None:
+            since = request.headers.get('Last-Event-ID', type=int)
+        dealer = request.args.get('dealer', '')
+        response = Response(
+            stream_with_context(stream_product_changes(since, dealer)),
+            mimetype='text/event-stream',
+        )
+    except Exception:
+        release_stream_slot()
+        raise
+    response.headers['Cache-Control'] = 'no-cache'
+    # nginx 等のリバースプロキシでバッファリングしない
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.call_on_close(release_stream_slot)
+    return response
+
 @inventory_bp.route('/api/products', methods=['POST'])
 def create_product():
     """商品を手動で登録"""
@@ -172,6 +237,10 @@ def create_product():
         )
         
         db.session.add(new_product)
+        if data.get('min_quantity') not in (None, ''):
+            # 登録時に入力した最低必要数も、発注点の自動計算で上書きしない
+            db.session.flush()
+            set_manual_min_quantity(new_product.id, True)
         db.session.commit()
         
         return jsonify({
@@ -194,7 +263,12 @@ def update_product(product_id):
         if 'current_stock' in data:
             product.current_stock = int(data['current_stock'])
         if 'min_quantity' in data:
+            # 手入力した最低必要数は発注点の自動計算で上書きしない
             product.min_quantity = int(data['min_quantity'])
+            set_manual_min_quantity(product.id, True)
+        if data.get('min_quantity_auto'):
+            # 自動計算に戻す（次回の発注点計算から反映）
+            set_manual_min_quantity(product.id, False)
         if 'unit_price' in data:
             price = float(data['unit_price'])
             if price < 0:
@@ -229,7 +303,7 @@ def update_product(product_id):
 
 @inventory_bp.route('/api/products/merge', methods=['POST'])
 def merge_products_api():
-    """2〜3 件の商品を統合（在庫合算・各項目の採用元を指定）"""
+    """2 件以上の商品を統合（在庫合算・各項目の採用元を指定）"""
     try:
         data = request.get_json() or {}
         product_ids = data.get('product_ids', [])
@@ -264,17 +338,51 @@ def merge_products_api():
         return jsonify({'success': False, 'error': str(e)}), 400
 
 
+@inventory_bp.route('/api/products/merge/bulk', methods=['POST'])
+def merge_products_bulk_api():
+    """複数の統合グループをまとめて統合（重複検出の結果などをそのまま渡せる）
+
+    body: {"groups": [{"product_ids": [...], "keep_product_id": 任意, "manufacturer_from": 任意, ...}, ...]}
+    不正なグループは統合せずに results でエラーを返し、他のグループは 1 トランザクションで統合する。
+    """
+    try:
+        data = request.get_json() or {}
+        groups = data.get('groups')
+        if not isinstance(groups, list) or not groups:
+            return jsonify({'success': False, 'error': 'groups が不正です'}), 400
+
+        results = merge_product_groups(groups)
+        merged = [r for r in results if r['success']]
+        if not merged:
+            db.session.rollback()
+            return jsonify({'success': False, 'error': '統合できるグループがありません', 'results': results}), 400
+        db.session.commit()
+
+        merged_products = sum(len(r['merged_ids']) for r in merged)
+        return jsonify({
+            'success': True,
+            'message': f'{len(merged)} グループ（{merged_products} 件）を統合しました',
+            'merged_groups': len(merged),
+            'merged_products': merged_products,
+            'failed_groups': len(results) - len(merged),
+            'results': results,
+        })
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 @inventory_bp.route('/api/products/<int:product_id>', methods=['DELETE'])
 def delete_product(product_id):
     """商品の削除"""
     try:
-        product = Product.query.get_or_404(product_id)
+        Product.query.get_or_404(product_id)
         
-        # 関連する注文履歴も削除
-        OrderHistory.query.filter_by(product_id=product_id).delete()
-        
-        # 商品を削除
-        db.session.delete(product)
+        # 関連する注文履歴・別名・注文集計も含めて商品を削除
+        delete_products([product_id])
         db.session.commit()
         
         return jsonify({'success': True, 'message': '商品を削除しました'})
@@ -312,20 +420,13 @@ def adjust_stock(product_id):
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 400
 
-# 一覧に常に出す取引会社（DB に商品が無くても選択可能にする）
-_EXTRA_DEALER_PRESETS = ('BEAUTY GARAGE',)
-
 
 @inventory_bp.route('/api/dealers', methods=['GET'])
 def get_dealers():
     """取引会社一覧を取得"""
     try:
         # 商品に設定されている取引会社を取得（システム管理用ダミー商品も含む）
-        product_dealers = db.session.query(Product.dealer).distinct().filter(Product.dealer.isnot(None)).all()
-        dealer_list = [dealer[0] for dealer in product_dealers if dealer[0]]
-        dealer_list = sorted(set(dealer_list) | set(_EXTRA_DEALER_PRESETS))
-        
-        return jsonify({'success': True, 'dealers': dealer_list})
+        return jsonify({'success': True, 'dealers': dealer_names()})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 400
 
@@ -351,139 +452,48 @@ def get_manufacturers():
 
 @inventory_bp.route('/api/settings/bulk-update', methods=['POST'])
 def bulk_update_settings():
-    """カテゴリ・取引会社・メーカーの一括更新"""
+    """カテゴリ・取引会社・メーカーの一括更新（追加・名称変更・削除）
+
+    {"field": "category", "add": [...], "rename": {"旧": "新"}, "remove": [...], "fill_empty": false}
+    従来の {"action": "add" | "remove" | "rename", "field", "values"} も受け付ける（rename の values は {"旧": "新"}）。
+    すべての操作を 1 トランザクションで適用する。
+    """
     try:
-        data = request.get_json()
-        action = data.get('action')  # 'add' or 'remove'
-        field = data.get('field')    # 'category', 'dealer', 'manufacturer'
-        values = data.get('values', [])
-        
-        if not all([action, field, values]):
-            return jsonify({'success': False, 'error': '必要なパラメータが不足しています'})
-        
-        if action == 'add':
-            # 既存の商品に新しい値を設定
-            updated_count = 0
-            for value in values:
-                if value.strip():
-                    # 空のカテゴリを持つ商品を更新
-                    if field == 'category':
-                        result = Product.query.filter_by(category=None).update({Product.category: value.strip()})
-                        updated_count += result
-                    elif field == 'dealer':
-                        # 取引会社の場合は、未設定の商品に設定
-                        result = Product.query.filter_by(dealer=None).update({Product.dealer: value.strip()})
-                        updated_count += result
-                    elif field == 'manufacturer':
-                        result = Product.query.filter_by(manufacturer=None).update({Product.manufacturer: value.strip()})
-                        updated_count += result
-            
-            # カテゴリの場合は、商品が存在しなくても登録成功とする
-            if field == 'category':
-                # カテゴリが存在しない場合は、ダミー商品を作成してカテゴリを登録
-                if updated_count == 0:
-                    for value in values:
-                        if value.strip():
-                            # 既にそのカテゴリのダミー商品が存在するかチェック
-                            existing_dummy = Product.query.filter_by(
-                                product_name=f"カテゴリ管理用_{value.strip()}",
-                                manufacturer="システム",
-                                category=value.strip()
-                            ).first()
-                            
-                            if not existing_dummy:
-                                # ダミー商品を作成
-                                import time
-                                timestamp = int(time.time() * 1000) % 100000
-                                product_code = f"CATEGORY_{timestamp:05d}"
-                                
-                                # 商品コードの重複チェック
-                                while Product.query.filter_by(product_code=product_code).first():
-                                    timestamp += 1
-                                    product_code = f"CATEGORY_{timestamp:05d}"
-                                
-                                dummy_product = Product(
-                                    product_code=product_code,
-                                    product_name=f"カテゴリ管理用_{value.strip()}",
-                                    manufacturer="システム",
-                                    category=value.strip(),
-                                    unit_price=0,
-                                    current_stock=0,
-                                    min_quantity=0,
-                                    dealer="システム管理"
-                                )
-                                db.session.add(dummy_product)
-                                updated_count += 1
-                
-                db.session.commit()
-                return jsonify({'success': True, 'message': f'{len(values)}件のカテゴリを登録しました（更新件数: {updated_count}件）'})
-            
-            # 取引会社の場合は、商品が存在しなくても登録成功とする
-            if field == 'dealer':
-                # 取引会社が存在しない場合は、ダミー商品を作成して取引会社を登録
-                if updated_count == 0:
-                    for value in values:
-                        if value.strip():
-                            # 既にその取引会社のダミー商品が存在するかチェック
-                            existing_dummy = Product.query.filter_by(
-                                product_name=f"取引会社管理用_{value.strip()}",
-                                manufacturer="システム",
-                                dealer=value.strip()
-                            ).first()
-                            
-                            if not existing_dummy:
-                                # ダミー商品を作成
-                                import time
-                                timestamp = int(time.time() * 1000) % 100000
-                                product_code = f"DEALER_{timestamp:05d}"
-                                
-                                # 商品コードの重複チェック
-                                while Product.query.filter_by(product_code=product_code).first():
-                                    timestamp += 1
-                                    product_code = f"DEALER_{timestamp:05d}"
-                                
-                                dummy_product = Product(
-                                    product_code=product_code,
-                                    product_name=f"取引会社管理用_{value.strip()}",
-                                    manufacturer="システム",
-                                    dealer=value.strip(),
-                                    unit_price=0,
-                                    current_stock=0,
-                                    min_quantity=0,
-                                    category="システム管理"
-                                )
-                                db.session.add(dummy_product)
-                                updated_count += 1
-                
-                db.session.commit()
-                return jsonify({'success': True, 'message': f'{len(values)}件の取引会社を登録しました（更新件数: {updated_count}件）'})
-            
-            # 商品が存在しない場合は、メッセージのみ返す（テスト商品は作成しない）
-            if updated_count == 0:
-                return jsonify({'success': True, 'message': f'{len(values)}件の{field}を登録しました（対象商品なし）'})
-            
-            db.session.commit()
-            return jsonify({'success': True, 'message': f'{len(values)}件の{field}を追加しました（更新件数: {updated_count}件）'})
-        
-        elif action == 'remove':
-            # 指定された値を削除（Noneに設定）
-            removed_count = 0
-            for value in values:
-                if field == 'category':
-                    result = Product.query.filter_by(category=value).update({Product.category: None})
-                    removed_count += result
-                elif field == 'dealer':
-                    result = Product.query.filter_by(dealer=value).update({Product.dealer: None})
-                    removed_count += result
-                elif field == 'manufacturer':
-                    result = Product.query.filter_by(manufacturer=value).update({Product.manufacturer: None})
-                    removed_count += result
-            
-            db.session.commit()
-            return jsonify({'success': True, 'message': f'{len(values)}件の{field}を削除しました（影響商品数: {removed_count}件）'})
-        
-        return jsonify({'success': False, 'error': '無効なアクションです'})
-        
+        data = request.get_json() or {}
+        field = data.get('field')
+        add = list(data.get('add') or [])
+        rename = dict(data.get('rename') or {})
+        remove = list(data.get('remove') or [])
+
+        action = data.get('action')
+        if action:
+            values = data.get('values') or []
+            if action == 'add':
+                add += list(values)
+            elif action == 'remove':
+                remove += list(values)
+            elif action == 'rename' and isinstance(values, dict):
+                rename.update(values)
+            else:
+                return jsonify({'success': False, 'error': '無効なアクションです'}), 400
+
+        counts = apply_settings_changes(
+            field, add=add, rename=rename, remove=remove, fill_empty=bool(data.get('fill_empty')),
+        )
+        db.session.commit()
+
+        label = _SETTINGS_FIELD_LABELS[field]
+        parts = []
+        if counts['added']:
+            parts.append(f'追加 {counts["added"]}件（新規登録 {counts["registered"]}件）')
+        if rename:
+            parts.append(f'名称変更 {len(rename)}件（対象商品 {counts["renamed"]}件）')
+        if remove:
+            parts.append(f'削除 {len(remove)}件（影響商品数 {counts["removed"]}件）')
+        if counts['filled']:
+            parts.append(f'未設定の商品への設定 {counts["filled"]}件')
+        return jsonify(dict(counts, success=True, message=f'{label}: ' + '、'.join(parts)))
+
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'error': str(e)}), 400
@@ -493,16 +503,15 @@ def delete_test_products():
     """テスト商品の削除"""
     try:
         # テスト商品を検索（商品名に「テスト商品_」が含まれる商品）
-        test_products = Product.query.filter(Product.product_name.like('テスト商品_%')).all()
+        test_ids = db.session.execute(
+            db.select(Product.id).where(Product.product_name.like('テスト商品_%'))
+        ).scalars().all()
         
-        if not test_products:
+        if not test_ids:
             return jsonify({'success': True, 'message': '削除対象のテスト商品はありません'})
         
-        # テスト商品を削除
-        deleted_count = 0
-        for product in test_products:
-            db.session.delete(product)
-            deleted_count += 1
+        # テスト商品を削除（注文履歴・別名も含む）
+        deleted_count = delete_products(test_ids)['products']
         
         db.session.commit()
         return jsonify({'success': True, 'message': f'{deleted_count}件のテスト商品を削除しました'})
@@ -513,32 +522,26 @@ def delete_test_products():
 
 @inventory_bp.route('/api/debug/duplicate-products', methods=['GET'])
 def debug_duplicate_products():
-    """重複商品のデバッグ情報を取得"""
-    try:
-        # 商品名・メーカー・取引会社の組み合わせで重複をチェック
-        from sqlalchemy import func
-        
-        # 重複商品の検索
-        duplicates = db.session.query(
-            Product.product_name,
-            Product.manufacturer,
-            Product.dealer,
-            func.count(Product.id).label('count'),
-            func.group_concat(Product.id).label('product_ids')
-        ).group_by(
-            Product.product_name,
-            Product.manufacturer,
-            Product.dealer
-        ).having(func.count(Product.id) > 1).all()
-        
+    """重複商品のデバッグ情報を取得
+
+    mode=exact（既定）: 商品名・メーカー・取引会社が完全一致する組
+    mode=fuzzy: 表記ゆれを含む重複候補（MinHash/LSH + 類似度。scope=all でメーカーを跨いで比較）
+    """
+    try:
+        mode = request.args.get('mode', 'exact')
+        if mode == 'fuzzy':
+            return _fuzzy_duplicate_products()
+        if mode != 'exact':
+            return jsonify({'success': False, 'error': '無効なモードです'}), 400
+
         result = []
-        for dup in duplicates:
+        for group in find_exact_duplicate_groups():
             result.append({
-                'product_name': dup.product_name,
-                'manufacturer': dup.manufacturer,
-                'dealer': dup.dealer or '未設定',
-                'count': dup.count,
-                'product_ids': dup.product_ids.split(',')
+                'product_name': group['product_name'],
+                'manufacturer': group['manufacturer'],
+                'dealer': group['dealer'] or '未設定',
+                'count': len(group['product_ids']),
+                'product_ids': [str(pid) for pid in group['product_ids']]
             })
         
         return jsonify({
@@ -550,45 +553,89 @@ def debug_duplicate_products():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 400
 
+def _fuzzy_duplicate_products():
+    """表記ゆれを含む重複候補のクラスタ（類似度付き）"""
+    from app.services.duplicate_detection import find_near_duplicates
+    from app.services.product_matching import DEFAULT_SIMILARITY_THRESHOLD
+
+    threshold = request.args.get('threshold', DEFAULT_SIMILARITY_THRESHOLD, type=float)
+    if not 0 < threshold <= 1:
+        return jsonify({'success': False, 'error': 'threshold は 0 より大きく 1 以下で指定してください'}), 400
+    same_manufacturer = request.args.get('scope', 'manufacturer') != 'all'
+
+    # システム管理用ダミー商品は統合できないので候補に含めない
+    rows = db.session.query(
+        Product.id, Product.product_name, Product.manufacturer, Product.dealer, Product.current_stock
+    ).filter(visible_product_filter()).all()
+    by_id = {row.id: row for row in rows}
+    clusters = find_near_duplicates(
+        [(row.id, row.product_name, row.manufacturer) for row in rows],
+        threshold=threshold,
+        same_manufacturer=same_manufacturer,
+    )
+
+    result = []
+    for cluster in clusters:
+        members = [by_id[pid] for pid in cluster.ids]
+        first = members[0]
+        result.append({
+            'product_name': first.product_name,
+            'manufacturer': first.manufacturer,
+            'dealer': first.dealer or '未設定',
+            'count': len(members),
+            'product_ids': [str(pid) for pid in cluster.ids],
+            'keep_id': first.id,
+            'score': cluster.score,
+            'exact': cluster.exact,
+            'pairs': [{'a': a, 'b': b, 'score': s} for a, b, s in cluster.pairs],
+            'products': [{
+                'id': m.id,
+                'product_name': m.product_name,
+                'manufacturer': m.manufacturer,
+                'dealer': m.dealer or '未設定',
+                'current_stock': m.current_stock,
+            } for m in members],
+        })
+
+    return jsonify({
+        'success': True,
+        'mode': 'fuzzy',
+        'threshold': threshold,
+        'duplicates': result,
+        'total_duplicates': len(result)
+    })
+
+@inventory_bp.route('/api/debug/db-pool', methods=['GET'])
+def debug_db_pool():
+    """DB 接続プールの状態（このワーカープロセスの値）"""
+    try:
+        return jsonify({'success': True, 'pool': pool_status(db.engine)})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @inventory_bp.route('/api/debug/clean-duplicates', methods=['POST'])
 def clean_duplicate_products():
-    """重複商品のクリーンアップ（古い方を削除）"""
-    try:
-        from sqlalchemy import func
-        
-        # 重複商品の検索
-        duplicates = db.session.query(
-            Product.product_name,
-            Product.manufacturer,
-            Product.dealer,
-            func.min(Product.id).label('keep_id'),
-            func.count(Product.id).label('count')
-        ).group_by(
-            Product.product_name,
-            Product.manufacturer,
-            Product.dealer
-        ).having(func.count(Product.id) > 1).all()
-        
-        deleted_count = 0
-        for dup in duplicates:
-            # 古い商品（IDが大きい方）を削除
-            old_products = Product.query.filter(
-                Product.product_name == dup.product_name,
-                Product.manufacturer == dup.manufacturer,
-                Product.dealer == dup.dealer,
-                Product.id != dup.keep_id
-            ).all()
-            
-            for product in old_products:
-                db.session.delete(product)
-                deleted_count += 1
-        
+    """重複商品のクリーンアップ（最小 ID の商品へ在庫・注文履歴・エイリアスを統合し、残りを削除）"""
+    try:
+        groups = find_exact_duplicate_groups()
+        result = merge_duplicate_groups(group['product_ids'] for group in groups)
+        # システム管理用ダミー商品は統合せず、重複分を削除するだけ
+        result['removed_dummies'] = remove_duplicate_system_dummies()
         db.session.commit()
+        message = f"{result['merged']}件の重複商品を統合しました（{result['groups']}組）"
+        if result['removed_dummies']:
+            message += f"。重複したシステム管理用商品を{result['removed_dummies']}件削除しました"
+        if result['failed']:
+            message += f"。{len(result['failed'])}組は統合できませんでした"
         return jsonify({
             'success': True,
-            'message': f'{deleted_count}件の重複商品を削除しました'
+            'message': message,
+            **result,
         })
         
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'error': str(e)}), 400
@@ -677,64 +724,172 @@ def upload_inventory_pdf():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+# ストリーミング応答で 1 回に送るバイト数
+_STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def _attachment_headers(filename):
+    """日本語ファイル名にも対応した Content-Disposition ヘッダー"""
+    ascii_name = filename.encode('ascii', 'ignore').decode('ascii') or 'download'
+    return {
+        'Content-Disposition': f"attachment; filename=\"{ascii_name}\"; filename*=UTF-8''{quote(filename)}"
+    }
+
+
+def _iter_file_chunks(fileobj, chunk_size=_STREAM_CHUNK_SIZE):
+    """ファイルを一定サイズずつ読み出して返し、最後に閉じる"""
+    try:
+        while True:
+            chunk = fileobj.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        fileobj.close()
+
+
 @inventory_bp.route('/api/csv/export', methods=['GET'])
 def export_csv():
-    """在庫データのCSVエクスポート"""
+    """在庫データのCSVエクスポート（一時ファイルを作らずストリーミングで送信）"""
     try:
         dealer = request.args.get('dealer', '')
-        success, result = csv_service.export_inventory_csv(dealer)
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        dealer_suffix = f"_{dealer}" if dealer else ""
+        filename = f"inventory_export{dealer_suffix}_{timestamp}.csv"
+        return Response(
+            stream_with_context(csv_service.iter_inventory_csv(dealer)),
+            mimetype='text/csv',
+            headers=_attachment_headers(filename),
+        )
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+_PARQUET_UNAVAILABLE = (
+    'Parquet/Arrow機能は利用できません（pyarrow が必要です: pip install -r requirements-optional.txt）'
+)
+
+@inventory_bp.route('/api/parquet/export/<dataset>', methods=['GET'])
+def export_parquet(dataset):
+    """商品・エイリアス・注文履歴の Parquet / Arrow 一括エクスポート（分析基盤向け）"""
+    if not arrow_service.available:
+        return jsonify({'success': False, 'error': _PARQUET_UNAVAILABLE}), 501
+    try:
+        fmt = request.args.get('format', 'parquet')
+        success, result = arrow_service.export_dataset(dataset, fmt)
+        if not success:
+            return jsonify({'success': False, 'error': result}), 400
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        extension = 'parquet' if fmt == 'parquet' else 'arrows'
+        mimetype = 'application/vnd.apache.parquet' if fmt == 'parquet' else 'application/vnd.apache.arrow.stream'
+        return Response(
+            _iter_file_chunks(result),
+            mimetype=mimetype,
+            headers=_attachment_headers(f"{dataset}_{timestamp}.{extension}"),
+            direct_passthrough=True,
+        )
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@inventory_bp.route('/api/parquet/upload', methods=['POST'])
+def upload_parquet():
+    """在庫 Parquet ファイルのアップロードと処理（CSV 取込と同じ照合で在庫へ反映）"""
+    if not arrow_service.available:
+        return jsonify({'success': False, 'error': _PARQUET_UNAVAILABLE}), 501
+    try:
+        if 'file' not in request.files:
+            return jsonify({'success': False, 'error': 'ファイルが選択されていません'}), 400
+        
+        file = request.files['file']
+        if file.filename == '':
+            return jsonify({'success': False, 'error': 'ファイルが選択されていません'}), 400
+        
+        if not file.filename.lower().endswith('.parquet'):
+            return jsonify({'success': False, 'error': 'Parquetファイルのみ対応しています'}), 400
+        
+        dealer = request.form.get('dealer', '')
+        
+        filename = f"upload_{datetime.now().strftime('%Y%m%d_%H%M%S')}.parquet"
+        filepath = os.path.join('uploads', filename)
+        os.makedirs('uploads', exist_ok=True)
+        file.save(filepath)
+        
+        try:
+            success, message = arrow_service.process_inventory_parquet(filepath, dealer)
+        finally:
+            try:
+                os.remove(filepath)
+            except OSError:
+                pass
+        
         if success:
-            return jsonify({'success': True, 'file_path': result})
+            return jsonify({'success': True, 'message': message})
         else:
-            return jsonify({'success': False, 'error': result}), 400
+            return jsonify({'success': False, 'error': message}), 400
+            
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @inventory_bp.route('/api/pdf/export', methods=['GET'])
 def export_pdf():
-    """在庫データのPDFエクスポート"""
+    """在庫データのPDFエクスポート（データ未変更ならキャッシュ済みファイルを返す）"""
     try:
         dealer = request.args.get('dealer', '')
         sort_by = request.args.get('sort_by', 'product_name')
         sort_order = request.args.get('sort_order', 'asc')
-        success, result = pdf_service.export_inventory_pdf(dealer, sort_by, sort_order)
-        if success:
-            # ファイル名を生成
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            dealer_suffix = f"_{dealer}" if dealer else ""
-            filename = f"在庫レポート{dealer_suffix}_{timestamp}.pdf"
-            
-            return send_file(
-                result,
-                as_attachment=True,
-                download_name=filename,
-                mimetype='application/pdf'
-            )
-        else:
-            return jsonify({'success': False, 'error': result}), 400
+        now = datetime.now()
+        # タイトルに作成日を入れるため、日付もキーに含める
+        cache_key = ('pdf_inventory', dealer, sort_by, sort_order, get_data_version(), now.date().isoformat())
+        cached = report_cache.get(cache_key, '.pdf')
+        if cached is None:
+            success, result = pdf_service.export_inventory_pdf(dealer, sort_by, sort_order)
+            if not success:
+                return jsonify({'success': False, 'error': result}), 400
+            cached = report_cache.put_stream(cache_key, result, '.pdf')
+
+        # ファイル名を生成
+        timestamp = now.strftime('%Y%m%d_%H%M%S')
+        dealer_suffix = f"_{dealer}" if dealer else ""
+        filename = f"在庫レポート{dealer_suffix}_{timestamp}.pdf"
+        
+        return send_file(
+            cached,
+            as_attachment=True,
+            download_name=filename,
+            mimetype='application/pdf'
+        )
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @inventory_bp.route('/api/pdf/inventory-count', methods=['GET'])
 def export_inventory_count_pdf():
-    """棚卸し表（カテゴリ・金額・数量・合計金額）のPDFエクスポート"""
+    """棚卸し表（カテゴリ・金額・数量・合計金額）のPDFエクスポート（ページ単位で描画しチャンク送信）"""
     try:
         dealer = request.args.get('dealer', '')
         sort_by = request.args.get('sort_by', 'product_name')
         sort_order = request.args.get('sort_order', 'asc')
-        success, result = pdf_service.export_inventory_count_pdf(dealer, sort_by, sort_order)
-        if success:
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            dealer_suffix = f"_{dealer}" if dealer else ""
-            filename = f"棚卸し表{dealer_suffix}_{timestamp}.pdf"
-            return send_file(
-                result,
-                as_attachment=True,
-                download_name=filename,
-                mimetype='application/pdf'
+        cache_key = ('pdf_inventory_count', dealer, sort_by, sort_order, get_data_version())
+        cached = report_cache.get(cache_key, '.pdf')
+        if cached is None:
+            from app.services.pdf_service import INVENTORY_COUNT_ROWS_PER_PAGE
+            success, result = pdf_service.export_inventory_count_pdf(
+                dealer, sort_by, sort_order, rows_per_page=INVENTORY_COUNT_ROWS_PER_PAGE
             )
-        else:
-            return jsonify({'success': False, 'error': result}), 400
+            if not success:
+                return jsonify({'success': False, 'error': result}), 400
+            try:
+                cached = report_cache.put_stream(cache_key, result, '.pdf')
+            finally:
+                result.close()
+
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        dealer_suffix = f"_{dealer}" if dealer else ""
+        filename = f"棚卸し表{dealer_suffix}_{timestamp}.pdf"
+        return Response(
+            _iter_file_chunks(cached),
+            mimetype='application/pdf',
+            headers=_attachment_headers(filename),
+            direct_passthrough=True,
+        )
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -750,16 +905,12 @@ def bulk_update_products():
         if not all([field, current_value, new_value]):
             return jsonify({'success': False, 'error': '必要なパラメータが不足しています'})
         
-        # 指定された値を持つ商品を更新
-        if field == 'category':
-            result = Product.query.filter_by(category=current_value).update({Product.category: new_value})
-        elif field == 'dealer':
-            result = Product.query.filter_by(dealer=current_value).update({Product.dealer: new_value})
-        elif field == 'manufacturer':
-            result = Product.query.filter_by(manufacturer=current_value).update({Product.manufacturer: new_value})
-        else:
+        if field not in SETTINGS_FIELDS:
             return jsonify({'success': False, 'error': '無効なフィールドです'})
         
+        # 指定された値を持つ商品を更新
+        result = apply_settings_changes(field, rename={current_value: new_value})['renamed']
+        
         db.session.commit()
         return jsonify({'success': True, 'message': f'{result}件の商品の{field}を更新しました'})
         
@@ -849,6 +1000,8 @@ def bulk_update_category():
         data = request.get_json()
         category = data.get('category')
         product_ids = data.get('product_ids', [])
+        if not isinstance(product_ids, list):
+            return jsonify({'success': False, 'error': 'product_ids が不正です'}), 400
         
         if not category:
             return jsonify({'success': False, 'error': 'カテゴリ名が指定されていません'})
@@ -857,7 +1010,7 @@ def bulk_update_category():
             return jsonify({'success': False, 'error': '商品が選択されていません'})
         
         # 選択された商品のカテゴリを更新
-        result = Product.query.filter(Product.id.in_(product_ids)).update({Product.category: category})
+        result = patch_products({'category': category}, product_ids=product_ids)['updated']
         
         db.session.commit()
         return jsonify({'success': True, 'message': f'{result}件の商品のカテゴリを設定しました'})
@@ -873,6 +1026,8 @@ def bulk_update_dealer():
         data = request.get_json()
         dealer = data.get('dealer')
         product_ids = data.get('product_ids', [])
+        if not isinstance(product_ids, list):
+            return jsonify({'success': False, 'error': 'product_ids が不正です'}), 400
         
         if not dealer:
             return jsonify({'success': False, 'error': '取引会社名が指定されていません'})
@@ -881,7 +1036,7 @@ def bulk_update_dealer():
             return jsonify({'success': False, 'error': '商品が選択されていません'})
         
         # 選択された商品の取引会社を更新
-        result = Product.query.filter(Product.id.in_(product_ids)).update({Product.dealer: dealer})
+        result = patch_products({'dealer': dealer}, product_ids=product_ids)['updated']
         
         db.session.commit()
         return jsonify({'success': True, 'message': f'{result}件の商品の取引会社を設定しました'})
@@ -890,21 +1045,44 @@ def bulk_update_dealer():
         db.session.rollback()
         return jsonify({'success': False, 'error': str(e)}), 400
 
+@inventory_bp.route('/api/products/bulk-patch', methods=['POST'])
+def bulk_patch_products():
+    """商品の一括パッチ（ID の集合または絞り込み条件で対象を指定）
+
+    {"product_ids": [1, 2, ...], "patch": {"category": "消耗品", "min_quantity": 5}}
+    {"filter": {"dealer": "A", "low_stock": true}, "patch": {...}}（全商品は {"all": true}）
+    """
+    try:
+        data = request.get_json() or {}
+        counts = patch_products(
+            data.get('patch'), product_ids=data.get('product_ids'), filter_spec=data.get('filter'),
+        )
+        db.session.commit()
+        return jsonify(dict(counts, success=True, message=f'{counts["updated"]}件の商品を更新しました'))
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 400
+
 @inventory_bp.route('/api/products/bulk-delete', methods=['POST'])
 def bulk_delete_products():
     """選択された商品の一括削除"""
     try:
-        data = request.get_json()
+        data = request.get_json() or {}
         product_ids = data.get('product_ids', [])
+        if not isinstance(product_ids, list):
+            return jsonify({'success': False, 'error': 'product_ids が不正です'}), 400
         
         if not product_ids:
             return jsonify({'success': False, 'error': '削除する商品が選択されていません'})
         
-        # 選択された商品を削除
-        result = Product.query.filter(Product.id.in_(product_ids)).delete(synchronize_session=False)
+        # 選択された商品を注文履歴・別名・注文集計ごと削除
+        counts = delete_products(product_ids)
         
         db.session.commit()
-        return jsonify({'success': True, 'message': f'{result}件の商品を削除しました'})
+        return jsonify(dict(
+            counts, success=True,
+            message=f'{counts["products"]}件の商品を削除しました（注文履歴 {counts["order_history"]}件）',
+        ))
         
     except Exception as e:
         db.session.rollback()
@@ -912,22 +1090,35 @@ def bulk_delete_products():
 
 @inventory_bp.route('/api/ml/train', methods=['POST'])
 def train_ml_model():
-    """機械学習モデルの訓練"""
-    if not ML_AVAILABLE:
+    """機械学習モデルの訓練（バックグラウンドジョブとして開始し、ジョブIDを返す）"""
+    if not training_jobs.available:
         return jsonify({'success': False, 'error': '機械学習機能は利用できません'}), 503
     try:
-        success, message = ml_service.train_model()
-        if success:
-            return jsonify({'success': True, 'message': message})
-        else:
-            return jsonify({'success': False, 'error': message}), 400
+        dealer = request.args.get('dealer', '')
+        job = training_jobs.start(current_app._get_current_object(), dealer)
+        return jsonify({
+            'success': True,
+            'message': job['message'],
+            'job': job,
+            'status_url': f"/api/ml/train/{job['job_id']}",
+        }), 202
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@inventory_bp.route('/api/ml/train/<job_id>', methods=['GET'])
+def get_ml_training_status(job_id):
+    """訓練ジョブの状態（進捗・結果）の取得"""
+    if not training_jobs.available:
+        return jsonify({'success': False, 'error': '機械学習機能は利用できません'}), 503
+    job = training_jobs.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': '訓練ジョブが見つかりません'}), 404
+    return jsonify({'success': True, 'job': job})
+
 @inventory_bp.route('/api/ml/recommendations', methods=['GET'])
 def get_recommendations():
     """注文推奨の取得"""
-    if not ML_AVAILABLE:
+    if not ml_service.available:
         return jsonify({'success': False, 'error': '機械学習機能は利用できません'}), 503
     try:
         dealer = request.args.get('dealer', '')
@@ -951,21 +1142,64 @@ def get_recommendations():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@inventory_bp.route('/api/reorder/recompute', methods=['POST'])
+def recompute_reorder_points():
+    """注文履歴から発注点・安全在庫を再計算し、最低必要数に反映"""
+    try:
+        dealer = request.args.get('dealer', '')
+        service_z = request.args.get('service_z', type=float)
+        if service_z is None and request.args.get('service_z'):
+            return jsonify({'success': False, 'error': 'service_z は数値で指定してください'}), 400
+        result = compute_reorder_points(dealer, service_z)
+        db.session.commit()
+        return jsonify({
+            'success': True,
+            'message': f"{result['updated']}件の商品の最低必要数を更新しました",
+            **result,
+        })
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@inventory_bp.route('/api/settings/lead-times', methods=['GET'])
+def get_dealer_lead_times():
+    """取引会社ごとのリードタイム（日）の取得"""
+    try:
+        return jsonify({'success': True, 'lead_times': get_lead_times()})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+@inventory_bp.route('/api/settings/lead-times', methods=['PUT'])
+def update_dealer_lead_times():
+    """取引会社ごとのリードタイム（日）の更新（値に null を指定すると設定を削除）"""
+    try:
+        data = request.get_json() or {}
+        lead_times = data.get('lead_times')
+        if not isinstance(lead_times, dict) or not lead_times:
+            return jsonify({'success': False, 'error': '必要なパラメータが不足しています'}), 400
+        changed = set_lead_times(lead_times)
+        db.session.commit()
+        return jsonify({'success': True, 'message': f'{changed}件のリードタイムを更新しました'})
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @inventory_bp.route('/api/alerts', methods=['GET'])
 def get_alerts():
     """在庫アラートの取得"""
     try:
         dealer = request.args.get('dealer', '')
         
-        # 在庫が最低必要数を下回っている商品
-        query = Product.query.filter(Product.current_stock < Product.min_quantity)
-        if dealer:
-            query = query.filter(Product.dealer == dealer)
-        
-        low_stock_products = query.all()
-        
+        # 在庫が最低必要数を下回っている商品（差分更新しているアラート一覧から読む）
+        version = latest_change_id()
         alerts = []
-        for product in low_stock_products:
+        for product, alert in get_stock_alerts(dealer):
             alerts.append({
                 'type': 'low_stock',
                 'product_id': product.id,
@@ -973,11 +1207,14 @@ def get_alerts():
                 'manufacturer': product.manufacturer,
                 'current_stock': product.current_stock,
                 'min_quantity': product.min_quantity,
-                'shortage': product.min_quantity - product.current_stock,
+                'shortage': alert.shortage,
+                'urgency': alert.urgency,
                 'category': product.category,
                 'dealer': product.dealer
             })
         
-        return jsonify({'success': True, 'alerts': alerts})
+        response = jsonify({'success': True, 'alerts': alerts, 'version': version})
+        response.headers['X-Products-Version'] = str(version)
+        return response
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -1,4 +1,28 @@
 from app import db
-from .inventory import Product, ProductAlias, OrderHistory
+from .inventory import (
+    Product,
+    ProductAlias,
+    OrderHistory,
+    DataVersion,
+    ProductOrderStats,
+    ProductWeeklyDemand,
+    DealerLeadTime,
+    ReorderPolicy,
+    StockAlert,
+    ProductChange,
+    ProductTombstone,
+)
 
-__all__ = ['Product', 'ProductAlias', 'OrderHistory']
+__all__ = [
+    'Product',
+    'ProductAlias',
+    'OrderHistory',
+    'DataVersion',
+    'ProductOrderStats',
+    'ProductWeeklyDemand',
+    'DealerLeadTime',
+    'ReorderPolicy',
+    'StockAlert',
+    'ProductChange',
+    'ProductTombstone',
+]
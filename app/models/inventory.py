@@ -12,7 +12,7 @@ class Product(db.Model):
     current_stock = db.Column(db.Integer, default=0)
     dealer = db.Column(db.String(100))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
 
     aliases = db.relationship(
         'ProductAlias',
@@ -54,3 +54,109 @@ class OrderHistory(db.Model):
 
     def __repr__(self):
         return f'<OrderHistory {self.product.product_name} - {self.quantity}>'
+
+
+class DataVersion(db.Model):
+    """テーブル単位のデータ版数。書き込みのたびに加算し、レポートキャッシュ等のキーに使う。"""
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<DataVersion {self.name}={self.version}>'
+
+
+class ProductOrderStats(db.Model):
+    """商品ごとの注文履歴の集計（注文記録時に差分更新。学習・予測はここを読む）。"""
+    product_id = db.Column(
+        db.Integer, db.ForeignKey('product.id', ondelete='CASCADE'), primary_key=True
+    )
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+    quantity_sum = db.Column(db.BigInteger, nullable=False, default=0)
+    quantity_sq_sum = db.Column(db.BigInteger, nullable=False, default=0)
+    first_order_date = db.Column(db.DateTime)
+    last_order_date = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<ProductOrderStats {self.product_id} n={self.order_count}>'
+
+
+class ProductWeeklyDemand(db.Model):
+    """商品×週（月曜始まり）の注文数量バケット。"""
+    product_id = db.Column(
+        db.Integer, db.ForeignKey('product.id', ondelete='CASCADE'), primary_key=True
+    )
+    week_start = db.Column(db.Date, primary_key=True)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+    quantity = db.Column(db.BigInteger, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<ProductWeeklyDemand {self.product_id} {self.week_start}={self.quantity}>'
+
+
+class DealerLeadTime(db.Model):
+    """取引会社ごとの発注リードタイム（日）。発注点・安全在庫の計算に使う。"""
+    dealer = db.Column(db.String(100), primary_key=True)
+    lead_time_days = db.Column(db.Integer, nullable=False)
+
+    def __repr__(self):
+        return f'<DealerLeadTime {self.dealer}={self.lead_time_days}>'
+
+
+class ReorderPolicy(db.Model):
+    """注文履歴の需要ばらつきから計算した商品ごとの発注点・安全在庫。
+
+    manual=True の商品は最低必要数（min_quantity）を手入力値のまま使い、自動計算で上書きしない。
+    """
+    product_id = db.Column(
+        db.Integer, db.ForeignKey('product.id', ondelete='CASCADE'), primary_key=True
+    )
+    safety_stock = db.Column(db.Integer)
+    reorder_point = db.Column(db.Integer)
+    lead_time_days = db.Column(db.Integer)
+    demand_mean_weekly = db.Column(db.Float)
+    demand_std_weekly = db.Column(db.Float)
+    manual = db.Column(db.Boolean, nullable=False, default=False)
+    computed_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<ReorderPolicy {self.product_id} rop={self.reorder_point}>'
+
+
+class StockAlert(db.Model):
+    """在庫不足（current_stock < min_quantity）の商品の一覧。
+
+    商品の在庫数・最低必要数・取引会社が変わるたびに差分更新し、アラートの読み出しで Product を全件走査しない。
+    """
+    product_id = db.Column(
+        db.Integer, db.ForeignKey('product.id', ondelete='CASCADE'), primary_key=True
+    )
+    dealer = db.Column(db.String(100), index=True)
+    shortage = db.Column(db.Integer, nullable=False, index=True)
+    urgency = db.Column(db.String(10), nullable=False)  # high, medium, low
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<StockAlert {self.product_id} shortage={self.shortage}>'
+
+
+class ProductChange(db.Model):
+    """商品の変更ログ（変更フィード用）。id を単調増加の版数として使う。
+
+    product_id は削除後も残すため外部キーにしない。op='reset' は対象を特定できない一括変更（全件の再読み込みが必要）。
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer)
+    op = db.Column(db.String(10), nullable=False)  # upsert, delete, reset
+    changed_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f'<ProductChange {self.id} {self.op} {self.product_id}>'
+
+
+class ProductTombstone(db.Model):
+    """削除された商品の記録（差分同期で削除を伝えるため。変更ログより長く保持する）。"""
+    product_id = db.Column(db.Integer, primary_key=True)
+    deleted_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f'<ProductTombstone {self.product_id} {self.deleted_at}>'
@@ -0,0 +1,135 @@
+"""Product / ProductAlias / OrderHistory の Parquet・Arrow 一括エクスポートと Parquet 取込（分析基盤向け）。"""
+from __future__ import annotations
+
+import tempfile
+from typing import Any, BinaryIO, Dict, Iterator, List, Tuple
+
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+
+from app import db
+from app.models.inventory import OrderHistory, Product, ProductAlias
+from app.services.csv_service import CSVService
+
+DEFAULT_BATCH_SIZE = 50_000
+# エクスポート結果をメモリに保持する上限（超えたら一時ファイルへ退避）
+_SPOOL_MAX_SIZE = 32 * 1024 * 1024
+
+_TIMESTAMP = pa.timestamp("us")
+
+# データセット名 -> (モデル, [(列名, Arrow 型)])
+DATASETS: Dict[str, Tuple[Any, List[Tuple[str, pa.DataType]]]] = {
+    "products": (
+        Product,
+        [
+            ("id", pa.int64()),
+            ("product_code", pa.string()),
+            ("category", pa.string()),
+            ("manufacturer", pa.string()),
+            ("product_name", pa.string()),
+            ("unit_price", pa.float64()),
+            ("min_quantity", pa.int32()),
+            ("current_stock", pa.int32()),
+            ("dealer", pa.string()),
+            ("created_at", _TIMESTAMP),
+            ("updated_at", _TIMESTAMP),
+        ],
+    ),
+    "aliases": (
+        ProductAlias,
+        [
+            ("id", pa.int64()),
+            ("product_id", pa.int64()),
+            ("alias_name", pa.string()),
+            ("source", pa.string()),
+            ("created_at", _TIMESTAMP),
+        ],
+    ),
+    "order-history": (
+        OrderHistory,
+        [
+            ("id", pa.int64()),
+            ("product_id", pa.int64()),
+            ("quantity", pa.int32()),
+            ("order_date", _TIMESTAMP),
+            ("dealer", pa.string()),
+        ],
+    ),
+}
+
+EXPORT_FORMATS = ("parquet", "arrow")
+
+
+def _schema_for(dataset: str) -> pa.Schema:
+    _model, columns = DATASETS[dataset]
+    return pa.schema([pa.field(name, typ) for name, typ in columns])
+
+
+def iter_record_batches(dataset: str, batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[pa.RecordBatch]:
+    """ID 順に batch_size 行ずつ読み、型付きの RecordBatch を返す（ORM オブジェクトは作らない）。"""
+    model, columns = DATASETS[dataset]
+    schema = _schema_for(dataset)
+    query = (
+        db.session.query(*(getattr(model, name) for name, _typ in columns))
+        .order_by(model.id)
+        .execution_options(yield_per=batch_size)
+    )
+    buffers: List[List[Any]] = [[] for _ in columns]
+    for row in query:
+        for buf, value in zip(buffers, row):
+            buf.append(value)
+        if len(buffers[0]) >= batch_size:
+            yield pa.RecordBatch.from_arrays(
+                [pa.array(buf, type=f.type) for buf, f in zip(buffers, schema)],
+                schema=schema,
+            )
+            buffers = [[] for _ in columns]
+    if buffers[0]:
+        yield pa.RecordBatch.from_arrays(
+            [pa.array(buf, type=f.type) for buf, f in zip(buffers, schema)],
+            schema=schema,
+        )
+
+
+class ArrowService:
+    @staticmethod
+    def export_dataset(dataset: str, fmt: str = "parquet", batch_size: int = DEFAULT_BATCH_SIZE):
+        """データセットを Parquet または Arrow IPC ストリームとして書き出す
+
+        Returns:
+            (True, 先頭に巻き戻したファイルオブジェクト) | (False, エラーメッセージ)
+        """
+        if dataset not in DATASETS:
+            return False, f"不明なデータセットです: {dataset}"
+        if fmt not in EXPORT_FORMATS:
+            return False, f"不明な形式です: {fmt}"
+        output: BinaryIO = tempfile.SpooledTemporaryFile(max_size=_SPOOL_MAX_SIZE)
+        try:
+            schema = _schema_for(dataset)
+            if fmt == "parquet":
+                writer = pq.ParquetWriter(output, schema, compression="zstd")
+            else:
+                writer = ipc.new_stream(output, schema)
+            with writer:
+                for batch in iter_record_batches(dataset, batch_size):
+                    if fmt == "parquet":
+                        writer.write_batch(batch, row_group_size=batch_size)
+                    else:
+                        writer.write_batch(batch)
+            output.seek(0)
+            return True, output
+        except Exception as e:
+            output.close()
+            return False, f"{fmt}エクスポートエラー: {str(e)}"
+
+    @staticmethod
+    def process_inventory_parquet(file_path: str, dealer: str = "", batch_size: int = DEFAULT_BATCH_SIZE):
+        """在庫 Parquet を CSV 取込と同じ照合処理で反映する（行グループ単位で読み込む）"""
+        try:
+            parquet_file = pq.ParquetFile(file_path)
+        except Exception as e:
+            return False, f"Parquetファイルを読み込めませんでした: {str(e)}"
+        columns = parquet_file.schema_arrow.names
+        frames = (batch.to_pandas() for batch in parquet_file.iter_batches(batch_size=batch_size))
+        return CSVService.import_inventory_frames(columns, frames, dealer, source="parquet")
@@ -0,0 +1,179 @@
+"""商品の一括パッチ（/api/products/bulk-patch）。
+
+対象は商品 ID の集合か絞り込み条件で指定し、同じ値の組（patch）をまとめて書き込む。
+    ID 指定    _BATCH_SIZE 件ずつの IN で UPDATE する（SQLite の変数上限・PostgreSQL の長い IN を避ける）
+    条件指定   条件をそのまま WHERE にした 1 文で UPDATE する
+ただし商品の書き込みフック（変更ログ・在庫不足アラートなど）が、実行前に条件に合う商品 ID を
+読み込み、変更ログには商品ごとに 1 行書くため、条件指定でも対象件数に比例した処理は残る。
+システム管理用ダミー商品は対象にしない。コミットは呼び出し側。
+"""
+from __future__ import annotations
+
+import math
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence
+
+from sqlalchemy import update
+
+from app import db
+from app.models.inventory import Product
+from app.services.inventory_page_service import visible_product_filter
+from app.services.reorder_service import mark_manual_min_quantity
+
+_BATCH_SIZE = 500
+
+# 一括で書き換えられる列（商品名は別名の記録が要るため個別更新のみ）
+PATCHABLE_FIELDS = ('category', 'dealer', 'manufacturer', 'unit_price', 'min_quantity', 'current_stock')
+# 絞り込みに使える列（値の一致。None は未設定、リストはいずれか）
+FILTER_FIELDS = ('category', 'dealer', 'manufacturer')
+
+
+def _optional_text(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value[:100] or None
+
+
+def _number(value: Any, label: str, cast):
+    # JSON の true/false は数値として扱わない（int(True) == 1 になるため）
+    if isinstance(value, bool):
+        raise ValueError(f'{label}は数値で入力してください')
+    try:
+        number = cast(value)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError(f'{label}は数値で入力してください')
+    if not math.isfinite(number):
+        raise ValueError(f'{label}は数値で入力してください')
+    if number < 0:
+        raise ValueError(f'{label}は0以上で入力してください')
+    return number
+
+
+def parse_patch(patch: Any) -> Dict[str, Any]:
+    """patch を検証して列 -> 値にする。
+
+    Raises:
+        ValueError: 未対応の列や不正な値がある場合
+    """
+    if not isinstance(patch, dict) or not patch:
+        raise ValueError('patch を指定してください')
+    unknown = set(patch) - set(PATCHABLE_FIELDS)
+    if unknown:
+        raise ValueError(f'一括更新できない項目です: {", ".join(sorted(unknown))}')
+
+    values: Dict[str, Any] = {}
+    for field in ('category', 'dealer'):
+        if field in patch:
+            values[field] = _optional_text(patch[field])
+    if 'manufacturer' in patch:
+        manufacturer = _optional_text(patch['manufacturer'])
+        if manufacturer is None:
+            raise ValueError('メーカーは必須です')
+        values['manufacturer'] = manufacturer
+    if 'unit_price' in patch:
+        values['unit_price'] = _number(patch['unit_price'], '単価', float)
+    for field, label in (('min_quantity', '最低必要数'), ('current_stock', '在庫数')):
+        if field in patch:
+            values[field] = _number(patch[field], label, int)
+    return values
+
+
+def build_filter(spec: Any):
+    """絞り込み条件（JSON）を WHERE 句にする。
+
+    {"dealer": "A", "category": null, "manufacturer": ["M1", "M2"],
+     "search": "文字列", "low_stock": true}
+    全商品を対象にする場合は {"all": true} を明示する。
+
+    Raises:
+        ValueError: 未対応の条件や空の条件の場合
+    """
+    if not isinstance(spec, dict):
+        raise ValueError('filter の形式が不正です')
+    unknown = set(spec) - set(FILTER_FIELDS) - {'search', 'low_stock', 'all'}
+    if unknown:
+        raise ValueError(f'未対応の絞り込み条件です: {", ".join(sorted(unknown))}')
+
+    conditions = [visible_product_filter()]
+    for field in FILTER_FIELDS:
+        if field not in spec:
+            continue
+        column = getattr(Product, field)
+        value = spec[field]
+        if value is None:
+            conditions.append(column.is_(None))
+        elif isinstance(value, list):
+            conditions.append(column.in_([str(v) for v in value]))
+        else:
+            conditions.append(column == str(value))
+    search = str(spec.get('search') or '').strip()
+    if search:
+        conditions.append(db.or_(
+            Product.product_name.contains(search),
+            Product.manufacturer.contains(search),
+            Product.category.contains(search),
+        ))
+    if spec.get('low_stock'):
+        conditions.append(Product.current_stock < Product.min_quantity)
+    if len(conditions) == 1 and not spec.get('all'):
+        raise ValueError('絞り込み条件が空です（全商品が対象の場合は "all": true を指定してください）')
+    return db.and_(*conditions)
+
+
+def _apply(where, values: Dict[str, Any]) -> int:
+    if 'min_quantity' in values:
+        # 手入力した最低必要数は発注点の自動計算で上書きしない（更新前に対象を確定する）
+        mark_manual_min_quantity(where)
+    result = db.session.execute(
+        update(Product).where(where).values(dict(values, updated_at=datetime.utcnow())),
+        execution_options={'synchronize_session': False},
+    )
+    return result.rowcount or 0
+
+
+def _clean_ids(product_ids: Any) -> List[int]:
+    # 文字列を渡すと 1 文字ずつの ID になるため、リスト・タプル以外は受け付けない
+    if not isinstance(product_ids, (list, tuple)):
+        raise ValueError('商品IDの形式が不正です')
+    ids = set()
+    for pid in product_ids:
+        # 画面のチェックボックスは数字の文字列で送る。true/false や小数は ID として扱わない
+        if isinstance(pid, bool) or not isinstance(pid, (int, str)):
+            raise ValueError('商品IDの形式が不正です')
+        try:
+            ids.add(int(pid))
+        except ValueError:
+            raise ValueError('商品IDの形式が不正です')
+    return sorted(ids)
+
+
+def patch_products(
+    patch: Any,
+    product_ids: Optional[Sequence[Any]] = None,
+    filter_spec: Any = None,
+) -> Dict[str, int]:
+    """商品 ID（product_ids）か絞り込み条件（filter_spec）の対象に patch を書き込む。
+
+    Returns:
+        {'updated': 更新した商品数, 'requested': 指定された ID の数（ID 指定のみ）, 'batches': 実行した UPDATE の数}
+    Raises:
+        ValueError: patch・対象の指定が不正な場合
+    """
+    values = parse_patch(patch)
+    if (product_ids is None) == (filter_spec is None):
+        raise ValueError('product_ids と filter のどちらか一方を指定してください')
+
+    if filter_spec is not None:
+        return {'updated': _apply(build_filter(filter_spec), values), 'batches': 1}
+
+    ids = _clean_ids(product_ids)
+    if not ids:
+        raise ValueError('商品が選択されていません')
+    updated = 0
+    batches = 0
+    visible = visible_product_filter()
+    for i in range(0, len(ids), _BATCH_SIZE):
+        updated += _apply(db.and_(Product.id.in_(ids[i:i + _BATCH_SIZE]), visible), values)
+        batches += 1
+    return {'updated': updated, 'requested': len(ids), 'batches': batches}
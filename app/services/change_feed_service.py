@@ -0,0 +1,217 @@
+"""商品の変更フィード（Server-Sent Events）。
+
+商品の書き込み（在庫調整・取込・統合・削除など）を product_write_hooks で検知して ProductChange に記録し、
+/api/products/stream で接続中のクライアントへ差分（変更後の商品・削除された ID）を送る。
+クライアントは初回だけ一覧を全件取得し、以降は差分で表を更新する。
+
+ログは DB に置くため、Gunicorn の複数ワーカーのどれに接続しても同じ変更を受け取れる。
+環境変数（いずれも任意）:
+    CHANGE_FEED_POLL_SECONDS       変更ログを確認する間隔（秒）
+    CHANGE_FEED_MAX_SECONDS        1 接続の最大時間（秒）。超えたら切断し、ブラウザが Last-Event-ID 付きで再接続する
+    CHANGE_FEED_MAX_STREAMS        プロセスあたりの同時接続数の上限（gthread ではスレッドを占有するため）
+    CHANGE_FEED_RETENTION_HOURS    変更ログの保持時間
+"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set
+
+from sqlalchemy import delete, func, insert, select
+
+from app import db
+from app.models.inventory import Product, ProductChange, StockAlert
+from app.services.product_write_hooks import add_product_write_listener
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+POLL_SECONDS = max(_env_float("CHANGE_FEED_POLL_SECONDS", 2.0), 0.2)
+MAX_STREAM_SECONDS = max(_env_float("CHANGE_FEED_MAX_SECONDS", 300), 5)
+HEARTBEAT_SECONDS = 15.0
+RETENTION = timedelta(hours=max(_env_float("CHANGE_FEED_RETENTION_HOURS", 24), 1))
+# 既定はワーカーのスレッド数の半分（残りのスレッドで通常のリクエストを処理する）
+MAX_STREAMS = max(int(_env_float(
+    "CHANGE_FEED_MAX_STREAMS", max(int(_env_float("GUNICORN_THREADS", 4)) // 2, 1)
+)), 0)
+# 再接続までの待ち時間（ブラウザへ retry で指示）
+RETRY_MS = 3000
+
+_BATCH_SIZE = 500
+# 採番順とコミット順が前後した変更を取りこぼさないよう、直近の範囲は毎回読み直す（送信済みは除く）
+_OVERLAP = 200
+_PRUNE_INTERVAL_SECONDS = 600
+
+_CHANGE = ProductChange.__table__
+
+_stream_slots = threading.BoundedSemaphore(MAX_STREAMS) if MAX_STREAMS else None
+_prune_lock = threading.Lock()
+_last_pruned = 0.0
+
+
+def product_to_dict(product: Product) -> Dict[str, Any]:
+    """一覧 API と変更フィードで共通の商品の表現。"""
+    return {
+        'id': product.id,
+        'product_code': product.product_code,
+        'manufacturer': product.manufacturer,
+        'product_name': product.product_name,
+        'unit_price': product.unit_price,
+        'current_stock': product.current_stock,
+        'min_quantity': product.min_quantity,
+        'category': product.category,
+        'dealer': product.dealer,
+    }
+
+
+def _is_system_dummy(product: Product) -> bool:
+    name = product.product_name or ''
+    return product.manufacturer == 'システム' and (
+        name.startswith('取引会社管理用_') or name.startswith('カテゴリ管理用_')
+    )
+
+
+def _on_product_write(conn, changed_ids: Optional[Set[int]], deleted_ids: Set[int]) -> None:
+    now = datetime.utcnow()
+    if changed_ids is None:
+        rows = [{'product_id': None, 'op': 'reset', 'changed_at': now}]
+    else:
+        rows = [{'product_id': pid, 'op': 'upsert', 'changed_at': now} for pid in sorted(changed_ids - deleted_ids)]
+        rows += [{'product_id': pid, 'op': 'delete', 'changed_at': now} for pid in sorted(deleted_ids)]
+    for i in range(0, len(rows), _BATCH_SIZE):
+        conn.execute(insert(_CHANGE), rows[i:i + _BATCH_SIZE])
+
+
+def register_change_feed_hooks() -> None:
+    """商品の書き込みフックに変更ログの記録を登録する（create_app から呼ぶ）。"""
+    add_product_write_listener(_on_product_write)
+
+
+def latest_change_id() -> int:
+    """現在の変更ログの版数（一覧を取得した時点の位置としてクライアントへ渡す）。"""
+    return int(db.session.execute(select(func.max(_CHANGE.c.id))).scalar() or 0)
+
+
+def prune_product_changes(force: bool = False) -> int:
+    """保持時間を過ぎた変更ログを削除する（プロセスごとに一定間隔で 1 回）。コミットまで行う。"""
+    global _last_pruned
+    now = time.monotonic()
+    with _prune_lock:
+        if not force and now - _last_pruned < _PRUNE_INTERVAL_SECONDS:
+            return 0
+        _last_pruned = now
+    # 最新の 1 行は残す（全行を消すと SQLite で ID が 1 から振り直され、版数が巻き戻るため）
+    newest = select(func.max(_CHANGE.c.id)).scalar_subquery()
+    result = db.session.execute(
+        delete(_CHANGE).where(_CHANGE.c.changed_at < datetime.utcnow() - RETENTION, _CHANGE.c.id < newest)
+    )
+    db.session.commit()
+    return result.rowcount or 0
+
+
+def acquire_stream_slot() -> bool:
+    """同時接続数の上限内なら枠を確保する（解放は release_stream_slot）。"""
+    return _stream_slots is not None and _stream_slots.acquire(blocking=False)
+
+
+def release_stream_slot() -> None:
+    if _stream_slots is not None:
+        _stream_slots.release()
+
+
+def build_delta(product_ids: Sequence[int], dealer: str = '') -> Dict[str, Any]:
+    """変更のあった商品の現在の状態から差分を作る（送り直しても結果が変わらないよう、常に最新の値を送る）。
+
+    取引会社で絞り込んでいる場合、他の取引会社へ移った商品は deleted として送る。
+    在庫不足の商品には alert（不足数・緊急度）を付ける。
+    """
+    ids = sorted(set(product_ids))
+    products: Dict[int, Product] = {}
+    alerts: Dict[int, StockAlert] = {}
+    for i in range(0, len(ids), _BATCH_SIZE):
+        chunk = ids[i:i + _BATCH_SIZE]
+        products.update((p.id, p) for p in Product.query.filter(Product.id.in_(chunk)))
+        alerts.update((a.product_id, a) for a in StockAlert.query.filter(StockAlert.product_id.in_(chunk)))
+
+    upserted: List[Dict[str, Any]] = []
+    deleted: List[int] = []
+    for pid in ids:
+        product = products.get(pid)
+        if product is None or _is_system_dummy(product) or (dealer and product.dealer != dealer):
+            deleted.append(pid)
+            continue
+        item = product_to_dict(product)
+        alert = alerts.get(pid)
+        item['alert'] = {'shortage': alert.shortage, 'urgency': alert.urgency} if alert else None
+        upserted.append(item)
+    return {'upserted': upserted, 'deleted': deleted}
+
+
+def _event(name: str, data: Dict[str, Any], event_id: Optional[int] = None) -> str:
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {name}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def stream_product_changes(since: Optional[int], dealer: str = '') -> Iterator[str]:
+    """SSE のイベント列（products: 差分 / reset: 全件の再読み込みが必要）。
+
+    DB 接続は確認のたびに返却し、待機中に接続プールを占有しない。
+    """
+    try:
+        last = latest_change_id() if since is None else since
+        oldest = db.session.execute(select(func.min(_CHANGE.c.id))).scalar()
+        # 接続時点までの変更はクライアントに反映済み
+        seen: Set[int] = set(db.session.execute(
+            select(_CHANGE.c.id).where(_CHANGE.c.id > last - _OVERLAP, _CHANGE.c.id <= last)
+        ).scalars())
+    finally:
+        db.session.close()
+    yield f"retry: {RETRY_MS}\n\n"
+    if since is not None and oldest is not None and since < oldest - 1:
+        # 保持期間を過ぎて差分を作れない
+        yield _event('reset', {'version': last}, last)
+        return
+
+    started = last_sent = time.monotonic()
+    while time.monotonic() - started < MAX_STREAM_SECONDS:
+        floor = max(last - _OVERLAP, 0)
+        try:
+            prune_product_changes()
+            rows = db.session.execute(
+                select(_CHANGE.c.id, _CHANGE.c.product_id, _CHANGE.c.op)
+                .where(_CHANGE.c.id > floor)
+                .order_by(_CHANGE.c.id)
+                .limit(_BATCH_SIZE + _OVERLAP)
+            ).all()
+            fresh = [r for r in rows if r.id not in seen]
+            delta = None
+            reset = any(r.op == 'reset' for r in fresh)
+            if fresh and not reset:
+                delta = build_delta([r.product_id for r in fresh], dealer)
+        finally:
+            db.session.close()
+
+        if fresh:
+            last = max(last, fresh[-1].id)
+            seen.update(r.id for r in fresh)
+            seen = {i for i in seen if i > last - _OVERLAP}
+            if reset:
+                yield _event('reset', {'version': last}, last)
+                return
+            if delta['upserted'] or delta['deleted']:
+                yield _event('products', dict(delta, version=last), last)
+                last_sent = time.monotonic()
+            if len(rows) >= _BATCH_SIZE + _OVERLAP:
+                continue
+        if time.monotonic() - last_sent >= HEARTBEAT_SECONDS:
+            yield ": ping\n\n"
+            last_sent = time.monotonic()
+        time.sleep(POLL_SECONDS)
@@ -1,11 +1,64 @@
-import pandas as pd
-import os
+import csv
+import io
 import time
 from app.models.inventory import Product
 from app import db
 from datetime import datetime
-from app.services.product_matching import find_best_product_match
-from app.services.product_alias_service import load_alias_map, register_import_name, sync_alias_map_entry
+from app.services.product_matching import ProductMatcher
+from app.services.product_alias_service import load_alias_map, register_import_name_with
+
+# CSVエクスポートの列（順序どおりに出力）
+_EXPORT_COLUMNS = ('manufacturer', 'product_name', 'unit_price', 'current_stock', 'min_quantity', 'category', 'dealer')
+_EXPORT_BATCH_SIZE = 1000
+
+# 取引会社別の列マッピング定義
+_DEALER_COLUMN_MAPPINGS = {
+    'トヨタ': {
+        'manufacturer': ['メーカー名', 'manufacturer', 'メーカー'],
+        'product_name': ['商品名', 'product_name', '商品'],
+        'unit_price': ['単価', 'unit_price', '価格', 'サロン価格'],
+        'quantity': ['数量', 'quantity', '個数']
+    },
+    'ホンダ': {
+        'manufacturer': ['メーカー名', 'manufacturer', 'メーカー', 'ブランド'],
+        'product_name': ['商品名', 'product_name', '商品', '品名'],
+        'unit_price': ['単価', 'unit_price', '価格', '販売価格'],
+        'quantity': ['数量', 'quantity', '個数', '入荷数']
+    },
+    '日産': {
+        'manufacturer': ['メーカー名', 'manufacturer', 'メーカー', 'メーカーコード'],
+        'product_name': ['商品名', 'product_name', '商品', '品名', 'JANコード'],
+        'unit_price': ['単価', 'unit_price', '価格', '希望小売価格'],
+        'quantity': ['数量', 'quantity', '個数', '入荷数']
+    },
+    'マツダ': {
+        'manufacturer': ['メーカー名', 'manufacturer', 'メーカー', 'ブランド'],
+        'product_name': ['商品名', 'product_name', '商品', '品名'],
+        'unit_price': ['単価', 'unit_price', '価格', 'サロン価格'],
+        'quantity': ['数量', 'quantity', '個数', '入荷数']
+    },
+    'GAMO': {
+        'manufacturer': ['メーカー名', 'manufacturer', 'メーカー', 'ブランド'],
+        'product_name': ['商品名', 'product_name', '商品', '品名'],
+        'unit_price': ['サロン価（税抜）', 'サロン価格', '単価', 'unit_price', '価格'],
+        'quantity': ['数量', 'quantity', '個数', '入荷数']
+    },
+    'BEAUTY GARAGE': {
+        'manufacturer': ['メーカー名', 'manufacturer', 'メーカー', 'ブランド'],
+        'product_name': ['商品名', 'product_name', '商品', '品名'],
+        'unit_price': ['サロン価（税抜）', 'サロン価格', '単価', 'unit_price', '価格'],
+        'quantity': ['数量', 'quantity', '個数', '入荷数']
+    },
+}
+
+# 汎用マッピング（上記に該当しない場合）
+_DEFAULT_COLUMN_MAPPING = {
+    'manufacturer': ['メーカー名', 'manufacturer', 'メーカー', 'ブランド', 'メーカーコード'],
+    'product_name': ['商品名', 'product_name', '商品', '品名', 'JANコード'],
+    'unit_price': ['サロン価（税抜）', 'サロン価格', '単価', 'unit_price', '価格', 'メーカー希望小売価格', '販売価格'],
+    'quantity': ['数量', 'quantity', '個数', '入荷数']
+}
+
 
 class CSVService:
     @staticmethod
@@ -13,7 +66,9 @@ class CSVService:
         """在庫CSVファイルを処理してデータベースに保存（取引会社別対応）"""
         try:
             # CSVファイルを読み込み（エンコーディング自動検出とフォールバック）
+            # pandas は起動を重くするため使うときに読み込む
             import chardet
+            import pandas as pd
             with open(file_path, 'rb') as f:
                 raw_data = f.read()
                 detected_encoding = chardet.detect(raw_data)['encoding']
@@ -40,127 +95,100 @@ class CSVService:
             if df is None:
                 return False, "CSVファイルのエンコーディングが判別できませんでした"
             
-            # 取引会社別の列マッピング定義
-            dealer_mappings = {
-                'トヨタ': {
-                    'manufacturer': ['メーカー名', 'manufacturer', 'メーカー'],
-                    'product_name': ['商品名', 'product_name', '商品'],
-                    'unit_price': ['単価', 'unit_price', '価格', 'サロン価格'],
-                    'quantity': ['数量', 'quantity', '個数']
-                },
-                'ホンダ': {
-                    'manufacturer': ['メーカー名', 'manufacturer', 'メーカー', 'ブランド'],
-                    'product_name': ['商品名', 'product_name', '商品', '品名'],
-                    'unit_price': ['単価', 'unit_price', '価格', '販売価格'],
-                    'quantity': ['数量', 'quantity', '個数', '入荷数']
-                },
-                '日産': {
-                    'manufacturer': ['メーカー名', 'manufacturer', 'メーカー', 'メーカーコード'],
-                    'product_name': ['商品名', 'product_name', '商品', '品名', 'JANコード'],
-                    'unit_price': ['単価', 'unit_price', '価格', '希望小売価格'],
-                    'quantity': ['数量', 'quantity', '個数', '入荷数']
-                },
-                'マツダ': {
-                    'manufacturer': ['メーカー名', 'manufacturer', 'メーカー', 'ブランド'],
-                    'product_name': ['商品名', 'product_name', '商品', '品名'],
-                    'unit_price': ['単価', 'unit_price', '価格', 'サロン価格'],
-                    'quantity': ['数量', 'quantity', '個数', '入荷数']
-                },
-                'GAMO': {
-                    'manufacturer': ['メーカー名', 'manufacturer', 'メーカー', 'ブランド'],
-                    'product_name': ['商品名', 'product_name', '商品', '品名'],
-                    'unit_price': ['サロン価（税抜）', 'サロン価格', '単価', 'unit_price', '価格'],
-                    'quantity': ['数量', 'quantity', '個数', '入荷数']
-                },
-                'BEAUTY GARAGE': {
-                    'manufacturer': ['メーカー名', 'manufacturer', 'メーカー', 'ブランド'],
-                    'product_name': ['商品名', 'product_name', '商品', '品名'],
-                    'unit_price': ['サロン価（税抜）', 'サロン価格', '単価', 'unit_price', '価格'],
-                    'quantity': ['数量', 'quantity', '個数', '入荷数']
-                },
-            }
-            
-            # 汎用マッピング（上記に該当しない場合）
-            default_mapping = {
-                'manufacturer': ['メーカー名', 'manufacturer', 'メーカー', 'ブランド', 'メーカーコード'],
-                'product_name': ['商品名', 'product_name', '商品', '品名', 'JANコード'],
-                'unit_price': ['サロン価（税抜）', 'サロン価格', '単価', 'unit_price', '価格', 'メーカー希望小売価格', '販売価格'],
-                'quantity': ['数量', 'quantity', '個数', '入荷数']
-            }
+            return CSVService.import_inventory_frames(list(df.columns), [df], dealer)
             
+        except Exception as e:
+            db.session.rollback()
+            return False, f"エラーが発生しました: {str(e)}"
+    
+    @staticmethod
+    def import_inventory_frames(columns, frames, dealer='', source='csv'):
+        """在庫データ（DataFrame の列挙）を照合してデータベースに保存
+
+        CSV / Parquet 取込の共通処理。frames は同じ列構成の DataFrame を順に返すもの
+        （Parquet はバッチ単位で読み込むため、全行を一度にメモリへ載せない）。
+        """
+        try:
             # 取引会社に応じたマッピングを選択
-            mapping = dealer_mappings.get(dealer, default_mapping)
+            mapping = _DEALER_COLUMN_MAPPINGS.get(dealer, _DEFAULT_COLUMN_MAPPING)
             
             # 実際の列名を特定
             actual_columns = {}
             for target, possible_names in mapping.items():
                 found = False
                 for col_name in possible_names:
-                    if col_name in df.columns:
+                    if col_name in columns:
                         actual_columns[target] = col_name
                         found = True
                         break
                 if not found:
-                    return False, f"必要な列 '{target}' が見つかりません。利用可能な列: {list(df.columns)}"
+                    return False, f"必要な列 '{target}' が見つかりません。利用可能な列: {list(columns)}"
             
             # 全取引会社の商品を候補にし、同一商品を別会社から仕入れても名前が一致すれば在庫加算。
             # アップロードで選んだ取引会社は、同類似度のとき在庫を紐づける行の優先に使う。
+            # 照合用の名称索引・エイリアス・商品コードは最初に 1 回だけ読み込み、行ごとには DB を読まない。
             working_products = list(Product.query.all())
-            alias_map = load_alias_map(working_products)
+            matcher = ProductMatcher(working_products, load_alias_map(working_products), preferred_dealer=dealer)
+            product_codes = {p.product_code for p in working_products}
             processed_count = 0
             updated_count = 0
             added_count = 0
             ambiguous_count = 0
             
-            for _, row in df.iterrows():
-                manufacturer = str(row[actual_columns['manufacturer']]).strip()
-                product_name = str(row[actual_columns['product_name']]).strip()
-                unit_price = float(row[actual_columns['unit_price']])
-                quantity = int(row[actual_columns['quantity']]) if pd.notna(row[actual_columns['quantity']]) else 0
-                
-                match, _score, reason = find_best_product_match(
-                    product_name,
-                    working_products,
-                    preferred_dealer=dealer,
-                    alias_map=alias_map,
+            for df in frames:
+                # 行ごとの Series を作らないよう、列をリストにしてから回す
+                quantities = df[actual_columns['quantity']]
+                rows = zip(
+                    df[actual_columns['manufacturer']].tolist(),
+                    df[actual_columns['product_name']].tolist(),
+                    df[actual_columns['unit_price']].tolist(),
+                    quantities.tolist(),
+                    quantities.notna().tolist(),
                 )
-                if reason == "ambiguous":
-                    ambiguous_count += 1
-                    processed_count += 1
-                    continue
-                if match is not None:
-                    match.current_stock += quantity
-                    match.updated_at = datetime.utcnow()
-                    register_import_name(match, product_name, "csv")
-                    sync_alias_map_entry(alias_map, match)
-                    updated_count += 1
-                else:
-                    timestamp = int(time.time() * 1000) % 100000
-                    manufacturer_prefix = manufacturer[:3].upper()
-                    product_code = f"{manufacturer_prefix}_{timestamp:05d}"
-                    
-                    while Product.query.filter_by(product_code=product_code).first():
-                        timestamp += 1
+                for raw_manufacturer, raw_name, raw_price, raw_quantity, has_quantity in rows:
+                    manufacturer = str(raw_manufacturer).strip()
+                    product_name = str(raw_name).strip()
+                    unit_price = float(raw_price)
+                    quantity = int(raw_quantity) if has_quantity else 0
+                
+                    match, _score, reason = matcher.match(product_name)
+                    if reason == "ambiguous":
+                        ambiguous_count += 1
+                        processed_count += 1
+                        continue
+                    if match is not None:
+                        match.current_stock += quantity
+                        match.updated_at = datetime.utcnow()
+                        register_import_name_with(matcher, match, product_name, source)
+                        updated_count += 1
+                    else:
+                        timestamp = int(time.time() * 1000) % 100000
+                        manufacturer_prefix = manufacturer[:3].upper()
                         product_code = f"{manufacturer_prefix}_{timestamp:05d}"
                     
-                    new_product = Product(
-                        product_code=product_code,
-                        manufacturer=manufacturer,
-                        product_name=product_name,
-                        unit_price=unit_price,
-                        current_stock=quantity,
-                        dealer=dealer if dealer else None,
-                        min_quantity=5,
-                        category=None,
-                    )
-                    db.session.add(new_product)
-                    db.session.flush()
-                    register_import_name(new_product, product_name, "csv")
-                    sync_alias_map_entry(alias_map, new_product)
-                    working_products.append(new_product)
-                    added_count += 1
+                        while product_code in product_codes:
+                            timestamp += 1
+                            product_code = f"{manufacturer_prefix}_{timestamp:05d}"
+                        product_codes.add(product_code)
+                    
+                        new_product = Product(
+                            product_code=product_code,
+                            manufacturer=manufacturer,
+                            product_name=product_name,
+                            unit_price=unit_price,
+                            current_stock=quantity,
+                            dealer=dealer if dealer else None,
+                            min_quantity=5,
+                            category=None,
+                        )
+                        db.session.add(new_product)
+                        matcher.add_product(new_product)
+                        register_import_name_with(matcher, new_product, product_name, source)
+                        added_count += 1
                 
-                processed_count += 1
+                    processed_count += 1
+                # バッチごとに書き込み、保留中の行を溜めない
+                db.session.flush()
             
             db.session.commit()
             message = f"{processed_count}件の商品を処理しました（取引会社: {dealer or '未指定'}）"
@@ -180,33 +208,32 @@ class CSVService:
             return False, f"エラーが発生しました: {str(e)}"
     
     @staticmethod
-    def export_inventory_csv(dealer=''):
-        """在庫データをCSV形式でエクスポート（取引会社別）"""
-        try:
-            query = Product.query
-            if dealer:
-                query = query.filter(Product.dealer == dealer)
-            
-            products = query.all()
-            
-            data = []
-            for product in products:
-                data.append({
-                    'manufacturer': product.manufacturer,
-                    'product_name': product.product_name,
-                    'unit_price': product.unit_price,
-                    'current_stock': product.current_stock,
-                    'min_quantity': product.min_quantity,
-                    'category': product.category,
-                    'dealer': product.dealer
-                })
-            
-            df = pd.DataFrame(data)
-            dealer_suffix = f"_{dealer}" if dealer else ""
-            export_path = os.path.join('reports', f'inventory_export{dealer_suffix}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv')
-            df.to_csv(export_path, index=False, encoding='utf-8-sig')
-            
-            return True, export_path
-            
-        except Exception as e:
-            return False, f"エクスポートエラー: {str(e)}"
+    def iter_inventory_csv(dealer='', batch_size=_EXPORT_BATCH_SIZE):
+        """在庫データをCSV（UTF-8 BOM付き）として少しずつ生成する（取引会社別）
+
+        全件をメモリに載せたりファイルに書き出したりせず、yield_per で読みながら
+        batch_size 行ごとにエンコード済みバイト列を返す。
+        """
+        query = db.session.query(*(getattr(Product, c) for c in _EXPORT_COLUMNS))
+        if dealer:
+            query = query.filter(Product.dealer == dealer)
+        query = query.order_by(Product.id).execution_options(yield_per=batch_size)
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        writer.writerow(_EXPORT_COLUMNS)
+        yield buffer.getvalue().encode('utf-8-sig')
+        buffer.seek(0)
+        buffer.truncate()
+
+        pending = 0
+        for row in query:
+            writer.writerow(row)
+            pending += 1
+            if pending >= batch_size:
+                yield buffer.getvalue().encode('utf-8')
+                buffer.seek(0)
+                buffer.truncate()
+                pending = 0
+        if pending:
+            yield buffer.getvalue().encode('utf-8')
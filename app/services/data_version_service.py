@@ -0,0 +1,107 @@
+"""Product 書き込みごとに加算されるデータ版数（レポートキャッシュのキーに使う）。
+
+加算は書き込みのトランザクションの中では行わず、コミット後に別の短いトランザクションで 1 回だけ行う
+（共有の 1 行をコミットまでロックすると、PostgreSQL で商品の書き込みがすべて直列になるため）。
+コミットから加算までの間に読んだ版数は古いが、その間に作ったキャッシュは新しいデータを古い版数で
+持つだけで、加算後は使われない。
+"""
+from __future__ import annotations
+
+import logging
+
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.exc import SQLAlchemyError
+
+from app import db
+from app.models.inventory import DataVersion, Product
+
+PRODUCT_VERSION = "product"
+
+_SESSION_FLAG = "data_version_pending"
+
+logger = logging.getLogger(__name__)
+
+
+def get_data_version(name: str = PRODUCT_VERSION) -> int:
+    """現在の版数（未作成なら 0）。"""
+    try:
+        value = db.session.execute(
+            select(DataVersion.version).where(DataVersion.name == name)
+        ).scalar()
+    except SQLAlchemyError:
+        db.session.rollback()
+        return 0
+    return int(value or 0)
+
+
+def ensure_data_version_rows() -> None:
+    """起動時に版数の行を用意する（初回の書き込みで INSERT が競合しないように）。"""
+    if db.session.get(DataVersion, PRODUCT_VERSION) is None:
+        db.session.add(DataVersion(name=PRODUCT_VERSION, version=0))
+        db.session.commit()
+
+
+def _bump(session, name: str = PRODUCT_VERSION) -> None:
+    """コミット後に加算する版数として印を付ける（ここでは SQL を発行しない）。"""
+    session.info.setdefault(_SESSION_FLAG, set()).add(name)
+
+
+def _after_commit(session) -> None:
+    names = session.info.pop(_SESSION_FLAG, None)
+    if not names:
+        return
+    table = DataVersion.__table__
+    try:
+        # セッションの接続とは別の接続で、版数の更新だけをすぐにコミットする
+        with db.engine.begin() as conn:
+            for name in sorted(names):
+                result = conn.execute(
+                    update(table)
+                    .where(table.c.name == name)
+                    .values(version=table.c.version + 1)
+                )
+                if result.rowcount == 0:
+                    conn.execute(insert(table).values(name=name, version=1))
+    except SQLAlchemyError as e:
+        # 加算に失敗してもコミット済みの書き込みは取り消さない（キャッシュは次の書き込みで更新される）
+        logger.warning("データ版数の加算に失敗: %s", e)
+
+
+def _touches_product(objects) -> bool:
+    return any(isinstance(obj, Product) for obj in objects)
+
+
+def _after_flush(session, flush_context) -> None:
+    if (
+        _touches_product(session.new)
+        or _touches_product(session.dirty)
+        or _touches_product(session.deleted)
+    ):
+        _bump(session)
+
+
+def _do_orm_execute(orm_execute_state) -> None:
+    # Query.update() / delete() などの一括文は flush を通らないためここで検知する
+    if not (
+        orm_execute_state.is_update
+        or orm_execute_state.is_delete
+        or orm_execute_state.is_insert
+    ):
+        return
+    if any(m.class_ is Product for m in orm_execute_state.all_mappers):
+        _bump(orm_execute_state.session)
+
+
+def _reset(session, *args) -> None:
+    session.info.pop(_SESSION_FLAG, None)
+
+
+def register_data_version_hooks() -> None:
+    """db.session にイベントを登録（create_app から 1 回だけ呼ぶ）。"""
+    session = db.session
+    if event.contains(session, "after_flush", _after_flush):
+        return
+    event.listen(session, "after_flush", _after_flush)
+    event.listen(session, "do_orm_execute", _do_orm_execute)
+    event.listen(session, "after_commit", _after_commit)
+    event.listen(session, "after_rollback", _reset)
@@ -0,0 +1,166 @@
+"""DB エンジンの接続プール設定と、プールの利用状況（メトリクス）。
+
+環境変数で設定する（いずれも任意）:
+    DB_POOL_SIZE / DB_MAX_OVERFLOW / DB_POOL_TIMEOUT   プールの大きさ・待ち時間（秒）
+    DB_POOL_RECYCLE                                    接続を作り直すまでの秒数（アイドル切断対策）
+    DB_POOL_PRE_PING                                   取り出し時に接続を確認（0 で無効）
+    DB_STATEMENT_TIMEOUT_MS                            PostgreSQL の statement_timeout（0 で無効）
+    DB_CONNECT_TIMEOUT                                 接続タイムアウト（秒）
+    DB_PGBOUNCER                                       1 なら PgBouncer（トランザクションプーリング）向け設定
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from typing import Any, Dict
+
+from sqlalchemy import event
+from sqlalchemy.pool import NullPool
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def _env_flag(name: str, default: bool) -> bool:
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() not in ("0", "false", "no", "off", "")
+
+
+def pgbouncer_mode() -> bool:
+    return _env_flag("DB_PGBOUNCER", False)
+
+
+def statement_timeout_ms() -> int:
+    return max(_env_int("DB_STATEMENT_TIMEOUT_MS", 30000), 0)
+
+
+def engine_options(database_url: str) -> Dict[str, Any]:
+    """SQLALCHEMY_ENGINE_OPTIONS に渡すエンジン設定を作る。"""
+    if database_url.startswith("sqlite"):
+        # SQLite はファイルロックで直列化されるためプールの調整はしない
+        return {"pool_pre_ping": _env_flag("DB_POOL_PRE_PING", True)}
+
+    options: Dict[str, Any] = {"pool_pre_ping": _env_flag("DB_POOL_PRE_PING", True)}
+    connect_args: Dict[str, Any] = {}
+    is_postgres = database_url.startswith("postgresql")
+
+    if pgbouncer_mode():
+        # 接続の使い回しは PgBouncer に任せ、アプリ側ではプールしない
+        options["poolclass"] = NullPool
+    else:
+        options.update(
+            pool_size=max(_env_int("DB_POOL_SIZE", 5), 1),
+            max_overflow=max(_env_int("DB_MAX_OVERFLOW", 10), 0),
+            pool_timeout=max(_env_int("DB_POOL_TIMEOUT", 30), 1),
+            pool_recycle=_env_int("DB_POOL_RECYCLE", 1800),
+        )
+
+    if is_postgres:
+        connect_args["connect_timeout"] = max(_env_int("DB_CONNECT_TIMEOUT", 10), 1)
+        # アイドル中に経路上で切断された接続を早めに検知する
+        connect_args.update(keepalives=1, keepalives_idle=30, keepalives_interval=10, keepalives_count=3)
+        timeout = statement_timeout_ms()
+        if timeout and not pgbouncer_mode():
+            # PgBouncer は起動パラメータの options を受け付けないため、その場合はトランザクションごとに設定する
+            connect_args["options"] = f"-c statement_timeout={timeout}"
+    if connect_args:
+        options["connect_args"] = connect_args
+    return options
+
+
+class PoolMetrics:
+    """接続プールのイベント数を数える（プロセスごと）。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.invalidations = 0
+        self.soft_invalidations = 0
+        self.started_at = time.time()
+
+    def _inc(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "connects": self.connects,
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "invalidations": self.invalidations,
+                "soft_invalidations": self.soft_invalidations,
+                "uptime_seconds": round(time.time() - self.started_at, 1),
+            }
+
+
+pool_metrics = PoolMetrics()
+
+
+def register_pool_hooks(engine) -> None:
+    """エンジンにプールのイベントと（PgBouncer 時の）statement_timeout 設定を登録する。"""
+    if event.contains(engine, "connect", _on_connect):
+        return
+    event.listen(engine, "connect", _on_connect)
+    event.listen(engine, "checkout", _on_checkout)
+    event.listen(engine, "checkin", _on_checkin)
+    event.listen(engine, "invalidate", _on_invalidate)
+    event.listen(engine, "soft_invalidate", _on_soft_invalidate)
+    if engine.dialect.name == "postgresql" and pgbouncer_mode() and statement_timeout_ms():
+        event.listen(engine, "begin", _set_local_statement_timeout)
+
+
+def _on_connect(dbapi_connection, connection_record) -> None:
+    pool_metrics._inc("connects")
+
+
+def _on_checkout(dbapi_connection, connection_record, connection_proxy) -> None:
+    pool_metrics._inc("checkouts")
+
+
+def _on_checkin(dbapi_connection, connection_record) -> None:
+    pool_metrics._inc("checkins")
+
+
+def _on_invalidate(dbapi_connection, connection_record, exception) -> None:
+    pool_metrics._inc("invalidations")
+
+
+def _on_soft_invalidate(dbapi_connection, connection_record, exception) -> None:
+    pool_metrics._inc("soft_invalidations")
+
+
+def _set_local_statement_timeout(conn) -> None:
+    # SET LOCAL はトランザクション終了で元に戻るため、PgBouncer で接続を共有しても他へ漏れない
+    conn.exec_driver_sql(f"SET LOCAL statement_timeout = {int(statement_timeout_ms())}")
+
+
+def pool_status(engine) -> Dict[str, Any]:
+    """現在のプールの状態とイベント数。"""
+    pool = engine.pool
+    status: Dict[str, Any] = {
+        "pid": os.getpid(),
+        "dialect": engine.dialect.name,
+        "pool_class": type(pool).__name__,
+        "pgbouncer_mode": pgbouncer_mode() and engine.dialect.name == "postgresql",
+        "description": pool.status(),
+    }
+    # QueuePool のみが持つ値
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        method = getattr(pool, name, None)
+        if callable(method):
+            status[name] = method()
+    timeout = getattr(pool, "timeout", None)
+    if callable(timeout):
+        status["timeout"] = timeout()
+    status["events"] = pool_metrics.snapshot()
+    return status
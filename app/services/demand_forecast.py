@@ -0,0 +1,243 @@
+"""週次バケットからの需要予測（全商品をまとめて NumPy で計算）。
+
+- 需要が毎週ある商品: 単純指数平滑法（SES）
+- 需要が間欠的な商品: Croston 法（SBA 補正）
+平滑化係数は商品ごとに候補から 1 期先予測誤差の二乗和が最小のものを選ぶ。
+予測区間は 1 期先誤差の標準偏差から求め、再発注日は予測需要と現在庫から計算する。
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+from app import db
+from app.models.inventory import Product, ProductWeeklyDemand
+from app.services.order_feature_store import week_start_of
+
+# 予測に使う過去の週数
+DEFAULT_HISTORY_WEEKS = 52
+# 予測期間（週）。従来の「30 日後」に相当
+DEFAULT_HORIZON_WEEKS = 4
+# 平滑化係数の候補
+DEFAULT_ALPHAS = (0.05, 0.1, 0.2, 0.3, 0.5)
+# 需要が無い週の割合がこれ以上なら間欠需要として Croston 法を使う
+INTERMITTENT_ZERO_SHARE = 0.3
+# 予測に必要な最小の需要発生週数
+MIN_DEMAND_WEEKS = 3
+# 80% 予測区間
+INTERVAL_Z = 1.2816
+
+METHOD_SES = "ses"
+METHOD_CROSTON = "croston"
+
+
+@dataclass
+class DemandForecastModel:
+    """全商品分の当てはめ結果（取引会社ごとに保存し、予測時は配列から引く）。"""
+
+    product_ids: np.ndarray
+    weekly_rate: np.ndarray
+    weekly_sigma: np.ndarray
+    wape: np.ndarray
+    alpha: np.ndarray
+    intermittent: np.ndarray
+    fitted_at: datetime = field(default_factory=datetime.utcnow)
+
+    def __len__(self) -> int:
+        return len(self.product_ids)
+
+    @classmethod
+    def concat(cls, models: Iterable["DemandForecastModel"]) -> "DemandForecastModel":
+        """商品を分割して当てはめた結果を 1 つにまとめる（product_id 順を保つ）。"""
+        models = [m for m in models if len(m)]
+        if not models:
+            return fit_demand_forecast(np.empty(0, dtype=np.int64), np.empty((0, 1)))
+        merged = cls(
+            product_ids=np.concatenate([m.product_ids for m in models]),
+            weekly_rate=np.concatenate([m.weekly_rate for m in models]),
+            weekly_sigma=np.concatenate([m.weekly_sigma for m in models]),
+            wape=np.concatenate([m.wape for m in models]),
+            alpha=np.concatenate([m.alpha for m in models]),
+            intermittent=np.concatenate([m.intermittent for m in models]),
+        )
+        order = np.argsort(merged.product_ids, kind="stable")
+        if np.any(order != np.arange(len(order))):
+            for name in ("product_ids", "weekly_rate", "weekly_sigma", "wape", "alpha", "intermittent"):
+                setattr(merged, name, getattr(merged, name)[order])
+        return merged
+
+    def index_of(self, product_ids: Iterable[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """product_id -> 行位置。戻り値は (見つかったかのマスク, 位置)。"""
+        ids = np.asarray(list(product_ids), dtype=np.int64)
+        if len(self.product_ids) == 0:
+            return np.zeros(len(ids), dtype=bool), np.zeros(len(ids), dtype=np.int64)
+        pos = np.clip(np.searchsorted(self.product_ids, ids), 0, len(self.product_ids) - 1)
+        return self.product_ids[pos] == ids, pos
+
+    def forecast(
+        self,
+        product_ids: Iterable[int],
+        current_stock: Iterable[float],
+        min_quantity: Iterable[float],
+        horizon_weeks: int = DEFAULT_HORIZON_WEEKS,
+        today: Optional[date] = None,
+    ) -> Dict[int, dict]:
+        """予測需要（期間合計）・予測区間・信頼度・次回発注日を商品ごとに返す。"""
+        ids = np.asarray(list(product_ids), dtype=np.int64)
+        stock = np.asarray(list(current_stock), dtype=float)
+        min_qty = np.asarray(list(min_quantity), dtype=float)
+        found, pos = self.index_of(ids)
+        if not found.any():
+            return {}
+        ids, stock, min_qty, pos = ids[found], stock[found], min_qty[found], pos[found]
+
+        rate = self.weekly_rate[pos]
+        sigma = self.weekly_sigma[pos]
+        demand = rate * horizon_weeks
+        spread = INTERVAL_Z * sigma * np.sqrt(horizon_weeks)
+        lower = np.maximum(demand - spread, 0.0)
+        upper = demand + spread
+        confidence = np.clip(1.0 - self.wape[pos], 0.0, 1.0)
+
+        # 現在庫が最低必要数まで減る日（需要が無ければ予測期間の終わり）
+        daily_rate = rate / 7.0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            days_left = np.where(daily_rate > 0, (stock - min_qty) / daily_rate, horizon_weeks * 7)
+        days_left = np.clip(days_left, 0, horizon_weeks * 7 * 13)
+        base = datetime.combine(today or datetime.utcnow().date(), datetime.min.time())
+
+        result: Dict[int, dict] = {}
+        for i, pid in enumerate(ids.tolist()):
+            result[pid] = {
+                'predicted_demand': int(round(demand[i])),
+                'lower': int(np.floor(lower[i])),
+                'upper': int(np.ceil(upper[i])),
+                'confidence': round(float(confidence[i]), 3),
+                'method': METHOD_CROSTON if self.intermittent[pos[i]] else METHOD_SES,
+                'next_order_date': base + timedelta(days=int(days_left[i])),
+            }
+        return result
+
+
+def load_weekly_matrix(
+    dealer: str = "",
+    weeks: int = DEFAULT_HISTORY_WEEKS,
+    today: Optional[date] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """(product_id の配列, 商品×週の数量行列) を週次バケットから作る。古い週が左。"""
+    end_week = week_start_of(today or datetime.utcnow().date())
+    start_week = end_week - timedelta(weeks=weeks - 1)
+    query = db.session.query(
+        ProductWeeklyDemand.product_id,
+        ProductWeeklyDemand.week_start,
+        ProductWeeklyDemand.quantity,
+    ).filter(ProductWeeklyDemand.week_start >= start_week)
+    if dealer:
+        query = query.join(Product, Product.id == ProductWeeklyDemand.product_id).filter(Product.dealer == dealer)
+    rows = query.all()
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty((0, weeks))
+
+    pids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+    week_idx = np.fromiter(((r[1] - start_week).days // 7 for r in rows), dtype=np.int64, count=len(rows))
+    qty = np.fromiter((r[2] for r in rows), dtype=float, count=len(rows))
+    keep = (week_idx >= 0) & (week_idx < weeks)
+    pids, week_idx, qty = pids[keep], week_idx[keep], qty[keep]
+
+    product_ids, row_idx = np.unique(pids, return_inverse=True)
+    matrix = np.zeros((len(product_ids), weeks))
+    np.add.at(matrix, (row_idx, week_idx), qty)
+    return product_ids, matrix
+
+
+def _smooth(y: np.ndarray, active: np.ndarray, alphas: np.ndarray, intermittent: np.ndarray):
+    """
+    全商品・全候補係数を同時に当てはめる。
+    y, active: (商品, 週)。alphas: (候補,)。戻り値はいずれも (候補, 商品)。
+    """
+    n_products, n_weeks = y.shape
+    a = alphas[:, None]
+    shape = (len(alphas), n_products)
+    started = np.zeros(shape, dtype=bool)
+    level = np.zeros(shape)       # SES の水準 / Croston の需要サイズ
+    interval = np.ones(shape)     # Croston の需要間隔
+    since = np.ones(shape)        # 最後の需要からの週数
+    sse = np.zeros(shape)
+    sae = np.zeros(shape)
+    n_err = np.zeros(shape)
+    inter = np.broadcast_to(intermittent, shape)
+
+    for t in range(n_weeks):
+        yt = np.broadcast_to(y[:, t], shape)
+        act = np.broadcast_to(active[:, t], shape)
+        # 1 期先予測（SBA 補正付き Croston / SES）
+        croston_rate = (1 - a / 2) * level / interval
+        pred = np.where(inter, croston_rate, level)
+        err = yt - pred
+        scored = act & started
+        sse += np.where(scored, err * err, 0.0)
+        sae += np.where(scored, np.abs(err), 0.0)
+        n_err += scored
+
+        demand = yt > 0
+        # 初回の需要で初期化
+        init = act & ~started & demand
+        level = np.where(init, yt, level)
+        interval = np.where(init, 1.0, interval)
+        since = np.where(init, 1.0, since)
+        # SES: 毎週更新
+        ses_update = scored & ~inter
+        level = np.where(ses_update, level + a * (yt - level), level)
+        # Croston: 需要があった週だけ更新
+        cro_update = scored & inter & demand
+        level = np.where(cro_update, level + a * (yt - level), level)
+        interval = np.where(cro_update, interval + a * (since - interval), interval)
+        since = np.where(scored & inter, np.where(demand, 1.0, since + 1.0), since)
+        started = started | init
+
+    rate = np.where(inter, (1 - a / 2) * level / interval, level)
+    return rate, sse, sae, n_err
+
+
+def fit_demand_forecast(
+    product_ids: np.ndarray,
+    matrix: np.ndarray,
+    alphas: Iterable[float] = DEFAULT_ALPHAS,
+) -> DemandForecastModel:
+    """週次数量行列から全商品の予測モデルを当てはめる。"""
+    alphas = np.asarray(list(alphas), dtype=float)
+    demand_weeks = (matrix > 0).sum(axis=1)
+    keep = demand_weeks >= MIN_DEMAND_WEEKS
+    product_ids, y = product_ids[keep], matrix[keep]
+    if len(product_ids) == 0:
+        empty = np.empty(0)
+        return DemandForecastModel(
+            product_ids=np.empty(0, dtype=np.int64), weekly_rate=empty, weekly_sigma=empty,
+            wape=empty, alpha=empty, intermittent=np.empty(0, dtype=bool),
+        )
+
+    # 最初に需要があった週から先を対象にする（取扱開始前の 0 は数えない）
+    first = np.argmax(y > 0, axis=1)
+    active = np.arange(y.shape[1])[None, :] >= first[:, None]
+    zero_share = ((y == 0) & active).sum(axis=1) / active.sum(axis=1)
+    intermittent = zero_share >= INTERMITTENT_ZERO_SHARE
+
+    rate, sse, sae, n_err = _smooth(y, active, alphas, intermittent)
+    best = np.argmin(sse, axis=0)
+    cols = np.arange(len(product_ids))
+    n = np.maximum(n_err[best, cols], 1)
+    actual_total = np.where(active, y, 0).sum(axis=1) - y[cols, first]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        wape = np.where(actual_total > 0, sae[best, cols] / actual_total, 1.0)
+
+    return DemandForecastModel(
+        product_ids=product_ids.astype(np.int64),
+        weekly_rate=np.maximum(rate[best, cols], 0.0),
+        weekly_sigma=np.sqrt(sse[best, cols] / n),
+        wape=wape,
+        alpha=alphas[best],
+        intermittent=intermittent,
+    )
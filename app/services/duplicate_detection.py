@@ -0,0 +1,235 @@
+"""表記ゆれによる重複商品の検出（MinHash + LSH で候補を絞り、類似度で確認）。
+
+全商品の総当たり（O(N²)）は 5 万件で 12 億ペアになり現実的でないため、
+1. 正規化後の商品名が完全一致するものを先にまとめ、
+2. 正規化した商品名の文字 n-gram から MinHash 署名を作り、バンド分割（LSH）で同じバケットに入ったものだけを候補にし、
+3. 候補ペアを照合と同じ基準（name_similarity のしきい値・has_variant_token_conflict）で確認して、
+4. 確認できたペアを類似度の高い順に結合してクラスタにする（色違い・容量違いが同じクラスタに入らないようにする）。
+"""
+from __future__ import annotations
+
+import zlib
+from dataclasses import dataclass, field
+from difflib import SequenceMatcher
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.services.product_matching import (
+    DEFAULT_SIMILARITY_THRESHOLD,
+    has_variant_token_conflict,
+    normalize_product_name,
+)
+
+# MinHash のハッシュ関数の数 = バンド数 × バンドあたりの行数。
+# 16 バンド × 4 行で、n-gram の Jaccard 係数が約 0.5 以上のペアを高い確率で候補にできる
+# （1 文字違いの商品名でも Jaccard は 0.7 前後ある）。
+DEFAULT_BANDS = 16
+DEFAULT_ROWS_PER_BAND = 4
+NGRAM_SIZE = 3
+# 同じバケットに入った件数がこれを超える場合は、名前順で隣り合うものだけを候補にする（ペア数の爆発を防ぐ）
+MAX_BUCKET_SIZE = 100
+# 1 クラスタの上限（色違いの確認を全ペアで行うため）
+MAX_CLUSTER_SIZE = 50
+# 署名の一致率（Jaccard 係数の推定値）がこれ未満の候補は類似度を計算しない。
+# しきい値 0.92 を満たす商品名の n-gram の Jaccard は 0.6 程度以上なので、推定誤差を見込んでも十分低い値
+MIN_ESTIMATED_JACCARD = 0.4
+
+_HASH_PRIME = 4294967311  # 2^32 より大きい素数（係数を 2^32 未満にすれば a*x+b が uint64 に収まる）
+_SEED = 20240601
+
+
+@dataclass
+class DuplicateCluster:
+    """重複候補のクラスタ。score は結合に使ったペアの類似度の最小値。"""
+
+    ids: List[int]
+    score: float
+    exact: bool
+    pairs: List[Tuple[int, int, float]] = field(default_factory=list)
+
+
+def _shingles(name: str, n: int = NGRAM_SIZE) -> List[int]:
+    """正規化済みの名前から文字 n-gram のハッシュ（uint32）を作る。短い名前は名前全体を 1 つにする。"""
+    if len(name) <= n:
+        grams = {name}
+    else:
+        grams = {name[i:i + n] for i in range(len(name) - n + 1)}
+    return [zlib.crc32(g.encode("utf-8")) for g in grams]
+
+
+def minhash_signatures(names: Sequence[str], num_perm: int, seed: int = _SEED) -> np.ndarray:
+    """各名前の MinHash 署名（件数 × num_perm、uint64）をまとめて計算する。"""
+    owners: List[int] = []
+    hashes: List[int] = []
+    for i, name in enumerate(names):
+        sh = _shingles(name)
+        hashes.extend(sh)
+        owners.extend([i] * len(sh))
+    sig = np.full((len(names), num_perm), np.iinfo(np.uint64).max, dtype=np.uint64)
+    if not hashes:
+        return sig
+    x = np.asarray(hashes, dtype=np.uint64)
+    owner = np.asarray(owners, dtype=np.int64)
+    # owner は昇順なので、各名前の先頭位置で区切って最小値を取る
+    starts = np.flatnonzero(np.r_[True, owner[1:] != owner[:-1]])
+    rows = owner[starts]
+
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, 1 << 32, size=num_perm, dtype=np.uint64)
+    b = rng.integers(0, 1 << 32, size=num_perm, dtype=np.uint64)
+    for k in range(num_perm):
+        hv = (a[k] * x + b[k]) % np.uint64(_HASH_PRIME)
+        sig[rows, k] = np.minimum.reduceat(hv, starts)
+    return sig
+
+
+def _band_keys(sig: np.ndarray, bands: int, rows: int, block: np.ndarray) -> np.ndarray:
+    """バンドごとのバケットキー（バンド × 件数）。block（メーカーなど）が違うものは同じキーにならない。"""
+    keys = np.empty((bands, sig.shape[0]), dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for band in range(bands):
+            part = sig[:, band * rows:(band + 1) * rows]
+            key = block.astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15) + np.uint64(band)
+            for j in range(rows):
+                key = (key ^ part[:, j]) * np.uint64(0x100000001B3)
+            keys[band] = key
+    return keys
+
+
+def _candidate_pairs(keys: np.ndarray, names: Sequence[str]) -> set:
+    """同じバケットに入った名前のペア（i < j）を集める。"""
+    pairs = set()
+    for band_keys in keys:
+        order = np.argsort(band_keys, kind="stable")
+        sorted_keys = band_keys[order]
+        boundaries = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1], True])
+        sizes = np.diff(boundaries)
+        for start, size in zip(boundaries[:-1][sizes > 1], sizes[sizes > 1]):
+            members = order[start:start + size].tolist()
+            if size > MAX_BUCKET_SIZE:
+                members.sort(key=lambda i: names[i])
+                pairs.update((min(p, q), max(p, q)) for p, q in zip(members, members[1:]))
+                continue
+            for x in range(size):
+                for y in range(x + 1, size):
+                    p, q = members[x], members[y]
+                    pairs.add((p, q) if p < q else (q, p))
+    return pairs
+
+
+class _UnionFind:
+    def __init__(self, n: int):
+        self.parent = list(range(n))
+        self.members: Dict[int, List[int]] = {i: [i] for i in range(n)}
+
+    def find(self, i: int) -> int:
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, a: int, b: int) -> int:
+        ra, rb = self.find(a), self.find(b)
+        if ra == rb:
+            return ra
+        if len(self.members[ra]) < len(self.members[rb]):
+            ra, rb = rb, ra
+        self.parent[rb] = ra
+        self.members[ra].extend(self.members.pop(rb))
+        return ra
+
+
+def find_near_duplicates(
+    products: Sequence[Tuple[int, str, Optional[str]]],
+    *,
+    threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+    same_manufacturer: bool = True,
+    bands: int = DEFAULT_BANDS,
+    rows_per_band: int = DEFAULT_ROWS_PER_BAND,
+) -> List[DuplicateCluster]:
+    """
+    重複候補のクラスタを返す（2 件以上のもののみ、件数の多い順）。
+
+    Args:
+        products: (product_id, product_name, manufacturer) の列
+        threshold: 同一商品とみなす類似度（商品照合と同じ既定値）
+        same_manufacturer: True ならメーカー（正規化後）が同じ商品同士だけを比べる
+    """
+    # 1. 正規化後の (メーカー, 商品名) が完全一致するものを 1 つの代表にまとめる
+    groups: Dict[Tuple[str, str], List[int]] = {}
+    for pid, name, manufacturer in products:
+        norm = normalize_product_name(name)
+        if not norm:
+            continue
+        block = normalize_product_name(manufacturer) if same_manufacturer else ""
+        groups.setdefault((block, norm), []).append(pid)
+
+    keys = list(groups)
+    names = [k[1] for k in keys]
+    n = len(keys)
+    uf = _UnionFind(n)
+    edges: List[Tuple[float, int, int]] = []
+
+    # 2. MinHash + LSH で候補ペアを作る
+    if n > 1:
+        block_codes = {b: i for i, b in enumerate(sorted({k[0] for k in keys}))}
+        block = np.fromiter((block_codes[k[0]] for k in keys), dtype=np.int64, count=n)
+        sig = minhash_signatures(names, bands * rows_per_band)
+        candidates = _candidate_pairs(_band_keys(sig, bands, rows_per_band, block), names)
+        if candidates:
+            pair_array = np.array(sorted(candidates), dtype=np.int64)
+            # 署名の一致率で明らかに似ていないペアをまとめて除く
+            estimated = (sig[pair_array[:, 0]] == sig[pair_array[:, 1]]).mean(axis=1)
+            pair_array = pair_array[estimated >= MIN_ESTIMATED_JACCARD]
+            # 長さの比で類似度の上限が決まる（ratio <= 2*min/(len_a+len_b)）
+            lengths = np.fromiter((len(x) for x in names), dtype=np.int64, count=n)
+            la, lb = lengths[pair_array[:, 0]], lengths[pair_array[:, 1]]
+            pair_array = pair_array[2 * np.minimum(la, lb) / (la + lb) >= threshold]
+        else:
+            pair_array = np.empty((0, 2), dtype=np.int64)
+
+        # 3. 照合と同じ基準で確認（上限値 quick_ratio で足りないものは ratio を計算しない）
+        for i, j in pair_array.tolist():
+            a, b = names[i], names[j]
+            matcher = SequenceMatcher(None, a, b)
+            if matcher.quick_ratio() < threshold:
+                continue
+            score = matcher.ratio()
+            if score < threshold or has_variant_token_conflict(a, b):
+                continue
+            edges.append((score, i, j))
+
+    # 4. 類似度の高い順に結合（結合後のクラスタ内に色違い等の食い違いが生じる場合は結合しない）
+    edges.sort(key=lambda e: -e[0])
+    min_score: Dict[int, float] = {}
+    pair_log: Dict[int, List[Tuple[int, int, float]]] = {}
+    for score, i, j in edges:
+        ri, rj = uf.find(i), uf.find(j)
+        if ri == rj:
+            continue
+        mi, mj = uf.members[ri], uf.members[rj]
+        if len(mi) + len(mj) > MAX_CLUSTER_SIZE:
+            continue
+        if any(has_variant_token_conflict(names[x], names[y]) for x in mi for y in mj):
+            continue
+        root = uf.union(i, j)
+        other = rj if root == ri else ri
+        min_score[root] = min(min_score.get(ri, 1.0), min_score.get(rj, 1.0), score)
+        pair_log[root] = pair_log.pop(ri, []) + pair_log.pop(rj, []) + [(i, j, score)]
+        min_score.pop(other, None)
+
+    clusters: List[DuplicateCluster] = []
+    for root, members in uf.members.items():
+        ids = sorted(pid for m in members for pid in groups[keys[m]])
+        if len(ids) < 2:
+            continue
+        rep = {m: groups[keys[m]][0] for m in members}
+        clusters.append(DuplicateCluster(
+            ids=ids,
+            score=round(min_score.get(root, 1.0), 4),
+            exact=len(members) == 1,
+            pairs=[(rep[i], rep[j], round(s, 4)) for i, j, s in pair_log.get(root, [])],
+        ))
+    clusters.sort(key=lambda c: (-len(c.ids), -c.score, c.ids[0]))
+    return clusters
@@ -0,0 +1,88 @@
+"""在庫一覧ページ（/）の初期表示データ。
+
+ページには先頭の 1 ページ分の商品と取引会社一覧だけを埋め込み、残りはブラウザが一覧 API で取得する。
+結果は (取引会社, データ版数) ごとにプロセス内でキャッシュし、商品が変わらない限り DB を読まない
+（版数は Product への書き込みで変わる。data_version_service 参照）。
+"""
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
+
+from app import db
+from app.models.inventory import Product
+from app.services.change_feed_service import latest_change_id, product_to_dict
+from app.services.data_version_service import get_data_version
+
+# 初期表示に埋め込む商品数（一覧の既定の並び = 商品名順の先頭）
+FIRST_PAGE_SIZE = 100
+# 一覧に常に出す取引会社（DB に商品が無くても選択可能にする）
+EXTRA_DEALER_PRESETS = ('BEAUTY GARAGE',)
+
+_CACHE_SIZE = 32
+
+_cache: "OrderedDict[Tuple[str, int], Dict[str, Any]]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def visible_product_filter():
+    """一覧に表示する商品の条件（システム管理用ダミー商品を除く）。"""
+    return db.and_(
+        db.not_(db.and_(
+            Product.product_name.like('取引会社管理用_%'),
+            Product.manufacturer == 'システム'
+        )),
+        db.not_(db.and_(
+            Product.product_name.like('カテゴリ管理用_%'),
+            Product.manufacturer == 'システム'
+        ))
+    )
+
+
+def visible_products_query():
+    """一覧に表示する商品（システム管理用ダミー商品を除く）。"""
+    return Product.query.filter(visible_product_filter())
+
+
+def dealer_names() -> List[str]:
+    """取引会社一覧（システム管理用ダミー商品の取引会社も含む）。"""
+    rows = db.session.query(Product.dealer).distinct().filter(Product.dealer.isnot(None)).all()
+    return sorted({row[0] for row in rows if row[0]} | set(EXTRA_DEALER_PRESETS))
+
+
+def _build(dealer: str) -> Dict[str, Any]:
+    # 一覧を読む前の変更フィードの位置（ブラウザはここから差分を受け取る）
+    version = latest_change_id()
+    query = visible_products_query()
+    if dealer:
+        query = query.filter(Product.dealer == dealer)
+    products = query.order_by(Product.product_name, Product.id).limit(FIRST_PAGE_SIZE + 1).all()
+    return {
+        'dealer': dealer,
+        'dealers': dealer_names(),
+        'products': [product_to_dict(p) for p in products[:FIRST_PAGE_SIZE]],
+        'has_more': len(products) > FIRST_PAGE_SIZE,
+        'version': version,
+    }
+
+
+def get_initial_inventory(dealer: str = '') -> Dict[str, Any]:
+    """初期表示データ（呼び出し側で変更しないこと。キャッシュと共有している）。
+
+    Returns:
+        {'dealer', 'dealers', 'products': 先頭ページ, 'has_more': 続きがあるか, 'version': 変更フィードの位置}
+    """
+    key = (dealer, get_data_version())
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None:
+            _cache.move_to_end(key)
+            return cached
+    data = _build(dealer)
+    with _cache_lock:
+        _cache[key] = data
+        _cache.move_to_end(key)
+        while len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+    return data
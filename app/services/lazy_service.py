@@ -0,0 +1,70 @@
+"""重い依存（pandas・NumPy・reportlab・pyarrow など）を持つサービスの遅延読み込み。
+
+コントローラーの import 時にはモジュールを読み込まず、最初に使われたときに import してインスタンスを作る。
+ワーカーの起動と /health の応答が速くなり、訓練や PDF を使わないワーカーのメモリも増えない。
+"""
+from __future__ import annotations
+
+import importlib
+import threading
+from typing import Any, Optional
+
+
+class LazyService:
+    """
+    初回アクセス時に `module` を import し、`attr` を取り出す代理オブジェクト。
+
+    instantiate=True なら取り出したクラスを引数なしで生成し、False なら属性（モジュール変数）をそのまま使う。
+    任意依存が無い環境では available が False になる（従来の try/except ImportError と同じ扱い）。
+    """
+
+    def __init__(self, module: str, attr: str, instantiate: bool = True):
+        self._module = module
+        self._attr = attr
+        self._instantiate = instantiate
+        self._lock = threading.Lock()
+        self._target: Any = None
+        self._loaded = False
+        self._import_error: Optional[ImportError] = None
+
+    def load(self) -> Any:
+        """対象を読み込んで返す（2 回目以降は読み込み済みのものを返す）。"""
+        if self._loaded:
+            return self._target
+        with self._lock:
+            if not self._loaded:
+                try:
+                    target = getattr(importlib.import_module(self._module), self._attr)
+                    self._target = target() if self._instantiate else target
+                except ImportError as e:
+                    self._import_error = e
+                    raise
+                self._loaded = True
+        return self._target
+
+    @property
+    def available(self) -> bool:
+        """依存パッケージが揃っていて読み込めるか。"""
+        if self._loaded:
+            return True
+        if self._import_error is not None:
+            return False
+        try:
+            self.load()
+        except ImportError:
+            return False
+        return True
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def __getattr__(self, name: str) -> Any:
+        # _ で始まる属性は自身のもの（初期化前の参照で無限再帰しないよう除外）
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.load(), name)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self._loaded else "not loaded"
+        return f"<LazyService {self._module}.{self._attr} ({state})>"
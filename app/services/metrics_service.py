@@ -0,0 +1,268 @@
+"""リクエスト時間と SQL の計測（Prometheus テキスト形式で /metrics に出力）。
+
+- ルート別のレイテンシのヒストグラム
+- リクエストごとの SQL 発行回数と DB 時間（N+1 の検出用。レスポンスの Server-Timing ヘッダーにも付ける）
+- 遅いクエリのログ（SLOW_QUERY_MS 以上かかった文を、発行元のルートと一緒に出力）
+
+値はプロセスごとに集計する（Gunicorn の複数ワーカーではスクレイプしたワーカーの値になる）。
+"""
+from __future__ import annotations
+
+import bisect
+import contextvars
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from flask import Response, g, request
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# レイテンシ（秒）のバケット
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# リクエストあたりの SQL 回数のバケット
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250, 1000)
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+SLOW_QUERY_SECONDS = _env_float("SLOW_QUERY_MS", 200) / 1000.0
+_SLOW_QUERY_TEXT_LIMIT = 2000
+
+
+class _RequestStats:
+    __slots__ = ("queries", "db_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+# 実行中のリクエストの SQL 集計（スレッド・コンテキストごと）
+_current: contextvars.ContextVar[Optional[_RequestStats]] = contextvars.ContextVar("request_sql_stats", default=None)
+
+
+class Histogram:
+    """ラベル付きのヒストグラム（累積バケット・合計・件数）。"""
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str], buckets: Sequence[float]):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, labels: Tuple[str, ...], value: float) -> None:
+        # series: [バケットごとの件数..., +Inf の件数, 合計]
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0.0] * (len(self.buckets) + 2)
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self._series.items()):
+            base = _format_labels(self.label_names, labels)
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_with_le(base, _format_number(bound))} {_format_number(cumulative)}")
+            cumulative += series[len(self.buckets)]
+            lines.append(f'{self.name}_bucket{_with_le(base, "+Inf")} {_format_number(cumulative)}')
+            lines.append(f"{self.name}_sum{base} {series[-1]:.6f}")
+            lines.append(f"{self.name}_count{base} {_format_number(cumulative)}")
+        return lines
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+def _with_le(base: str, le: str) -> str:
+    if not base:
+        return f'{{le="{le}"}}'
+    return base[:-1] + f',le="{le}"}}'
+
+
+def _format_number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.request_latency = Histogram(
+            "http_request_duration_seconds", "HTTP request latency by route.",
+            ("method", "endpoint", "status"), LATENCY_BUCKETS,
+        )
+        self.request_queries = Histogram(
+            "http_request_sql_queries", "SQL statements executed per HTTP request.",
+            ("method", "endpoint"), QUERY_COUNT_BUCKETS,
+        )
+        self.request_db_time = Histogram(
+            "http_request_db_seconds", "Time spent in SQL per HTTP request.",
+            ("method", "endpoint"), LATENCY_BUCKETS,
+        )
+        self.queries_total = 0
+        self.query_seconds_total = 0.0
+        self.slow_queries: Dict[str, int] = defaultdict(int)
+
+    def observe_request(self, method: str, endpoint: str, status: int, seconds: float, stats: _RequestStats) -> None:
+        with self._lock:
+            self.request_latency.observe((method, endpoint, str(status)), seconds)
+            self.request_queries.observe((method, endpoint), stats.queries)
+            self.request_db_time.observe((method, endpoint), stats.db_seconds)
+
+    def observe_query(self, seconds: float, slow_endpoint: Optional[str]) -> None:
+        with self._lock:
+            self.queries_total += 1
+            self.query_seconds_total += seconds
+            if slow_endpoint is not None:
+                self.slow_queries[slow_endpoint] += 1
+
+    def render(self, extra: Sequence[str] = ()) -> str:
+        with self._lock:
+            lines: List[str] = []
+            for hist in (self.request_latency, self.request_queries, self.request_db_time):
+                lines.extend(hist.render())
+            lines += [
+                "# HELP db_queries_total SQL statements executed.",
+                "# TYPE db_queries_total counter",
+                f"db_queries_total {self.queries_total}",
+                "# HELP db_query_seconds_total Total time spent executing SQL.",
+                "# TYPE db_query_seconds_total counter",
+                f"db_query_seconds_total {self.query_seconds_total:.6f}",
+                f"# HELP db_slow_queries_total SQL statements slower than {SLOW_QUERY_SECONDS * 1000:g} ms.",
+                "# TYPE db_slow_queries_total counter",
+            ]
+            for endpoint, count in sorted(self.slow_queries.items()):
+                lines.append(f"db_slow_queries_total{_format_labels(('endpoint',), (endpoint,))} {count}")
+        lines.extend(extra)
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+
+def _endpoint_label() -> str:
+    """ルートのテンプレート（/api/products/<int:product_id> など）。ID ごとに系列が増えないようにする。"""
+    rule = getattr(request, "url_rule", None)
+    return rule.rule if rule is not None else "unmatched"
+
+
+def _before_request() -> None:
+    g._metrics_started = time.perf_counter()
+    g._metrics_token = _current.set(_RequestStats())
+
+
+def _finish_request(status: int) -> Optional[Tuple[_RequestStats, float]]:
+    """計測を終えて記録し、SQL 集計のコンテキストを戻す（記録済みなら None）。"""
+    started = g.pop("_metrics_started", None)
+    token = g.pop("_metrics_token", None)
+    if started is None or token is None:
+        return None
+    stats = _current.get() or _RequestStats()
+    _current.reset(token)
+    elapsed = time.perf_counter() - started
+    metrics.observe_request(request.method, _endpoint_label(), status, elapsed, stats)
+    return stats, elapsed
+
+
+def _after_request(response):
+    finished = _finish_request(response.status_code)
+    if finished is None:
+        return response
+    stats, elapsed = finished
+    response.headers.add(
+        "Server-Timing",
+        f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.queries} queries", app;dur={elapsed * 1000:.1f}',
+    )
+    return response
+
+
+def _teardown_request(exc) -> None:
+    # after_request を通らなかったリクエスト（例外が伝播した・他の after_request が失敗した）は 500 として記録する
+    _finish_request(500)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    conn.info.setdefault("_metrics_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    starts = conn.info.get("_metrics_query_start")
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    stats = _current.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+    slow_endpoint = None
+    if elapsed >= SLOW_QUERY_SECONDS:
+        slow_endpoint = _endpoint_label() if stats is not None else "background"
+        text = statement if len(statement) <= _SLOW_QUERY_TEXT_LIMIT else statement[:_SLOW_QUERY_TEXT_LIMIT] + "..."
+        logger.warning("slow query %.1f ms [%s]%s: %s", elapsed * 1000, slow_endpoint,
+                       " (executemany)" if executemany else "", text)
+    metrics.observe_query(elapsed, slow_endpoint)
+
+
+def register_sql_hooks(engine) -> None:
+    """エンジンに SQL 計測のイベントを登録する（何度呼んでも 1 回だけ）。"""
+    if event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def _pool_gauges(engine) -> List[str]:
+    from app.services.db_pool_service import pool_status
+
+    status = pool_status(engine)
+    lines = []
+    for key in ("size", "checkedin", "checkedout", "overflow"):
+        if key in status:
+            name = f"db_pool_{key}"
+            lines += [f"# TYPE {name} gauge", f"{name} {status[key]}"]
+    for key, value in status["events"].items():
+        if key == "uptime_seconds":
+            continue
+        name = f"db_pool_{key}_total"
+        lines += [f"# TYPE {name} counter", f"{name} {value}"]
+    return lines
+
+
+def init_metrics(app, db) -> None:
+    """リクエスト計測のフックと /metrics を登録する（METRICS_ENABLED=0 で無効）。"""
+    if os.environ.get("METRICS_ENABLED", "1") == "0":
+        return
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    with app.app_context():
+        register_sql_hooks(db.engine)
+
+    @app.route("/metrics")
+    def prometheus_metrics():
+        try:
+            extra = _pool_gauges(db.engine)
+        except Exception as e:
+            logger.warning("pool metrics unavailable: %s", e)
+            extra = []
+        return Response(metrics.render(extra), mimetype="text/plain; version=0.0.4; charset=utf-8")
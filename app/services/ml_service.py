@@ -1,148 +1,82 @@
-import pandas as pd
 import numpy as np
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.preprocessing import StandardScaler
-from sklearn.model_selection import train_test_split
-from datetime import datetime, timedelta
-import joblib
-import os
-from app.models.inventory import Product, OrderHistory
+from app.models.inventory import Product
 from app import db
+from app.services.demand_forecast import (
+    DEFAULT_HORIZON_WEEKS,
+    MIN_DEMAND_WEEKS,
+    fit_demand_forecast,
+    load_weekly_matrix,
+)
+from app.services.model_registry import model_registry
+from app.services.stock_alert_service import get_stock_alerts
 
 class MLService:
-    def __init__(self):
-        self.model = None
-        self.scaler = StandardScaler()
-        self.model_path = 'models/demand_forecast_model.pkl'
-        self.scaler_path = 'models/demand_scaler.pkl'
+    def __init__(self, registry=None):
+        # 取引会社別のモデルはレジストリで管理（インスタンスに 1 つだけ保持すると取引会社間で混ざるため）
+        self.registry = registry or model_registry
         
-    def prepare_training_data(self, dealer=''):
-        """注文履歴から学習データを準備（取引会社別対応）"""
+    def train_model(self, dealer=''):
+        """需要予測モデル（週次の指数平滑法 / Croston 法）を全商品まとめて当てはめて保存（取引会社別対応）"""
         try:
-            # 注文履歴データを取得
-            query = db.session.query(OrderHistory)
-            if dealer:
-                query = query.join(Product).filter(Product.dealer == dealer)
-            
-            orders = query.all()
-            
-            if len(orders) < 10:  # データが少なすぎる場合
+            product_ids, matrix = load_weekly_matrix(dealer)
+            if matrix.sum() == 0 or np.count_nonzero(matrix) < 10:  # データが少なすぎる場合
                 return False, "学習に十分なデータがありません（最低10件必要）"
             
-            # データフレームに変換
-            data = []
-            for order in orders:
-                data.append({
-                    'product_id': order.product_id,
-                    'quantity': order.quantity,
-                    'order_date': order.order_date,
-                    'month': order.order_date.month,
-                    'day_of_week': order.order_date.weekday(),
-                    'quarter': (order.order_date.month - 1) // 3 + 1
-                })
-            
-            df = pd.DataFrame(data)
-            
-            # 商品ごとの統計情報を追加
-            product_stats = df.groupby('product_id').agg({
-                'quantity': ['mean', 'std', 'count'],
-                'order_date': ['min', 'max']
-            }).reset_index()
+            model = fit_demand_forecast(product_ids, matrix)
+            if len(model) == 0:
+                return False, f"学習に十分なデータがありません（需要のある週が{MIN_DEMAND_WEEKS}週以上の商品がありません）"
             
-            product_stats.columns = ['product_id', 'avg_quantity', 'std_quantity', 'order_count', 'first_order', 'last_order']
+            # モデルの保存（取引会社別）
+            self.registry.save(dealer, model, None)
             
-            # 最終注文からの日数を計算
-            latest_date = df['order_date'].max()
-            product_stats['days_since_last_order'] = (latest_date - product_stats['last_order']).dt.days
+            # 精度評価（1 期先予測の WAPE）
+            wape = float(np.median(model.wape))
+            intermittent_count = int(model.intermittent.sum())
             
-            return True, product_stats
+            dealer_info = f"（取引会社: {dealer}）" if dealer else ""
+            return True, (
+                f"モデル訓練完了{dealer_info} - 対象商品: {len(model)}件"
+                f"（間欠需要: {intermittent_count}件）, 予測誤差(WAPE中央値): {wape:.3f}"
+            )
             
         except Exception as e:
-            return False, f"データ準備エラー: {str(e)}"
+            return False, f"モデル訓練エラー: {str(e)}"
     
-    def train_model(self, dealer=''):
-        """需要予測モデルを訓練（取引会社別対応）"""
+    def predict_demand_batch(self, products, dealer='', horizon_weeks=DEFAULT_HORIZON_WEEKS):
+        """複数商品の需要をまとめて予測（保存済みの当てはめ結果を配列で参照）
+
+        Returns:
+            (True, {product_id: 予測結果}) | (False, エラーメッセージ)
+        """
         try:
-            success, data = self.prepare_training_data(dealer)
-            if not success:
-                return False, data
-            
-            # 特徴量の準備
-            X = data[['avg_quantity', 'std_quantity', 'order_count', 'days_since_last_order']].fillna(0)
-            y = data['avg_quantity']  # 予測対象：平均注文量
-            
-            # データの分割
-            X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-            
-            # スケーリング
-            X_train_scaled = self.scaler.fit_transform(X_train)
-            X_test_scaled = self.scaler.transform(X_test)
-            
-            # モデルの訓練
-            self.model = RandomForestRegressor(n_estimators=100, random_state=42)
-            self.model.fit(X_train_scaled, y_train)
-            
-            # モデルの保存（取引会社別）
-            dealer_suffix = f"_{dealer}" if dealer else ""
-            model_path = f'models/demand_forecast_model{dealer_suffix}.pkl'
-            scaler_path = f'models/demand_scaler{dealer_suffix}.pkl'
+            loaded = self.registry.get(dealer)
+            if loaded is None:
+                return False, "モデルが訓練されていません"
             
-            os.makedirs('models', exist_ok=True)
-            joblib.dump(self.model, model_path)
-            joblib.dump(self.scaler, scaler_path)
-            
-            # 精度評価
-            train_score = self.model.score(X_train_scaled, y_train)
-            test_score = self.model.score(X_test_scaled, y_test)
-            
-            dealer_info = f"（取引会社: {dealer}）" if dealer else ""
-            return True, f"モデル訓練完了{dealer_info} - 訓練精度: {train_score:.3f}, テスト精度: {test_score:.3f}"
+            return True, loaded.model.forecast(
+                [p.id for p in products],
+                [p.current_stock or 0 for p in products],
+                [p.min_quantity or 0 for p in products],
+                horizon_weeks=horizon_weeks,
+            )
             
         except Exception as e:
-            return False, f"モデル訓練エラー: {str(e)}"
+            return False, f"予測エラー: {str(e)}"
     
     def predict_demand(self, product_id, dealer=''):
         """特定商品の需要を予測（取引会社別対応）"""
         try:
-            if self.model is None:
-                # 保存されたモデルを読み込み
-                dealer_suffix = f"_{dealer}" if dealer else ""
-                model_path = f'models/demand_forecast_model{dealer_suffix}.pkl'
-                scaler_path = f'models/demand_scaler{dealer_suffix}.pkl'
-                
-                if os.path.exists(model_path):
-                    self.model = joblib.load(model_path)
-                    self.scaler = joblib.load(scaler_path)
-                else:
-                    return False, "モデルが訓練されていません"
+            product = db.session.get(Product, product_id)
+            if product is None:
+                return False, "商品が見つかりません"
             
-            # 商品の統計情報を取得
-            orders = db.session.query(OrderHistory).filter_by(product_id=product_id).all()
-            
-            if len(orders) < 3:
+            success, result = self.predict_demand_batch([product], dealer)
+            if not success:
+                return False, result
+            if product_id not in result:
                 return False, "予測に十分なデータがありません"
             
-            # 特徴量の計算
-            quantities = [order.quantity for order in orders]
-            latest_order = max(orders, key=lambda x: x.order_date)
-            days_since_last = (datetime.utcnow() - latest_order.order_date).days
-            
-            features = np.array([[
-                np.mean(quantities),
-                np.std(quantities),
-                len(orders),
-                days_since_last
-            ]])
-            
-            # 予測
-            features_scaled = self.scaler.transform(features)
-            predicted_demand = self.model.predict(features_scaled)[0]
-            
-            return True, {
-                'predicted_demand': max(0, int(predicted_demand)),
-                'confidence': 0.8,  # 簡易的な信頼度
-                'next_order_date': datetime.utcnow() + timedelta(days=30)  # 簡易的な次回注文予定日
-            }
+            return True, result[product_id]
             
         except Exception as e:
             return False, f"予測エラー: {str(e)}"
@@ -150,35 +84,40 @@ class MLService:
     def get_order_recommendations(self, dealer=''):
         """注文推奨商品のリストを取得（取引会社別対応）"""
         try:
+            # 在庫不足の商品は差分更新しているアラート一覧から取る
+            recommendations = []
+            low_stock_ids = set()
+            for product, alert in get_stock_alerts(dealer):
+                low_stock_ids.add(product.id)
+                recommendations.append({
+                    'product': product,
+                    'reason': '在庫不足',
+                    'priority': 'high',
+                    'suggested_quantity': alert.shortage + 10
+                })
+            
+            # 在庫が足りている商品の需要予測はまとめて 1 回で行う
             query = Product.query
             if dealer:
                 query = query.filter(Product.dealer == dealer)
+            stocked = [p for p in query.all() if p.id not in low_stock_ids]
+            predictions = {}
+            if stocked:
+                success, result = self.predict_demand_batch(stocked, dealer)
+                if success:
+                    predictions = result
             
-            products = query.all()
-            recommendations = []
-            
-            for product in products:
-                # 在庫が最低必要数を下回っている商品
-                if product.current_stock < product.min_quantity:
+            for product in stocked:
+                # 需要予測による推奨
+                prediction = predictions.get(product.id)
+                predicted_demand = prediction['predicted_demand'] if prediction else None
+                if predicted_demand is not None and predicted_demand > product.current_stock:
                     recommendations.append({
                         'product': product,
-                        'reason': '在庫不足',
-                        'priority': 'high',
-                        'suggested_quantity': product.min_quantity - product.current_stock + 10
+                        'reason': '需要予測による推奨',
+                        'priority': 'medium',
+                        'suggested_quantity': predicted_demand - product.current_stock
                     })
-                    continue
-                
-                # 需要予測による推奨
-                success, prediction = self.predict_demand(product.id, dealer)
-                if success:
-                    predicted_demand = prediction['predicted_demand']
-                    if predicted_demand > product.current_stock:
-                        recommendations.append({
-                            'product': product,
-                            'reason': '需要予測による推奨',
-                            'priority': 'medium',
-                            'suggested_quantity': predicted_demand - product.current_stock
-                        })
             
             # 優先度順にソート
             recommendations.sort(key=lambda x: 0 if x['priority'] == 'high' else 1)
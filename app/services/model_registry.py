@@ -0,0 +1,115 @@
+"""取引会社別の需要予測モデルのレジストリ（読み込み済みモデルの LRU キャッシュとホットリロード）。"""
+from __future__ import annotations
+
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+import joblib
+
+DEFAULT_MODEL_DIR = "models"
+DEFAULT_MAX_ENTRIES = 8
+
+
+class LoadedModel(NamedTuple):
+    dealer: str
+    version: Tuple[int, ...]
+    model: Any
+    scaler: Any
+
+
+class ModelRegistry:
+    """
+    dealer -> (モデル, スケーラー) を保持する。
+    モデルとスケーラーは 1 つのファイルにまとめて保存し、1 回の置換で入れ替える（読み込み側が新旧を混ぜない）。
+    版数はそのファイルの更新時刻・サイズ・inode で、新しいファイルが置かれたら次の取得時に読み直す。
+    読み込みは取引会社ごとのロックで行い、ある取引会社の読み込み中も他の取引会社は待たせない。
+    """
+
+    def __init__(self, model_dir: str = DEFAULT_MODEL_DIR, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.model_dir = model_dir
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, LoadedModel]" = OrderedDict()
+        self._dealer_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def path_for(self, dealer: str = "") -> str:
+        """モデルとスケーラーをまとめた保存先。"""
+        dealer_suffix = f"_{dealer}" if dealer else ""
+        return os.path.join(self.model_dir, f"demand_model{dealer_suffix}.joblib")
+
+    def _version_on_disk(self, dealer: str) -> Optional[Tuple[int, ...]]:
+        try:
+            st = os.stat(self.path_for(dealer))
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def _dealer_lock(self, dealer: str) -> threading.Lock:
+        with self._lock:
+            lock = self._dealer_locks.get(dealer)
+            if lock is None:
+                lock = self._dealer_locks[dealer] = threading.Lock()
+            return lock
+
+    def _cached(self, dealer: str, version: Tuple[int, ...]) -> Optional[LoadedModel]:
+        with self._lock:
+            entry = self._entries.get(dealer)
+            if entry is not None and entry.version == version:
+                self._entries.move_to_end(dealer)
+                return entry
+            return None
+
+    def get(self, dealer: str = "") -> Optional[LoadedModel]:
+        """読み込み済みモデルを返す。未訓練なら None。ファイルが更新されていれば読み直す。"""
+        version = self._version_on_disk(dealer)
+        if version is None:
+            with self._lock:
+                self._entries.pop(dealer, None)
+            return None
+        entry = self._cached(dealer, version)
+        if entry is not None:
+            return entry
+        with self._dealer_lock(dealer):
+            # 待っている間に他のスレッドが読み込んだ場合はそれを使う
+            entry = self._cached(dealer, version)
+            if entry is not None:
+                return entry
+            # 配列は mmap で共有し、ワーカーごとのコピーを避ける
+            # （stat と読み込みの間に置き換えられても 1 ファイル内で揃っており、次の取得で読み直すだけ）
+            bundle = joblib.load(self.path_for(dealer), mmap_mode="r")
+            entry = LoadedModel(dealer=dealer, version=version, model=bundle["model"], scaler=bundle["scaler"])
+            with self._lock:
+                self._store(entry)
+            return entry
+
+    def save(self, dealer: str, model: Any, scaler: Any) -> LoadedModel:
+        """モデルを保存してキャッシュへ登録する（一時ファイルに書いてから 1 回で置換）。"""
+        os.makedirs(self.model_dir, exist_ok=True)
+        path = self.path_for(dealer)
+        fd, tmp_path = tempfile.mkstemp(dir=self.model_dir, suffix=".tmp")
+        os.close(fd)
+        try:
+            joblib.dump({"model": model, "scaler": scaler}, tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        entry = LoadedModel(dealer=dealer, version=self._version_on_disk(dealer), model=model, scaler=scaler)
+        with self._lock:
+            self._store(entry)
+        return entry
+
+    def _store(self, entry: LoadedModel) -> None:
+        self._entries[entry.dealer] = entry
+        self._entries.move_to_end(entry.dealer)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+model_registry = ModelRegistry()
@@ -0,0 +1,252 @@
+"""注文履歴の商品別集計（件数・合計・二乗和・初回/最終注文日・週次バケット）を差分で維持する。
+
+OrderHistory が flush されるたびに該当商品の行だけを加算するので、学習・予測は
+注文件数ではなく商品数に比例した読み込みで済む。ORM で変更・削除された注文の商品と、
+統合・削除で履歴が付け替わった商品は refresh_order_stats で集計し直す。
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import case, delete, event, func, inspect, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models.inventory import OrderHistory, ProductOrderStats, ProductWeeklyDemand
+
+_STATS = ProductOrderStats.__table__
+_WEEKLY = ProductWeeklyDemand.__table__
+
+_INSERT_BATCH_SIZE = 1000
+
+
+def week_start_of(value: datetime) -> date:
+    """週バケットの開始日（月曜）。"""
+    d = value.date() if isinstance(value, datetime) else value
+    return d - timedelta(days=d.weekday())
+
+
+def _upsert(conn, table, keys: Dict, values: Dict, on_conflict: Dict) -> None:
+    """keys の行が無ければ keys+values で挿入し、あれば on_conflict(excluded) の値で更新する。
+
+    PostgreSQL・SQLite は INSERT ... ON CONFLICT の 1 文で行う（同じ行を同時に作っても一意制約違反にならない）。
+    それ以外の DB は UPDATE → INSERT で、INSERT が競合したらセーブポイントを戻して UPDATE し直す。
+    """
+    dialect = conn.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        stmt = dialect_insert(table).values(**keys, **values)
+        conn.execute(stmt.on_conflict_do_update(
+            index_elements=list(keys), set_=on_conflict(stmt.excluded),
+        ))
+        return
+
+    update_stmt = (
+        update(table)
+        .where(*[table.c[name] == value for name, value in keys.items()])
+        .values(on_conflict(_Literal(values)))
+    )
+    if conn.execute(update_stmt).rowcount:
+        return
+    try:
+        with conn.begin_nested():
+            conn.execute(insert(table).values(**keys, **values))
+    except IntegrityError:
+        # 他のトランザクションが先に行を作った
+        conn.execute(update_stmt)
+
+
+class _Literal:
+    """on_conflict に excluded の代わりに渡す（excluded.列名 -> 挿入しようとした値）。"""
+
+    def __init__(self, values: Dict):
+        self._values = values
+
+    def __getattr__(self, name: str):
+        try:
+            return self._values[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+def _apply_delta(conn, product_id: int, count: int, qty_sum: int, qty_sq_sum: int,
+                 first: datetime, last: datetime) -> None:
+    _upsert(
+        conn, _STATS,
+        {'product_id': product_id},
+        {'order_count': count, 'quantity_sum': qty_sum, 'quantity_sq_sum': qty_sq_sum,
+         'first_order_date': first, 'last_order_date': last},
+        lambda new: {
+            'order_count': _STATS.c.order_count + new.order_count,
+            'quantity_sum': _STATS.c.quantity_sum + new.quantity_sum,
+            'quantity_sq_sum': _STATS.c.quantity_sq_sum + new.quantity_sq_sum,
+            'first_order_date': case(
+                (_STATS.c.first_order_date.is_(None), new.first_order_date),
+                (_STATS.c.first_order_date > new.first_order_date, new.first_order_date),
+                else_=_STATS.c.first_order_date,
+            ),
+            'last_order_date': case(
+                (_STATS.c.last_order_date.is_(None), new.last_order_date),
+                (_STATS.c.last_order_date < new.last_order_date, new.last_order_date),
+                else_=_STATS.c.last_order_date,
+            ),
+        },
+    )
+
+
+def _apply_weekly_delta(conn, product_id: int, week: date, count: int, qty: int) -> None:
+    _upsert(
+        conn, _WEEKLY,
+        {'product_id': product_id, 'week_start': week},
+        {'order_count': count, 'quantity': qty},
+        lambda new: {
+            'order_count': _WEEKLY.c.order_count + new.order_count,
+            'quantity': _WEEKLY.c.quantity + new.quantity,
+        },
+    )
+
+
+def record_orders(conn, orders: Iterable[Tuple[int, int, datetime]]) -> None:
+    """(product_id, quantity, order_date) の列を集計へ加算する。"""
+    per_product: Dict[int, List] = {}
+    per_week: Dict[Tuple[int, date], List[int]] = defaultdict(lambda: [0, 0])
+    for product_id, quantity, order_date in orders:
+        quantity = int(quantity or 0)
+        order_date = order_date or datetime.utcnow()
+        agg = per_product.get(product_id)
+        if agg is None:
+            per_product[product_id] = [1, quantity, quantity * quantity, order_date, order_date]
+        else:
+            agg[0] += 1
+            agg[1] += quantity
+            agg[2] += quantity * quantity
+            agg[3] = min(agg[3], order_date)
+            agg[4] = max(agg[4], order_date)
+        bucket = per_week[(product_id, week_start_of(order_date))]
+        bucket[0] += 1
+        bucket[1] += quantity
+    for product_id, (count, qty_sum, qty_sq_sum, first, last) in per_product.items():
+        _apply_delta(conn, product_id, count, qty_sum, qty_sq_sum, first, last)
+    for (product_id, week), (count, qty) in per_week.items():
+        _apply_weekly_delta(conn, product_id, week, count, qty)
+
+
+_PENDING_REFRESH = "order_stats_pending_refresh"
+# 集計に影響する列（dealer などの変更は集計し直さない）
+_STATS_COLUMNS = ('product_id', 'quantity', 'order_date')
+
+
+def _before_flush(session, flush_context, instances) -> None:
+    # 変更・削除された注文の商品（付け替え前後の両方）を、行がまだ DB にあるうちに控える
+    affected = set()
+    for obj in session.deleted:
+        if isinstance(obj, OrderHistory):
+            affected.add(obj.product_id)
+    for obj in session.dirty:
+        if not isinstance(obj, OrderHistory):
+            continue
+        attrs = inspect(obj).attrs
+        if not any(attrs[name].history.has_changes() for name in _STATS_COLUMNS):
+            continue
+        affected.add(obj.product_id)
+        affected.update(attrs.product_id.history.deleted)
+    affected.discard(None)
+    if affected:
+        session.info.setdefault(_PENDING_REFRESH, set()).update(affected)
+
+
+def _after_flush(session, flush_context) -> None:
+    refresh_ids = session.info.pop(_PENDING_REFRESH, set())
+    if refresh_ids:
+        # 変更・削除は差分にできないので、該当商品を flush 後の履歴から集計し直す（新規の注文も含まれる）
+        refresh_order_stats(sorted(refresh_ids))
+    new_orders = [
+        obj for obj in session.new
+        if isinstance(obj, OrderHistory) and obj.product_id not in refresh_ids
+    ]
+    if not new_orders:
+        return
+    record_orders(
+        session.connection(),
+        ((o.product_id, o.quantity, o.order_date) for o in new_orders),
+    )
+
+
+def delete_order_stats(product_ids: Optional[List[int]] = None) -> None:
+    """集計を削除する（product_ids=None なら全件）。"""
+    stats_stmt = delete(_STATS)
+    weekly_stmt = delete(_WEEKLY)
+    if product_ids is not None:
+        if not product_ids:
+            return
+        stats_stmt = stats_stmt.where(_STATS.c.product_id.in_(product_ids))
+        weekly_stmt = weekly_stmt.where(_WEEKLY.c.product_id.in_(product_ids))
+    db.session.execute(stats_stmt)
+    db.session.execute(weekly_stmt)
+
+
+def refresh_order_stats(product_ids: Optional[List[int]] = None) -> None:
+    """OrderHistory から集計を作り直す（履歴の付け替え・削除後や初回の移行用）。コミットは呼び出し側。"""
+    delete_order_stats(product_ids)
+    if product_ids is not None and not product_ids:
+        return
+
+    oh = OrderHistory.__table__
+    summary = select(
+        oh.c.product_id,
+        func.count(oh.c.id),
+        func.coalesce(func.sum(oh.c.quantity), 0),
+        func.coalesce(func.sum(oh.c.quantity * oh.c.quantity), 0),
+        func.min(oh.c.order_date),
+        func.max(oh.c.order_date),
+    ).group_by(oh.c.product_id)
+    if product_ids is not None:
+        summary = summary.where(oh.c.product_id.in_(product_ids))
+    db.session.execute(
+        insert(_STATS).from_select(
+            ['product_id', 'order_count', 'quantity_sum', 'quantity_sq_sum',
+             'first_order_date', 'last_order_date'],
+            summary,
+        )
+    )
+
+    # 週の切り捨ては DB ごとに書き方が違うため、週次バケットは履歴を順に読んで作る
+    rows = select(oh.c.product_id, oh.c.order_date, oh.c.quantity)
+    if product_ids is not None:
+        rows = rows.where(oh.c.product_id.in_(product_ids))
+    buckets: Dict[Tuple[int, date], List[int]] = defaultdict(lambda: [0, 0])
+    for product_id, order_date, quantity in db.session.execute(
+        rows.execution_options(yield_per=10_000)
+    ):
+        bucket = buckets[(product_id, week_start_of(order_date or datetime.utcnow()))]
+        bucket[0] += 1
+        bucket[1] += int(quantity or 0)
+    payload = [
+        {'product_id': pid, 'week_start': week, 'order_count': c, 'quantity': q}
+        for (pid, week), (c, q) in buckets.items()
+    ]
+    for i in range(0, len(payload), _INSERT_BATCH_SIZE):
+        db.session.execute(insert(_WEEKLY), payload[i:i + _INSERT_BATCH_SIZE])
+
+
+def ensure_order_stats() -> None:
+    """起動時: 集計が空で履歴がある場合（既存 DB の移行）だけ全件作り直す。"""
+    has_stats = db.session.execute(select(_STATS.c.product_id).limit(1)).first()
+    has_orders = db.session.execute(select(OrderHistory.id).limit(1)).first()
+    if has_orders and not has_stats:
+        refresh_order_stats()
+        db.session.commit()
+
+
+def register_order_stats_hooks() -> None:
+    """db.session にイベントを登録（create_app から 1 回だけ呼ぶ）。"""
+    session = db.session
+    if event.contains(session, "after_flush", _after_flush):
+        return
+    event.listen(session, "before_flush", _before_flush)
+    event.listen(session, "after_flush", _after_flush)
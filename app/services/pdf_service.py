@@ -1,7 +1,10 @@
 import os
 import io
+import tempfile
+import threading
 from reportlab.lib.pagesizes import A4, landscape
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+from reportlab.pdfgen.canvas import Canvas
+from reportlab.platypus import Frame, SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
 from reportlab.lib import colors
@@ -9,34 +12,177 @@ from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.pdfbase.cidfonts import UnicodeCIDFont
 from app.models.inventory import Product
+from app.services.stock_alert_service import get_stock_alerts
 from app import db
 from datetime import datetime
 
+_URGENCY_LABELS = {'high': '高', 'medium': '中', 'low': '低'}
+
+# 表ヘッダー・本文で共通のスタイル（レポートごとに作り直さない）
+_ALERT_HEADER_COMMANDS = [
+    ('BACKGROUND', (0, 0), (-1, 0), colors.darkred),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+]
+
+# 棚卸し表（縦長A4に合わせた列幅）
+_INVENTORY_COUNT_HEADER = ('カテゴリ', '商品名', '金額（円）', '数量', '合計金額（円）')
+_INVENTORY_COUNT_COL_WIDTHS = [0.9*inch, 2.4*inch, 0.9*inch, 0.7*inch, 1.2*inch]
+# 分割描画時に 1 ページへ載せる商品行数（ヘッダー・小計・累計行を含めて A4 縦に収まる数）
+INVENTORY_COUNT_ROWS_PER_PAGE = 30
+# 分割描画の出力をメモリに保持する上限（超えたら一時ファイルへ退避）
+_SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+
+def _draw_pages(canvas, flowables):
+    """flowables を SimpleDocTemplate と同じ余白の枠に描き、ページが埋まるたびに改ページする。
+
+    枠に収まらない表は分割し、残りを次のページへ送る。
+    """
+    width, height = canvas._pagesize
+    while flowables:
+        frame = Frame(inch, inch, width - 2 * inch, height - 2 * inch)
+        drawn = False
+        while flowables:
+            if frame.add(flowables[0], canvas, trySplit=0):
+                flowables.pop(0)
+                drawn = True
+                continue
+            parts = frame.split(flowables[0], canvas)
+            if parts:
+                flowables[0:1] = parts
+                if frame.add(flowables[0], canvas, trySplit=0):
+                    flowables.pop(0)
+                    drawn = True
+            break
+        if not drawn:
+            raise ValueError("1 ページに収まらない要素があります")
+        canvas.showPage()
+
+
+class _RendererContext:
+    """フォント登録・段落スタイル・基本テーブルスタイルをワーカー内で 1 回だけ用意する。"""
+
+    def __init__(self):
+        try:
+            # 日本語フォントを登録
+            pdfmetrics.registerFont(UnicodeCIDFont('HeiseiMin-W3'))
+            font_name = 'HeiseiMin-W3'
+        except Exception:
+            # フォールバック: デフォルトフォントを使用
+            font_name = 'Helvetica'
+        self.font_name = font_name
+
+        styles = getSampleStyleSheet()
+        self.title_style_large = ParagraphStyle(
+            'CustomTitleLarge',
+            parent=styles['Heading1'],
+            fontSize=18,
+            spaceAfter=30,
+            alignment=1,  # 中央揃え
+            fontName=font_name
+        )
+        self.title_style = ParagraphStyle(
+            'CustomTitle',
+            parent=styles['Heading1'],
+            fontSize=16,
+            spaceAfter=20,
+            alignment=1,
+            fontName=font_name
+        )
+
+        self.stats_table_style = TableStyle(_ALERT_HEADER_COMMANDS + [
+            ('FONTNAME', (0, 0), (-1, 0), font_name),
+            ('FONTSIZE', (0, 0), (-1, 0), 12),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.lightcoral),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black)
+        ])
+        self.inventory_table_style = TableStyle(_ALERT_HEADER_COMMANDS + [
+            ('FONTNAME', (0, 0), (-1, 0), font_name),
+            ('FONTSIZE', (0, 0), (-1, 0), 10),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.white),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black),
+            ('FONTSIZE', (0, 1), (-1, -1), 8),
+            ('FONTNAME', (0, 1), (-1, -1), font_name),
+            ('ALIGN', (2, 1), (2, -1), 'RIGHT'),  # 単価を右揃え
+            ('ALIGN', (3, 1), (4, -1), 'CENTER'),  # 在庫数を中央揃え
+        ])
+        # 緊急度による行の色分けを追加するため、アラート表は parent として使い都度コピーする
+        self.alerts_table_style = TableStyle(_ALERT_HEADER_COMMANDS + [
+            ('FONTNAME', (0, 0), (-1, 0), font_name),
+            ('FONTSIZE', (0, 0), (-1, 0), 10),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.white),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black),
+            ('FONTSIZE', (0, 1), (-1, -1), 9),
+            ('FONTNAME', (0, 1), (-1, -1), font_name),
+        ])
+        self.count_table_style = TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2a2a2a')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('ALIGN', (2, 0), (-1, -1), 'RIGHT'),
+            ('FONTNAME', (0, 0), (-1, -1), font_name),
+            ('FONTSIZE', (0, 0), (-1, 0), 10),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
+            ('BACKGROUND', (0, 1), (-1, -2), colors.white),
+            ('FONTSIZE', (0, 1), (-1, -2), 9),
+            ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#e0e0e0')),
+            ('FONTSIZE', (0, -1), (-1, -1), 9),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+        ])
+        # 分割描画用: 末尾 2 行（小計・累計）を網掛け
+        self.count_chunk_table_style = TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2a2a2a')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('ALIGN', (2, 0), (-1, -1), 'RIGHT'),
+            ('FONTNAME', (0, 0), (-1, -1), font_name),
+            ('FONTSIZE', (0, 0), (-1, 0), 10),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
+            ('BACKGROUND', (0, 1), (-1, -3), colors.white),
+            ('FONTSIZE', (0, 1), (-1, -1), 9),
+            ('BACKGROUND', (0, -2), (-1, -1), colors.HexColor('#e0e0e0')),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+        ])
+
+
+_renderer_context = None
+_renderer_context_lock = threading.Lock()
+
+
+def get_renderer_context():
+    """ワーカー内で共有する描画コンテキストを返す（初回のみ生成）。"""
+    global _renderer_context
+    if _renderer_context is None:
+        with _renderer_context_lock:
+            if _renderer_context is None:
+                _renderer_context = _RendererContext()
+    return _renderer_context
+
+
 class PDFService:
     @staticmethod
     def export_inventory_pdf(dealer='', sort_by='product_name', sort_order='asc'):
         """在庫不足商品のみをPDF形式でエクスポート"""
         try:
-            # 在庫不足商品のみを取得
-            query = Product.query.filter(Product.current_stock < Product.min_quantity)
-            if dealer:
-                query = query.filter(Product.dealer == dealer)
+            # 在庫不足商品のみを取得（差分更新しているアラート一覧から読む）
+            alerts = get_stock_alerts(dealer)
             
             # ソートを適用
+            reverse = sort_order == 'desc'
             if sort_by == 'shortage':
-                # 不足数は計算値なので、min_quantity - current_stockでソート
-                if sort_order == 'desc':
-                    query = query.order_by((Product.min_quantity - Product.current_stock).desc())
-                else:
-                    query = query.order_by((Product.min_quantity - Product.current_stock).asc())
-            elif hasattr(Product, sort_by):
-                column = getattr(Product, sort_by)
-                if sort_order == 'desc':
-                    query = query.order_by(column.desc())
-                else:
-                    query = query.order_by(column.asc())
+                alerts.sort(key=lambda pa: pa[1].shortage, reverse=reverse)
+            elif sort_by in Product.__table__.c:
+                def _key(pa):
+                    value = getattr(pa[0], sort_by)
+                    # NULL は昇順で先頭（SQLite の並びに合わせる）
+                    return (value is not None, value if value is not None else '')
+                alerts.sort(key=_key, reverse=reverse)
             
-            products = query.all()
+            products = [product for product, _ in alerts]
             
             if not products:
                 return False, "在庫不足の商品はありません"
@@ -48,39 +194,22 @@ class PDFService:
             doc = SimpleDocTemplate(buffer, pagesize=landscape(A4))
             story = []
             
-            # 日本語フォントの設定
-            try:
-                # 日本語フォントを登録
-                pdfmetrics.registerFont(UnicodeCIDFont('HeiseiMin-W3'))
-                font_name = 'HeiseiMin-W3'
-            except:
-                # フォールバック: デフォルトフォントを使用
-                font_name = 'Helvetica'
-            
-            # スタイル設定
-            styles = getSampleStyleSheet()
-            title_style = ParagraphStyle(
-                'CustomTitle',
-                parent=styles['Heading1'],
-                fontSize=18,
-                spaceAfter=30,
-                alignment=1,  # 中央揃え
-                fontName=font_name
-            )
+            ctx = get_renderer_context()
             
             # タイトル
             title_text = f"在庫不足レポート"
             if dealer:
                 title_text += f" - {dealer}"
-            title_text += f" ({datetime.now().strftime('%Y年%m月%d日 %H:%M')})"
+            # 生成した PDF は日付ごとにキャッシュするため、時刻は入れない
+            title_text += f" ({datetime.now().strftime('%Y年%m月%d日')})"
             
-            story.append(Paragraph(title_text, title_style))
+            story.append(Paragraph(title_text, ctx.title_style_large))
             story.append(Spacer(1, 20))
             
             # 統計情報
             total_products = len(products)
-            total_shortage = sum(p.min_quantity - p.current_stock for p in products)
-            high_urgency = sum(1 for p in products if (p.min_quantity - p.current_stock) > 10)
+            total_shortage = sum(alert.shortage for _, alert in alerts)
+            high_urgency = sum(1 for _, alert in alerts if alert.urgency == 'high')
             
             stats_data = [
                 ['在庫不足商品数', '総不足数', '高緊急度商品数'],
@@ -88,16 +217,7 @@ class PDFService:
             ]
             
             stats_table = Table(stats_data, colWidths=[2*inch, 2*inch, 2*inch])
-            stats_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.darkred),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, 0), font_name),
-                ('FONTSIZE', (0, 0), (-1, 0), 12),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.lightcoral),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black)
-            ]))
+            stats_table.setStyle(ctx.stats_table_style)
             
             story.append(stats_table)
             story.append(Spacer(1, 20))
@@ -105,15 +225,14 @@ class PDFService:
             # 在庫不足商品テーブル
             table_data = [['メーカー', '商品名', '単価', '現在在庫', '最低必要数', '不足数', '取引先']]
             
-            for product in products:
-                shortage = product.min_quantity - product.current_stock
+            for product, alert in alerts:
                 row = [
                     product.manufacturer or '-',
                     product.product_name,
                     f'¥{product.unit_price:,.0f}' if product.unit_price else '-',
                     str(product.current_stock),
                     str(product.min_quantity) if product.min_quantity else '-',
-                    str(shortage),
+                    str(alert.shortage),
                     product.dealer or '-'
                 ]
                 table_data.append(row)
@@ -121,23 +240,7 @@ class PDFService:
             # テーブル作成
             inventory_table = Table(table_data, colWidths=[1.5*inch, 2.5*inch, 1*inch, 1*inch, 1*inch, 1*inch, 1.5*inch])
             
-            # テーブルスタイル設定
-            table_style = TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.darkred),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, 0), font_name),
-                ('FONTSIZE', (0, 0), (-1, 0), 10),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                ('FONTSIZE', (0, 1), (-1, -1), 8),
-                ('FONTNAME', (0, 1), (-1, -1), font_name),
-                ('ALIGN', (2, 1), (2, -1), 'RIGHT'),  # 単価を右揃え
-                ('ALIGN', (3, 1), (4, -1), 'CENTER'),  # 在庫数を中央揃え
-            ])
-            
-            inventory_table.setStyle(table_style)
+            inventory_table.setStyle(ctx.inventory_table_style)
             story.append(inventory_table)
             
             # PDF生成
@@ -155,12 +258,8 @@ class PDFService:
     def export_alerts_pdf(dealer=''):
         """在庫不足アラートをPDF形式でエクスポート"""
         try:
-            # 在庫不足商品を取得
-            query = Product.query.filter(Product.current_stock < Product.min_quantity)
-            if dealer:
-                query = query.filter(Product.dealer == dealer)
-            
-            low_stock_products = query.all()
+            # 在庫不足商品を取得（不足数・緊急度は計算済み）
+            low_stock_products = get_stock_alerts(dealer)
             
             if not low_stock_products:
                 return False, "在庫不足の商品はありません"
@@ -172,25 +271,7 @@ class PDFService:
             doc = SimpleDocTemplate(buffer, pagesize=A4)
             story = []
             
-            # 日本語フォントの設定
-            try:
-                # 日本語フォントを登録
-                pdfmetrics.registerFont(UnicodeCIDFont('HeiseiMin-W3'))
-                font_name = 'HeiseiMin-W3'
-            except:
-                # フォールバック: デフォルトフォントを使用
-                font_name = 'Helvetica'
-            
-            # スタイル設定
-            styles = getSampleStyleSheet()
-            title_style = ParagraphStyle(
-                'CustomTitle',
-                parent=styles['Heading1'],
-                fontSize=16,
-                spaceAfter=20,
-                alignment=1,
-                fontName=font_name
-            )
+            ctx = get_renderer_context()
             
             # タイトル
             title_text = f"在庫不足アラートレポート"
@@ -198,50 +279,35 @@ class PDFService:
                 title_text += f" - {dealer}"
             title_text += f" ({datetime.now().strftime('%Y年%m月%d日 %H:%M')})"
             
-            story.append(Paragraph(title_text, title_style))
+            story.append(Paragraph(title_text, ctx.title_style))
             story.append(Spacer(1, 20))
             
             # アラート一覧テーブル
             table_data = [['商品名', 'メーカー', '現在在庫', '最低必要数', '不足数', '取引先', '緊急度']]
             
-            for product in low_stock_products:
-                shortage = product.min_quantity - product.current_stock
-                urgency = '高' if shortage > 10 else '中' if shortage > 5 else '低'
-                
+            for product, alert in low_stock_products:
                 row = [
                     product.product_name,
                     product.manufacturer or '-',
                     str(product.current_stock),
                     str(product.min_quantity),
-                    str(shortage),
+                    str(alert.shortage),
                     product.dealer or '-',
-                    urgency
+                    _URGENCY_LABELS[alert.urgency]
                 ]
                 table_data.append(row)
             
             # テーブル作成
             alerts_table = Table(table_data, colWidths=[2*inch, 1.5*inch, 1*inch, 1*inch, 1*inch, 1.5*inch, 0.8*inch])
             
-            # テーブルスタイル設定
-            table_style = TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.darkred),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, 0), font_name),
-                ('FONTSIZE', (0, 0), (-1, 0), 10),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                ('FONTSIZE', (0, 1), (-1, -1), 9),
-                ('FONTNAME', (0, 1), (-1, -1), font_name),
-            ])
+            # テーブルスタイル設定（共通スタイルを元に行の色分けだけ追加）
+            table_style = TableStyle(parent=ctx.alerts_table_style)
             
             # 緊急度による行の色分け
-            for i, product in enumerate(low_stock_products, start=1):
-                shortage = product.min_quantity - product.current_stock
-                if shortage > 10:
+            for i, (_, alert) in enumerate(low_stock_products, start=1):
+                if alert.urgency == 'high':
                     table_style.add('BACKGROUND', (0, i), (-1, i), colors.lightcoral)
-                elif shortage > 5:
+                elif alert.urgency == 'medium':
                     table_style.add('BACKGROUND', (0, i), (-1, i), colors.lightyellow)
             
             alerts_table.setStyle(table_style)
@@ -259,24 +325,36 @@ class PDFService:
             return False, f"アラートPDFエクスポートエラー: {str(e)}"
 
     @staticmethod
-    def export_inventory_count_pdf(dealer='', sort_by='product_name', sort_order='asc'):
-        """棚卸し表（カテゴリ・金額・数量・合計金額）をPDFでエクスポート"""
+    def _inventory_count_query(dealer='', sort_by='product_name', sort_order='asc'):
+        """棚卸し表の対象商品クエリ（システム管理用ダミー商品を除外）"""
+        query = Product.query.filter(
+            db.not_(db.and_(
+                Product.product_name.like('取引会社管理用_%'),
+                Product.manufacturer == 'システム'
+            )),
+            db.not_(db.and_(
+                Product.product_name.like('カテゴリ管理用_%'),
+                Product.manufacturer == 'システム'
+            ))
+        )
+        if dealer:
+            query = query.filter(Product.dealer == dealer)
+        if hasattr(Product, sort_by):
+            col = getattr(Product, sort_by)
+            query = query.order_by(col.desc() if sort_order == 'desc' else col.asc())
+        return query
+
+    @staticmethod
+    def export_inventory_count_pdf(dealer='', sort_by='product_name', sort_order='asc', rows_per_page=None):
+        """棚卸し表（カテゴリ・金額・数量・合計金額）をPDFでエクスポート
+
+        rows_per_page を指定するとページ単位の表（ヘッダー・小計・累計付き）に分割して描画し、
+        結果はメモリではなく一時ファイル（SpooledTemporaryFile）に書き出す。
+        """
+        if rows_per_page:
+            return PDFService._export_inventory_count_pdf_chunked(dealer, sort_by, sort_order, rows_per_page)
         try:
-            query = Product.query.filter(
-                db.not_(db.and_(
-                    Product.product_name.like('取引会社管理用_%'),
-                    Product.manufacturer == 'システム'
-                )),
-                db.not_(db.and_(
-                    Product.product_name.like('カテゴリ管理用_%'),
-                    Product.manufacturer == 'システム'
-                ))
-            )
-            if dealer:
-                query = query.filter(Product.dealer == dealer)
-            if hasattr(Product, sort_by):
-                col = getattr(Product, sort_by)
-                query = query.order_by(col.desc() if sort_order == 'desc' else col.asc())
+            query = PDFService._inventory_count_query(dealer, sort_by, sort_order)
             products = query.all()
 
             if not products:
@@ -286,28 +364,14 @@ class PDFService:
             doc = SimpleDocTemplate(buffer, pagesize=A4)  # 縦長
             story = []
 
-            try:
-                pdfmetrics.registerFont(UnicodeCIDFont('HeiseiMin-W3'))
-                font_name = 'HeiseiMin-W3'
-            except Exception:
-                font_name = 'Helvetica'
-
-            styles = getSampleStyleSheet()
-            title_style = ParagraphStyle(
-                'CustomTitle',
-                parent=styles['Heading1'],
-                fontSize=16,
-                spaceAfter=20,
-                alignment=1,
-                fontName=font_name
-            )
+            ctx = get_renderer_context()
             title_text = "棚卸し表（在庫状況一覧）"
             if dealer:
                 title_text += f" - {dealer}"
-            story.append(Paragraph(title_text, title_style))
+            story.append(Paragraph(title_text, ctx.title_style))
             story.append(Spacer(1, 16))
 
-            table_data = [['カテゴリ', '商品名', '金額（円）', '数量', '合計金額（円）']]
+            table_data = [list(_INVENTORY_COUNT_HEADER)]
             total_qty = 0
             total_amount = 0
             for p in products:
@@ -323,26 +387,91 @@ class PDFService:
                 ])
             table_data.append(['', '', '', '合計', f'{total_amount:,.0f}'])
 
-            # 縦長A4に合わせた列幅
-            col_widths = [0.9*inch, 2.4*inch, 0.9*inch, 0.7*inch, 1.2*inch]
-            tbl = Table(table_data, colWidths=col_widths)
-            tbl.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2a2a2a')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('ALIGN', (2, 0), (-1, -1), 'RIGHT'),
-                ('FONTNAME', (0, 0), (-1, -1), font_name),
-                ('FONTSIZE', (0, 0), (-1, 0), 10),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
-                ('BACKGROUND', (0, 1), (-1, -2), colors.white),
-                ('FONTSIZE', (0, 1), (-1, -2), 9),
-                ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#e0e0e0')),
-                ('FONTSIZE', (0, -1), (-1, -1), 9),
-                ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
-            ]))
+            tbl = Table(table_data, colWidths=_INVENTORY_COUNT_COL_WIDTHS)
+            tbl.setStyle(ctx.count_table_style)
             story.append(tbl)
             doc.build(story)
             buffer.seek(0)
             return True, buffer
         except Exception as e:
             return False, f"棚卸し表PDFエクスポートエラー: {str(e)}"
+
+    @staticmethod
+    def _export_inventory_count_pdf_chunked(dealer, sort_by, sort_order, rows_per_page):
+        """棚卸し表をページ単位の小さな表で描画する（大量商品向け）。
+
+        巨大な 1 枚の Table を分割させると ReportLab の分割処理が重くなるため、
+        1 ページに収まる行数ごとに表を作り、ヘッダーを繰り返して小計・累計を付ける。
+        商品は ORM オブジェクトにせず必要な列だけを yield_per で順次読み込む。
+        表は作ったその場でキャンバスに描いて捨てる（story に溜めない）ため、Python オブジェクトは
+        1 ページ分しか保持しない。ただし ReportLab は PDF の末尾（相互参照表）を書くまで出力できないため、
+        圧縮済みのページ内容は保存（save）まで文書内に残り、送信は全ページの描画後になる。
+        """
+        output = None
+        try:
+            query = PDFService._inventory_count_query(dealer, sort_by, sort_order).with_entities(
+                Product.category,
+                Product.product_name,
+                Product.unit_price,
+                Product.current_stock,
+            ).execution_options(yield_per=1000)
+
+            output = tempfile.SpooledTemporaryFile(max_size=_SPOOL_MAX_SIZE)
+            canvas = Canvas(output, pagesize=A4)  # 縦長
+
+            ctx = get_renderer_context()
+            title_text = "棚卸し表（在庫状況一覧）"
+            if dealer:
+                title_text += f" - {dealer}"
+            # 1 ページ目だけ表の前にタイトルを置く
+            pending = [Paragraph(title_text, ctx.title_style), Spacer(1, 16)]
+
+            total_qty = 0
+            total_amount = 0
+            chunk_rows = []
+            chunk_qty = 0
+            chunk_amount = 0
+
+            def flush_chunk(is_last):
+                label = '合計' if is_last else '累計'
+                table_data = [list(_INVENTORY_COUNT_HEADER)] + chunk_rows + [
+                    ['', '', '小計', str(chunk_qty), f'{chunk_amount:,.0f}'],
+                    ['', '', label, str(total_qty), f'{total_amount:,.0f}'],
+                ]
+                tbl = Table(table_data, colWidths=_INVENTORY_COUNT_COL_WIDTHS, repeatRows=1)
+                tbl.setStyle(ctx.count_chunk_table_style)
+                flowables = pending + [tbl]
+                pending.clear()
+                _draw_pages(canvas, flowables)
+
+            for category, product_name, unit_price, current_stock in query:
+                if len(chunk_rows) >= rows_per_page:
+                    flush_chunk(False)
+                    chunk_rows = []
+                    chunk_qty = 0
+                    chunk_amount = 0
+                amount = (unit_price or 0) * (current_stock or 0)
+                chunk_qty += (current_stock or 0)
+                chunk_amount += amount
+                total_qty += (current_stock or 0)
+                total_amount += amount
+                chunk_rows.append([
+                    (category or '-'),
+                    (product_name or '-'),
+                    f'{(unit_price or 0):,.0f}',
+                    str(current_stock or 0),
+                    f'{amount:,.0f}'
+                ])
+
+            if not chunk_rows:
+                output.close()
+                return False, "対象の商品がありません"
+            flush_chunk(True)
+
+            canvas.save()
+            output.seek(0)
+            return True, output
+        except Exception as e:
+            if output is not None:
+                output.close()
+            return False, f"棚卸し表PDFエクスポートエラー: {str(e)}"
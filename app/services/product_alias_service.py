@@ -5,7 +5,7 @@ from typing import Any, List, Optional
 
 from app import db
 from app.models.inventory import Product, ProductAlias
-from app.services.product_matching import normalize_product_name
+from app.services.product_matching import ProductMatcher, normalize_product_name
 
 _MAX_ALIAS_LEN = 200
 
@@ -41,6 +41,13 @@ def register_import_name(product: Product, import_name: str, source: str) -> Non
     ensure_alias(product, import_name, source)
 
 
+def register_import_name_with(matcher: ProductMatcher, product: Product, import_name: str, source: str) -> None:
+    """register_import_name の一括取込用。既存の名称は DB ではなく照合器が持つ名称で判定し、照合器にも反映する。"""
+    name = (import_name or "").strip()[:_MAX_ALIAS_LEN]
+    if name and matcher.add_name(product, name):
+        db.session.add(ProductAlias(product=product, alias_name=name, source=source or None))
+
+
 def on_product_renamed(product: Product, old_name: str, new_name: str) -> None:
     """手動で商品名変更したとき、旧名称をエイリアスに保存（PDF/CSV 照合用）。"""
     old = (old_name or "").strip()[:_MAX_ALIAS_LEN]
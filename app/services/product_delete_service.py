@@ -0,0 +1,62 @@
+"""商品の削除（依存する行もまとめて削除）。
+
+注文履歴・別名・注文集計・発注点を、商品 ID の _BATCH_SIZE 件ごとに集合の DELETE で消してから商品を消す。
+SQLite では外部キーの CASCADE が効かず、PostgreSQL では注文履歴が残っていると商品を削除できないため、
+依存行は常に明示的に削除する。在庫不足アラート・変更ログ・削除の記録は商品の書き込みフックが更新する。
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, List, Sequence
+
+from sqlalchemy import delete
+
+from app import db
+from app.models.inventory import OrderHistory, Product, ProductAlias
+from app.services.order_feature_store import delete_order_stats
+from app.services.reorder_service import delete_reorder_policies
+
+_BATCH_SIZE = 500
+
+
+def _clean_ids(product_ids: Any) -> List[int]:
+    """商品 ID のリストを検証する（文字列を渡すと 1 文字ずつの ID になるため、リスト・タプル以外は受け付けない）。"""
+    if not isinstance(product_ids, (list, tuple)):
+        raise ValueError('商品IDの形式が不正です')
+    ids = set()
+    for pid in product_ids:
+        # 画面のチェックボックスは数字の文字列で送る。true/false や小数は ID として扱わない
+        if isinstance(pid, bool) or not isinstance(pid, (int, str)):
+            raise ValueError('商品IDの形式が不正です')
+        try:
+            ids.add(int(pid))
+        except ValueError:
+            raise ValueError('商品IDの形式が不正です')
+    return sorted(ids)
+
+
+def delete_products(product_ids: Sequence[Any]) -> Dict[str, int]:
+    """商品と依存する行を削除する。コミットは呼び出し側。
+
+    Returns:
+        {'products': 削除した商品数, 'order_history': 削除した注文履歴の数, 'aliases': 削除した別名の数}
+    Raises:
+        ValueError: 商品 ID の形式が不正な場合（リスト・タプル以外を含む）
+    """
+    ids = _clean_ids(product_ids)
+
+    counts = {'products': 0, 'order_history': 0, 'aliases': 0}
+    options = {'synchronize_session': False}
+    for i in range(0, len(ids), _BATCH_SIZE):
+        chunk = ids[i:i + _BATCH_SIZE]
+        counts['order_history'] += db.session.execute(
+            delete(OrderHistory).where(OrderHistory.product_id.in_(chunk)), execution_options=options
+        ).rowcount or 0
+        counts['aliases'] += db.session.execute(
+            delete(ProductAlias).where(ProductAlias.product_id.in_(chunk)), execution_options=options
+        ).rowcount or 0
+        delete_order_stats(chunk)
+        delete_reorder_policies(chunk)
+        counts['products'] += db.session.execute(
+            delete(Product).where(Product.id.in_(chunk)), execution_options=options
+        ).rowcount or 0
+    return counts
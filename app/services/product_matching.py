@@ -3,6 +3,7 @@ from __future__ import annotations
 
 import re
 import unicodedata
+from collections import Counter
 from difflib import SequenceMatcher
 from typing import Any, Dict, List, Optional, Sequence, Tuple
 
@@ -21,13 +22,9 @@ def normalize_product_name(text: Any) -> str:
     """照合用に商品名を正規化（NFKC・空白・全角数字など）。"""
     if text is None:
         return ""
-    try:
-        import pandas as pd
-
-        if isinstance(text, float) and pd.isna(text):
-            return ""
-    except ImportError:
-        pass
+    # 欠損値（NaN）。pandas を読み込まずに判定する（NaN は自身と等しくない）
+    if isinstance(text, float) and text != text:
+        return ""
     s = str(text).strip()
     if not s or s.lower() == "nan":
         return ""
@@ -200,3 +197,117 @@ def find_best_product_match(
             return None, best_s, "ambiguous"
 
     return best_p, best_s, "fuzzy"
+
+
+class ProductMatcher:
+    """
+    取込 1 回分の照合器。判定は find_best_product_match と同じで、全商品の名称の正規化と
+    「正規化名 -> 商品」の索引を最初に 1 回だけ作って行ごとに使い回す。
+
+    完全一致は索引の参照だけで決まる。類似度は、名称ごとに前計算した文字数から求める ratio の上限
+    （SequenceMatcher.quick_ratio と同じ値）が「しきい値 - 曖昧判定の幅」に届かない名称を計算しない
+    （届かない商品は 1 位にも曖昧判定の 2 位にもならない）。
+    取込中に追加した商品・エイリアスは add_product / add_name で反映する（商品は未採番でもよい）。
+    """
+
+    def __init__(
+        self,
+        products: Sequence[Any],
+        alias_map: Dict[int, List[str]],
+        *,
+        preferred_dealer: str = "",
+        similarity_threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+        ambiguity_margin: float = DEFAULT_AMBIGUITY_MARGIN,
+    ):
+        self.preferred_dealer = preferred_dealer
+        self.similarity_threshold = similarity_threshold
+        # 上限と下限の比較で丸め誤差により候補を落とさないよう、わずかに下げておく
+        self._cutoff = similarity_threshold - ambiguity_margin - 1e-9
+        self._ambiguity_margin = ambiguity_margin
+        self._products: List[Any] = []
+        # キーは id(商品)（未採番の商品も扱うため。商品は _products が保持するので id は再利用されない）
+        self._order: Dict[int, int] = {}
+        # 商品 -> [(名称, 正規化名, 正規化名の文字ごとの数)]（正規化後に同じ名称は 1 つだけ）
+        self._names: Dict[int, List[Tuple[str, str, Counter]]] = {}
+        self._exact: Dict[str, List[Any]] = {}
+        for product in products:
+            self.add_product(product, _names_for_product(product, alias_map))
+
+    def add_product(self, product: Any, names: Optional[Sequence[str]] = None) -> None:
+        """照合対象に商品を加える（names を省略すると表示名だけ）。"""
+        self._order[id(product)] = len(self._products)
+        self._products.append(product)
+        self._names[id(product)] = []
+        if names is None:
+            names = [getattr(product, "product_name", "") or ""]
+        for name in names:
+            self.add_name(product, name)
+
+    def add_name(self, product: Any, name: str) -> bool:
+        """商品の照合名を加える。正規化後に既存の名称と同じなら加えず False。"""
+        norm = normalize_product_name(name)
+        names = self._names[id(product)]
+        if not norm or any(n == norm for _, n, _counts in names):
+            return False
+        names.append((name, norm, Counter(norm)))
+        self._exact.setdefault(norm, []).append(product)
+        return True
+
+    def _id_order(self, product: Any) -> Tuple[bool, int]:
+        # ID 順。取込中に追加した未採番の商品は採番済みの後ろに追加順で並べる
+        pid = getattr(product, "id", None)
+        return (True, self._order[id(product)]) if pid is None else (False, pid)
+
+    def match(self, candidate_name: str) -> Tuple[Optional[Any], float, str]:
+        """既存商品から最も近い 1 件（find_best_product_match と同じ (product | None, score, reason)）。
+
+        一致しない場合の score は、上限で除外しなかった名称の中での最大値（除外した場合は 0.0）。
+        """
+        cand = normalize_product_name(candidate_name)
+        if not cand:
+            return None, 0.0, "none"
+
+        exact_hits = self._exact.get(cand)
+        if exact_hits:
+            best = min(exact_hits, key=lambda p: (-dealer_tier(p, self.preferred_dealer), self._id_order(p)))
+            return best, 1.0, "exact"
+
+        matcher = SequenceMatcher(None, cand)
+        cand_counts = Counter(cand)
+        cand_len = len(cand)
+        scored: List[Tuple[Any, float, int]] = []
+        for product in self._products:
+            best_sim, best_name = 0.0, ""
+            for name, norm, counts in self._names[id(product)]:
+                total = cand_len + len(norm)
+                if 2.0 * min(cand_len, len(norm)) < self._cutoff * total:
+                    continue
+                common = sum(min(n, cand_counts[ch]) for ch, n in counts.items())
+                if 2.0 * common < self._cutoff * total:
+                    continue
+                matcher.set_seq2(norm)
+                sim = float(matcher.ratio())
+                if sim > best_sim:
+                    best_sim, best_name = sim, name
+            if best_sim <= 0:
+                continue
+            if best_sim < 1.0 and has_variant_token_conflict(candidate_name, best_name):
+                continue
+            scored.append((product, best_sim, dealer_tier(product, self.preferred_dealer)))
+
+        if not scored:
+            return None, 0.0, "none"
+
+        scored.sort(key=lambda x: (-x[1], -x[2], self._id_order(x[0])))
+        best_p, best_s, best_tier = scored[0]
+        if best_s < self.similarity_threshold:
+            return None, best_s, "none"
+
+        if len(scored) >= 2:
+            _p2, second_s, second_tier = scored[1]
+            if best_s - second_s < self._ambiguity_margin:
+                if best_tier > second_tier:
+                    return best_p, best_s, "fuzzy"
+                return None, best_s, "ambiguous"
+
+        return best_p, best_s, "fuzzy"
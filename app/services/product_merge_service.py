@@ -2,14 +2,47 @@
 from __future__ import annotations
 
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from sqlalchemy import Column, Index, Integer, MetaData, Table, case, delete, func, insert, not_, select, update
 
 from app import db
-from app.models.inventory import OrderHistory, Product
-from app.services.product_alias_service import ensure_alias
+from app.models.inventory import OrderHistory, Product, ProductAlias
+from app.services.inventory_page_service import visible_product_filter
+from app.services.order_feature_store import refresh_order_stats
+from app.services.product_delete_service import delete_products
+from app.services.product_matching import normalize_product_name
+from app.services.reorder_service import delete_reorder_policies
+
+_MAX_ALIAS_LEN = 200
+# 一括統合で IN 句・executemany に渡す件数の上限
+_BATCH_SIZE = 1000
+
+# 採用元を指定できる項目
+MERGE_FIELDS = ("manufacturer", "product_name", "unit_price", "dealer")
+
+# 一括統合用の一時テーブル（接続ごと・create_all の対象外）
+_temp_metadata = MetaData()
+# 統合元 ID -> 残す ID
+_merge_map = Table(
+    "tmp_product_merge_map",
+    _temp_metadata,
+    Column("loser_id", Integer, primary_key=True),
+    Column("keep_id", Integer, nullable=False),
+    Index("ix_tmp_product_merge_map_keep_id", "keep_id"),
+    prefixes=["TEMPORARY"],
+)
+# 残す商品ごとの各項目の採用元 ID
+_merge_fields = Table(
+    "tmp_product_merge_fields",
+    _temp_metadata,
+    Column("keep_id", Integer, primary_key=True),
+    *[Column(f"{name}_from", Integer, nullable=False) for name in MERGE_FIELDS],
+    prefixes=["TEMPORARY"],
+)
 
 
-def _is_system_dummy(product: Product) -> bool:
+def _is_system_dummy(product: Any) -> bool:
     if product.manufacturer != "システム":
         return False
     name = product.product_name or ""
@@ -26,68 +59,329 @@ def merge_products(
     keep_product_id: Optional[int] = None,
 ) -> Product:
     """
-    2〜3 件の商品を 1 件に統合する。
+    2 件以上の商品を 1 件に統合する（merge_product_groups の 1 グループ版）。
     採用するメーカー・商品名・単価・取引会社は呼び出し側で商品 ID を指定する。
     在庫数は合算。統合元の商品名とエイリアスは残存商品へ引き継ぐ。
     """
-    unique_ids = list(dict.fromkeys(product_ids))
-    if len(unique_ids) < 2 or len(unique_ids) > 3:
-        raise ValueError("統合する商品は 2 件または 3 件を選択してください")
-
-    field_sources = {
-        "manufacturer": manufacturer_from,
-        "product_name": product_name_from,
-        "unit_price": unit_price_from,
-        "dealer": dealer_from,
+    result = merge_product_groups([{
+        'product_ids': product_ids,
+        'keep_product_id': keep_product_id,
+        'manufacturer_from': manufacturer_from,
+        'product_name_from': product_name_from,
+        'unit_price_from': unit_price_from,
+        'dealer_from': dealer_from,
+    }])[0]
+    if not result['success']:
+        raise ValueError(result['error'])
+    db.session.commit()
+    return db.session.get(Product, result['product_id'])
+
+
+def find_exact_duplicate_groups(system_dummies: bool = False) -> List[Dict[str, Any]]:
+    """商品名・メーカー・取引会社が完全一致する商品の組（取引会社未設定は 1 つの組として扱う）。
+
+    システム管理用ダミー商品は統合できないため既定では除き、system_dummies=True のときはダミー商品だけの組を返す。
+    group_concat は PostgreSQL に無いため、ウィンドウ関数で組ごとの件数を付けて 1 回の走査で ID を取得し、Python でまとめる。
+    """
+    dealer_key = func.coalesce(Product.dealer, '')
+    visible = visible_product_filter()
+    counted = select(
+        Product.id.label('id'),
+        Product.product_name.label('product_name'),
+        Product.manufacturer.label('manufacturer'),
+        dealer_key.label('dealer'),
+        func.count().over(partition_by=(Product.product_name, Product.manufacturer, dealer_key)).label('n'),
+    ).where(not_(visible) if system_dummies else visible).subquery()
+    rows = db.session.execute(
+        select(counted.c.id, counted.c.product_name, counted.c.manufacturer, counted.c.dealer)
+        .where(counted.c.n > 1)
+        .order_by(counted.c.product_name, counted.c.manufacturer, counted.c.dealer, counted.c.id)
+    ).all()
+
+    groups: Dict[tuple, List[int]] = {}
+    for row in rows:
+        groups.setdefault((row.product_name, row.manufacturer, row.dealer), []).append(row.id)
+    return [
+        {'product_name': name, 'manufacturer': manufacturer, 'dealer': dealer, 'product_ids': ids}
+        for (name, manufacturer, dealer), ids in groups.items()
+    ]
+
+
+def _chunks(values: Sequence[int], size: int = _BATCH_SIZE) -> Iterable[Sequence[int]]:
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def merge_duplicate_groups(groups: Iterable[Sequence[int]]) -> Dict[str, Any]:
+    """
+    重複商品のグループ（ID の列）をまとめて統合する。各グループは最小 ID の商品を残し、項目もその商品の値を使う。
+    統合できないグループはそのグループだけ飛ばし、他のグループは統合する。コミットは呼び出し側。
+
+    Returns:
+        {'groups': 統合したグループ数, 'merged': 削除した商品数,
+         'failed': [{'product_ids', 'error'}]（統合しなかったグループ）}
+    """
+    specs = [{'product_ids': list(ids)} for ids in groups]
+    results = merge_product_groups(specs)
+    merged = [r for r in results if r['success']]
+    return {
+        'groups': len(merged),
+        'merged': sum(len(r['merged_ids']) for r in merged),
+        'failed': [
+            {'product_ids': specs[r['index']]['product_ids'], 'error': r['error']}
+            for r in results if not r['success']
+        ],
     }
-    for key, src_id in field_sources.items():
-        if src_id not in unique_ids:
-            raise ValueError(f"{key} の採用元商品が選択リストに含まれていません")
-
-    keep_id = keep_product_id if keep_product_id in unique_ids else min(unique_ids)
-
-    products = Product.query.filter(Product.id.in_(unique_ids)).all()
-    if len(products) != len(unique_ids):
-        raise ValueError("指定された商品の一部が見つかりません")
-
-    for p in products:
-        if _is_system_dummy(p):
-            raise ValueError("システム管理用の商品は統合できません")
-
-    by_id: Dict[int, Product] = {p.id: p for p in products}
-    keep = by_id[keep_id]
-    others = [p for p in products if p.id != keep_id]
-
-    names_to_alias: List[tuple[str, str]] = []
-    for p in products:
-        names_to_alias.append((p.product_name, "merge"))
-        for alias in p.aliases.all():
-            names_to_alias.append((alias.alias_name, "merge"))
-
-    keep.manufacturer = by_id[manufacturer_from].manufacturer
-    keep.product_name = by_id[product_name_from].product_name[:200]
-    keep.unit_price = float(by_id[unit_price_from].unit_price)
-    keep.dealer = by_id[dealer_from].dealer
-
-    keep.current_stock = sum(p.current_stock for p in products)
-    keep.min_quantity = max(p.min_quantity for p in products)
-
-    if not keep.category:
-        for p in products:
-            if p.category:
-                keep.category = p.category
-                break
-
-    for name, source in names_to_alias:
-        ensure_alias(keep, name, source)
-
-    for other in others:
-        OrderHistory.query.filter_by(product_id=other.id).update(
-            {OrderHistory.product_id: keep.id},
-            synchronize_session=False,
+
+
+def remove_duplicate_system_dummies() -> int:
+    """
+    重複したシステム管理用ダミー商品を最小 ID の 1 件だけ残して削除する（ダミー商品は統合の対象外）。
+    コミットは呼び出し側。
+
+    Returns:
+        削除した商品数
+    """
+    extra_ids = [pid for group in find_exact_duplicate_groups(system_dummies=True) for pid in group['product_ids'][1:]]
+    if not extra_ids:
+        return 0
+    return delete_products(extra_ids)['products']
+
+
+def _parse_group(spec: Dict[str, Any]) -> Dict[str, Any]:
+    """グループ指定を検証して {'ids', 'keep_id', 'sources'} にする（不正なら ValueError）。"""
+    raw_ids = spec.get('product_ids')
+    if not isinstance(raw_ids, (list, tuple)):
+        raise ValueError("product_ids が不正です")
+    try:
+        ids = list(dict.fromkeys(int(x) for x in raw_ids))
+    except (TypeError, ValueError):
+        raise ValueError("product_ids が不正です")
+    if len(ids) < 2:
+        raise ValueError("統合する商品は 2 件以上を選択してください")
+
+    keep = spec.get('keep_product_id')
+    try:
+        keep_id = int(keep) if keep else min(ids)
+    except (TypeError, ValueError):
+        raise ValueError("keep_product_id が不正です")
+    if keep_id not in ids:
+        keep_id = min(ids)
+
+    sources: Dict[str, int] = {}
+    for name in MERGE_FIELDS:
+        src = spec.get(f"{name}_from")
+        if src is None or src == "":
+            sources[name] = keep_id
+            continue
+        try:
+            src = int(src)
+        except (TypeError, ValueError):
+            raise ValueError(f"{name} の採用元商品が不正です")
+        if src not in ids:
+            raise ValueError(f"{name} の採用元商品が選択リストに含まれていません")
+        sources[name] = src
+    return {'ids': ids, 'keep_id': keep_id, 'sources': sources}
+
+
+def merge_product_groups(groups: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    複数の統合グループを 1 トランザクションでまとめて統合する（グループ数によらず一定回数の SQL）。
+
+    各グループ: {'product_ids': [...], 'keep_product_id': 任意,
+                 'manufacturer_from' / 'product_name_from' / 'unit_price_from' / 'dealer_from': 任意（既定は残す商品）}
+    在庫数は合算、最低必要数は最大値、カテゴリは未設定なら他から補う。
+    統合元の注文履歴は残す商品へ付け替え、商品名・エイリアスは残す商品のエイリアスとして引き継ぐ。
+    不正なグループ（商品が無い・他のグループと重複など）はそのグループだけ統合せず結果にエラーを返す。
+    コミットは呼び出し側。
+
+    Returns:
+        グループごとの結果 [{'index', 'success', 'product_id', 'merged_ids', 'current_stock' | 'error'}]
+    """
+    results: List[Dict[str, Any]] = []
+    parsed: List[Optional[Dict[str, Any]]] = []
+    for index, spec in enumerate(groups):
+        try:
+            parsed.append(_parse_group(spec if isinstance(spec, dict) else {}))
+            results.append({'index': index, 'success': True})
+        except ValueError as e:
+            parsed.append(None)
+            results.append({'index': index, 'success': False, 'error': str(e)})
+
+    # 商品の存在・システム管理用商品・グループ間の重複を 1 回の読み込みで確認
+    referenced = sorted({pid for g in parsed if g for pid in g['ids']})
+    rows: Dict[int, Any] = {}
+    for chunk in _chunks(referenced):
+        for row in db.session.query(Product.id, Product.product_name, Product.manufacturer).filter(
+            Product.id.in_(chunk)
+        ):
+            rows[row.id] = row
+    used: set = set()
+    for g, result in zip(parsed, results):
+        if g is None:
+            continue
+        error = None
+        if any(pid not in rows for pid in g['ids']):
+            error = "指定された商品の一部が見つかりません"
+        elif any(_is_system_dummy(rows[pid]) for pid in g['ids']):
+            error = "システム管理用の商品は統合できません"
+        elif used.intersection(g['ids']):
+            error = "他のグループと同じ商品が含まれています"
+        if error:
+            result.update(success=False, error=error)
+            continue
+        used.update(g['ids'])
+
+    accepted = [(g, r) for g, r in zip(parsed, results) if r['success']]
+    if not accepted:
+        return results
+
+    mapping = {pid: g['keep_id'] for g, _ in accepted for pid in g['ids'] if pid != g['keep_id']}
+    keep_ids = sorted(g['keep_id'] for g, _ in accepted)
+    all_ids = sorted(used)
+    final_names = {g['keep_id']: rows[g['sources']['product_name']].product_name for g, _ in accepted}
+
+    # 統合元から引き継ぐエイリアス（統合前の名前で計算する）
+    alias_rows = _merged_alias_rows(mapping, all_ids, final_names)
+
+    conn = db.session.connection()
+    for table in (_merge_map, _merge_fields):
+        table.drop(conn, checkfirst=True)
+        table.create(conn)
+    try:
+        conn.execute(insert(_merge_map), [{'loser_id': l, 'keep_id': k} for l, k in mapping.items()])
+        conn.execute(insert(_merge_fields), [
+            {'keep_id': g['keep_id'], **{f"{name}_from": g['sources'][name] for name in MERGE_FIELDS}}
+            for g, _ in accepted
+        ])
+        _apply_merge()
+        if alias_rows:
+            db.session.execute(insert(ProductAlias), alias_rows)
+    finally:
+        for table in (_merge_map, _merge_fields):
+            table.drop(conn, checkfirst=True)
+
+    # 付け替えた注文履歴で集計を作り直し、削除した商品の発注点を消す
+    for chunk in _chunks(all_ids):
+        refresh_order_stats(list(chunk))
+    delete_reorder_policies(sorted(mapping))
+    db.session.expire_all()
+
+    stock: Dict[int, int] = {}
+    for chunk in _chunks(keep_ids):
+        stock.update(db.session.query(Product.id, Product.current_stock).filter(Product.id.in_(chunk)).all())
+    for g, result in accepted:
+        result.update(
+            product_id=g['keep_id'],
+            merged_ids=[pid for pid in g['ids'] if pid != g['keep_id']],
+            current_stock=stock.get(g['keep_id']),
         )
-        db.session.delete(other)
+    return results
 
-    keep.updated_at = datetime.utcnow()
-    db.session.commit()
-    return keep
+
+def _apply_merge() -> None:
+    """一時テーブルの対応表に従って統合する（在庫・項目・注文履歴・統合元の削除）。"""
+    losers = select(_merge_map.c.loser_id)
+    keeps = select(_merge_map.c.keep_id)
+    source = Product.__table__.alias("source")
+
+    def _from_losers(column):
+        return (
+            select(column)
+            .select_from(source.join(_merge_map, source.c.id == _merge_map.c.loser_id))
+            .where(_merge_map.c.keep_id == Product.id)
+            .scalar_subquery()
+        )
+
+    def _from_source(name):
+        return (
+            select(source.c[name])
+            .select_from(source.join(_merge_fields, source.c.id == _merge_fields.c[f"{name}_from"]))
+            .where(_merge_fields.c.keep_id == Product.id)
+            .scalar_subquery()
+        )
+
+    # 採用元の項目（残す商品自身が採用元なら同じ値になる）
+    db.session.execute(
+        update(Product)
+        .where(Product.id.in_(select(_merge_fields.c.keep_id)))
+        .values({name: _from_source(name) for name in MERGE_FIELDS})
+        .execution_options(synchronize_session=False)
+    )
+    # 在庫合算・最低必要数の最大値・未設定カテゴリの補完
+    loser_min_qty = _from_losers(func.max(source.c.min_quantity))
+    db.session.execute(
+        update(Product)
+        .where(Product.id.in_(keeps))
+        .values(
+            current_stock=Product.current_stock + func.coalesce(_from_losers(func.sum(source.c.current_stock)), 0),
+            min_quantity=case(
+                (func.coalesce(loser_min_qty, Product.min_quantity) > Product.min_quantity, loser_min_qty),
+                else_=Product.min_quantity,
+            ),
+            category=func.coalesce(Product.category, _from_losers(func.min(source.c.category))),
+            updated_at=datetime.utcnow(),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    # 注文履歴を残す商品へ付け替え
+    db.session.execute(
+        update(OrderHistory)
+        .where(OrderHistory.product_id.in_(losers))
+        .values(
+            product_id=select(_merge_map.c.keep_id)
+            .where(_merge_map.c.loser_id == OrderHistory.product_id)
+            .scalar_subquery()
+        )
+        .execution_options(synchronize_session=False)
+    )
+    # 統合元のエイリアスは残す商品側に登録し直すので削除
+    db.session.execute(
+        delete(ProductAlias).where(ProductAlias.product_id.in_(losers))
+        .execution_options(synchronize_session=False)
+    )
+    db.session.execute(
+        delete(Product).where(Product.id.in_(losers)).execution_options(synchronize_session=False)
+    )
+
+
+def _merged_alias_rows(
+    mapping: Dict[int, int],
+    all_ids: Sequence[int],
+    final_names: Dict[int, str],
+) -> List[Dict[str, Any]]:
+    """
+    統合後に残す商品へ登録するエイリアスの行（INSERT 用）。
+    グループ内の全商品の名前と統合元のエイリアスのうち、統合後の表示名・残す商品の既存エイリアスと
+    正規化後に重複しないもの。
+    """
+    names: Dict[int, str] = {}
+    aliases: Dict[int, List[str]] = {}
+    for chunk in _chunks(list(all_ids)):
+        names.update(db.session.query(Product.id, Product.product_name).filter(Product.id.in_(chunk)).all())
+        for pid, alias_name in db.session.query(ProductAlias.product_id, ProductAlias.alias_name).filter(
+            ProductAlias.product_id.in_(chunk)
+        ):
+            aliases.setdefault(pid, []).append(alias_name)
+
+    seen: Dict[int, set] = {}
+    for keep_id, final_name in final_names.items():
+        seen[keep_id] = {normalize_product_name(final_name)} | {
+            normalize_product_name(a) for a in aliases.get(keep_id, [])
+        }
+
+    candidates: List[tuple] = [(keep_id, names.get(keep_id) or "") for keep_id in sorted(final_names)]
+    for loser_id, keep_id in sorted(mapping.items()):
+        candidates.append((keep_id, names.get(loser_id) or ""))
+        candidates.extend((keep_id, a) for a in aliases.get(loser_id, []))
+
+    now = datetime.utcnow()
+    rows: List[Dict[str, Any]] = []
+    for keep_id, name in candidates:
+        name = name.strip()[:_MAX_ALIAS_LEN]
+        norm = normalize_product_name(name)
+        if not norm or norm in seen[keep_id]:
+            continue
+        seen[keep_id].add(norm)
+        rows.append({'product_id': keep_id, 'alias_name': name, 'source': 'merge', 'created_at': now})
+    return rows
@@ -0,0 +1,277 @@
+"""商品の差分同期（/api/products/changes）。
+
+since に渡したトークン以降に追加・更新・削除された商品だけを返す。トークンは
+「変更ログの版数-作成時刻（UNIX ミリ秒）」で、次の呼び出し用のトークンを毎回返す。
+- 変更ログ（ProductChange）が残っている範囲は版数で引く（変更件数に比例）。
+  PostgreSQL の採番はコミット順と一致しないため、応答時点で欠けていた直近の版数
+  （まだコミットされていない書き込み）をトークンの末尾に「~版数.版数...」で持たせ、
+  次の呼び出しでそれらがコミット済みになっていれば該当商品も返す
+- 変更ログが保持期間を過ぎた・対象を特定できない一括変更がある場合は、時刻で
+  Product.updated_at（索引あり）と削除の記録（ProductTombstone）を引く。
+  商品は (updated_at, id) 順に limit 件ずつ返し、続きのトークンには
+  「-位置の時刻（UNIX マイクロ秒）-位置の商品 ID」を付ける（削除は最初の応答でまとめて返す。
+  版数・時刻は最初の応答のままにし、引き終えたらそこから変更ログで続ける）
+since には ISO 形式の時刻も渡せる（時刻で引く）。
+システム管理用ダミー商品は一覧と同じく返さず、変更があった場合は削除として返す。
+"""
+from __future__ import annotations
+
+import os
+import re
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import delete, func, insert, select
+
+from app import db
+from app.models.inventory import Product, ProductChange, ProductTombstone
+from app.services.change_feed_service import _OVERLAP, _is_system_dummy, latest_change_id, product_to_dict
+from app.services.product_write_hooks import add_product_write_listener
+
+DEFAULT_LIMIT = 1000
+MAX_LIMIT = 5000
+# 時刻で引く場合の余裕（コミットが遅れた書き込み・サーバー間の時計のずれを取りこぼさないため）
+TIME_MARGIN = timedelta(seconds=60)
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+TOMBSTONE_RETENTION = timedelta(days=max(_env_float("PRODUCT_TOMBSTONE_RETENTION_DAYS", 90), 1))
+
+_BATCH_SIZE = 500
+_CHANGE = ProductChange.__table__
+_TOMBSTONE = ProductTombstone.__table__
+_TOKEN_RE = re.compile(r"^(\d+)(?:-(\d+)(?:-(\d+)-(\d+))?)?(?:~(\d+(?:\.\d+)*))?$")
+_EPOCH = datetime(1970, 1, 1)
+
+
+class InvalidSyncToken(ValueError):
+    pass
+
+
+def _on_product_write(conn, changed_ids: Optional[Set[int]], deleted_ids: Set[int]) -> None:
+    if not deleted_ids:
+        return
+    now = datetime.utcnow()
+    ids = sorted(deleted_ids)
+    for i in range(0, len(ids), _BATCH_SIZE):
+        chunk = ids[i:i + _BATCH_SIZE]
+        conn.execute(delete(_TOMBSTONE).where(_TOMBSTONE.c.product_id.in_(chunk)))
+        conn.execute(insert(_TOMBSTONE), [{'product_id': pid, 'deleted_at': now} for pid in chunk])
+
+
+def register_product_sync_hooks() -> None:
+    """商品の書き込みフックに削除の記録を登録する（create_app から呼ぶ）。"""
+    add_product_write_listener(_on_product_write, columns=set())
+
+
+def ensure_product_sync_indexes() -> None:
+    """既存の product テーブルに updated_at の索引を追加する（create_all は既存テーブルに索引を足さないため）。"""
+    for index in Product.__table__.indexes:
+        index.create(db.engine, checkfirst=True)
+
+
+def prune_tombstones() -> None:
+    """保持期間を過ぎた削除の記録を消す（起動時）。"""
+    db.session.execute(delete(_TOMBSTONE).where(_TOMBSTONE.c.deleted_at < datetime.utcnow() - TOMBSTONE_RETENTION))
+    db.session.commit()
+
+
+Cursor = Tuple[datetime, int]
+
+
+def make_token(version: int, at: Optional[datetime] = None, cursor: Optional[Cursor] = None,
+               pending: Iterable[int] = ()) -> str:
+    at = at or datetime.utcnow()
+    token = f"{version}-{(at - _EPOCH) // timedelta(milliseconds=1)}"
+    if cursor is not None:
+        token += f"-{(cursor[0] - _EPOCH) // timedelta(microseconds=1)}-{cursor[1]}"
+    pending = sorted(pending)
+    if pending:
+        token += "~" + ".".join(str(i) for i in pending)
+    return token
+
+
+def parse_token(token: str) -> Tuple[Optional[int], Optional[datetime], Optional[Cursor], List[int]]:
+    """(版数, 時刻, 時刻で引く途中の位置, 未コミットだった版数) を返す。
+
+    版数だけ（X-Products-Version）・時刻だけ（ISO 形式）も受け付ける。
+    """
+    token = (token or '').strip()
+    match = _TOKEN_RE.match(token)
+    if match:
+        version = int(match.group(1))
+        at = _EPOCH + timedelta(milliseconds=int(match.group(2))) if match.group(2) else None
+        cursor = None
+        if match.group(3):
+            cursor = (_EPOCH + timedelta(microseconds=int(match.group(3))), int(match.group(4)))
+        pending = [int(i) for i in match.group(5).split('.')] if match.group(5) else []
+        if len(pending) > _OVERLAP or any(i > version or i <= version - _OVERLAP for i in pending):
+            raise InvalidSyncToken("since が不正です")
+        return version, at, cursor, pending
+    try:
+        at = datetime.fromisoformat(token.replace('Z', '+00:00'))
+    except ValueError:
+        raise InvalidSyncToken("since が不正です")
+    if at.tzinfo is not None:
+        # DB の時刻は UTC（naive）で保存している
+        at = (at - at.utcoffset()).replace(tzinfo=None)
+    return None, at, None, []
+
+
+def _missing_versions(version: int) -> List[int]:
+    """version 以下の直近 _OVERLAP 件のうち、変更ログに無い版数（未コミット・ロールバック済みの採番）。"""
+    low = max(version - _OVERLAP, 0)
+    present = set(db.session.execute(
+        select(_CHANGE.c.id).where(_CHANGE.c.id > low, _CHANGE.c.id <= version)
+    ).scalars())
+    if not present:
+        return []  # 保持期間を過ぎて消えた範囲（欠番ではない）
+    return [i for i in range(max(low, min(present) - 1) + 1, version + 1) if i not in present]
+
+
+def _split_visible(products: List[Product]) -> Tuple[Dict[int, Product], List[int]]:
+    """(一覧に出す商品, 削除として返す ID)。システム管理用ダミー商品は削除として返す。"""
+    visible: Dict[int, Product] = {}
+    hidden: List[int] = []
+    for p in products:
+        if _is_system_dummy(p):
+            hidden.append(p.id)
+        else:
+            visible[p.id] = p
+    return visible, hidden
+
+
+def _split_existing(ids: List[int]) -> Tuple[Dict[int, Product], List[int]]:
+    existing: List[Product] = []
+    for i in range(0, len(ids), _BATCH_SIZE):
+        chunk = ids[i:i + _BATCH_SIZE]
+        existing.extend(Product.query.filter(Product.id.in_(chunk)))
+    visible, hidden = _split_visible(existing)
+    found = {p.id for p in existing}
+    return visible, sorted(hidden + [pid for pid in ids if pid not in found])
+
+
+def _deleted_since(since: datetime) -> List[int]:
+    tombstones = db.session.execute(
+        select(_TOMBSTONE.c.product_id).where(_TOMBSTONE.c.deleted_at >= since)
+    ).scalars().all()
+    # 削除後に同じ ID で作り直された商品は削除扱いにしない（ダミー商品は削除のまま）
+    _, deleted = _split_existing(sorted(set(tombstones)))
+    return deleted
+
+
+def _changes_by_time(since: Optional[datetime], cursor: Optional[Cursor], limit: int
+                     ) -> Tuple[Dict[int, Product], List[int], Optional[Cursor]]:
+    """updated_at >= since（途中からは cursor の後）の商品を (updated_at, id) 順に limit 件。
+
+    Returns:
+        (返す商品, 削除として返すダミー商品の ID, 続きがあれば最後の位置)
+    """
+    query = Product.query
+    if cursor is not None:
+        at, last_id = cursor
+        query = query.filter(db.or_(
+            Product.updated_at > at,
+            db.and_(Product.updated_at == at, Product.id > last_id),
+        ))
+    else:
+        query = query.filter(Product.updated_at >= since)
+    rows = query.order_by(Product.updated_at, Product.id).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = (rows[-1].updated_at, rows[-1].id)
+    products, hidden = _split_visible(rows)
+    return products, hidden, next_cursor
+
+
+def get_product_changes(since: str, limit: int = DEFAULT_LIMIT, include_products: bool = True) -> Dict[str, Any]:
+    """since 以降に変更された商品。
+
+    Returns:
+        {'version': 次回のトークン, 'has_more', 'reset': True なら全件の取り直しが必要,
+         'upserted_ids', 'deleted_ids', 'products'（include_products のとき）}
+    """
+    limit = min(max(int(limit), 1), MAX_LIMIT)
+    version, at, cursor, pending = parse_token(since)
+    started = datetime.utcnow()
+    current = latest_change_id()
+    empty = {'upserted_ids': [], 'deleted_ids': []}
+
+    rows = []
+    use_time = version is None or cursor is not None
+    if version is not None and cursor is None:
+        oldest = db.session.execute(select(func.min(_CHANGE.c.id))).scalar()
+        if oldest is not None and version < oldest - 1:
+            use_time = True  # 変更ログが保持期間を過ぎている
+        else:
+            rows = db.session.execute(
+                select(_CHANGE.c.id, _CHANGE.c.product_id, _CHANGE.c.op, _CHANGE.c.changed_at)
+                .where(_CHANGE.c.id > version)
+                .order_by(_CHANGE.c.id)
+                .limit(limit + 1)
+            ).all()
+            if any(r.op == 'reset' for r in rows):
+                use_time = True
+                if at is None and rows:
+                    at = rows[0].changed_at
+
+    if use_time:
+        if cursor is not None:
+            # 時刻で引く途中: 版数・時刻は最初の応答のもの（削除は最初の応答で返し済み）
+            current, started, deleted = version, at, []
+            since_at = None
+        else:
+            if at is None:
+                return dict(empty, version=make_token(current, started - TIME_MARGIN), has_more=False, reset=True)
+            since_at = at - TIME_MARGIN
+            if since_at < started - TOMBSTONE_RETENTION:
+                # 削除の記録が残っていない期間を含む
+                return dict(empty, version=make_token(current, started - TIME_MARGIN), has_more=False, reset=True)
+            deleted = _deleted_since(since_at)
+        products, hidden, next_cursor = _changes_by_time(since_at, cursor, limit)
+        deleted = sorted(set(deleted) | set(hidden))
+        has_more = next_cursor is not None
+        next_version, next_at = current, started
+    else:
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        ids = sorted({r.product_id for r in rows if r.product_id is not None})
+        products, deleted = _split_existing(ids)
+        next_cursor = None
+        next_version = rows[-1].id if rows else version
+        next_at = rows[-1].changed_at if has_more else started
+
+    if next_cursor is not None:
+        # 時刻で引く途中は、最初の応答の未コミットの版数をそのまま引き継ぐ（最後の応答で確かめる）
+        next_pending = pending
+    else:
+        if pending:
+            late = db.session.execute(
+                select(_CHANGE.c.product_id, _CHANGE.c.op).where(_CHANGE.c.id.in_(pending))
+            ).all()
+            if any(r.op == 'reset' for r in late):
+                return dict(empty, version=make_token(current, started - TIME_MARGIN), has_more=False, reset=True)
+            late_products, late_deleted = _split_existing(
+                sorted({r.product_id for r in late if r.product_id is not None} - set(products))
+            )
+            products.update(late_products)
+            deleted = sorted(set(deleted) | set(late_deleted))
+        next_pending = _missing_versions(next_version)
+
+    result: Dict[str, Any] = {
+        'version': make_token(next_version, next_at, next_cursor, next_pending),
+        'has_more': has_more,
+        'reset': False,
+        'upserted_ids': sorted(products),
+        'deleted_ids': sorted(deleted),
+    }
+    if include_products:
+        result['products'] = [product_to_dict(products[pid]) for pid in sorted(products)]
+    return result
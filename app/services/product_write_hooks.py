@@ -0,0 +1,138 @@
+"""Product の書き込み（ORM の flush・一括 UPDATE/DELETE/INSERT）を検知し、変更された商品 ID をリスナーへ渡す。
+
+在庫不足アラートの差分更新・変更フィードなど、商品の変更に追従するものはここにリスナーを登録する。
+do_orm_execute では文を自分で実行して結果を返すため、一括文の対象特定はこのモジュールで 1 回だけ行う。
+
+リスナー: fn(connection, changed_ids, deleted_ids)
+    changed_ids: 追加・更新された商品 ID の集合。対象を特定できない一括文では None（全件が変わった可能性がある）
+    deleted_ids: 削除された商品 ID の集合
+同じトランザクション内で呼ばれるため、リスナーの書き込みは商品の変更と一緒にコミット・ロールバックされる。
+
+Product.__table__ に対する Core 文はフックを通らない。
+"""
+from __future__ import annotations
+
+from typing import Any, Callable, FrozenSet, List, Optional, Set, Tuple
+
+from sqlalchemy import event, inspect, select
+
+from app import db
+from app.models.inventory import Product
+
+Listener = Callable[[Any, Optional[Set[int]], Set[int]], None]
+
+# (リスナー, 反応する列。None なら全列)
+_listeners: List[Tuple[Listener, Optional[FrozenSet[str]]]] = []
+
+
+def add_product_write_listener(listener: Listener, columns: Optional[Set[str]] = None) -> None:
+    """リスナーを登録する。columns を指定すると、その列が変わった更新だけを通知する（追加・削除は常に通知）。"""
+    if any(fn is listener for fn, _ in _listeners):
+        return
+    _listeners.append((listener, frozenset(columns) if columns is not None else None))
+
+
+def _notify(conn, changed_for, deleted: Set[int]) -> None:
+    for listener, columns in _listeners:
+        changed = changed_for(columns)
+        if changed is None or changed or deleted:
+            listener(conn, changed, deleted)
+
+
+def _after_flush(session, flush_context) -> None:
+    if not _listeners:
+        return
+    new: Set[int] = set()
+    dirty: List[Tuple[int, Set[str]]] = []
+    deleted: Set[int] = set()
+    for obj in session.new:
+        if isinstance(obj, Product) and obj.id is not None:
+            new.add(obj.id)
+    for obj in session.dirty:
+        if isinstance(obj, Product) and obj.id is not None:
+            state = inspect(obj)
+            columns = {
+                a.key for a in state.mapper.column_attrs if state.attrs[a.key].history.has_changes()
+            }
+            if columns:
+                dirty.append((obj.id, columns))
+    for obj in session.deleted:
+        if isinstance(obj, Product) and obj.id is not None:
+            deleted.add(obj.id)
+    if not (new or dirty or deleted):
+        return
+
+    def changed_for(columns):
+        return new | {pid for pid, cols in dirty if columns is None or cols & columns}
+
+    _notify(session.connection(), changed_for, deleted)
+
+
+def _updated_columns(statement) -> Optional[Set[str]]:
+    """UPDATE 文の SET 対象の列名（判定できなければ None）。
+
+    SQLAlchemy に公開 API が無いため _values / _ordered_values を読む。
+    """
+    values = getattr(statement, "_values", None) or dict(getattr(statement, "_ordered_values", None) or ())
+    if not values:
+        return None
+    return {getattr(key, "key", key) for key in values}
+
+
+def _do_orm_execute(orm_execute_state) -> Any:
+    state = orm_execute_state
+    if not _listeners or not (state.is_update or state.is_delete or state.is_insert):
+        return None
+    if not any(m.class_ is Product for m in state.all_mappers):
+        return None
+    session = state.session
+    statement = state.statement
+    if statement.table.name != Product.__tablename__:
+        # 他のテーブルへの文が副問い合わせで Product を参照しているだけの場合
+        return None
+    params = state.parameters
+
+    ids: Optional[List[int]] = None
+    columns: Optional[Set[str]] = None
+    if state.is_update or state.is_delete:
+        if state.is_update and isinstance(params, list) and params and all('id' in p for p in params):
+            # 主キー指定の一括 UPDATE（executemany）
+            ids = [p['id'] for p in params]
+            columns = set(params[0]) - {'id'}
+        else:
+            if state.is_update:
+                columns = _updated_columns(statement)
+                if columns is not None and not any(
+                    cols is None or cols & columns for _, cols in _listeners
+                ):
+                    return None
+            where = statement.whereclause
+            if where is not None:
+                # 更新後は条件に合わなくなることがあるため、対象は実行前に確定する
+                ids = session.execute(select(Product.id).where(where)).scalars().all()
+                if not ids:
+                    return None
+
+    result = state.invoke_statement()
+    conn = session.connection()
+    if state.is_delete and ids is not None:
+        _notify(conn, lambda cols: set(), set(ids))
+    elif ids is not None:
+        changed = set(ids)
+        _notify(conn, lambda cols: changed if cols is None or columns is None or cols & columns else set(), set())
+    else:
+        # INSERT・条件なしの UPDATE/DELETE は対象を特定できない
+        _notify(conn, lambda cols: None, set())
+    return result
+
+
+def register_product_write_hooks() -> None:
+    """db.session にイベントを登録（create_app から 1 回だけ呼ぶ）。
+
+    do_orm_execute は文を自分で実行して結果を返すため、他の do_orm_execute フックより後に登録すること。
+    """
+    session = db.session
+    if event.contains(session, "after_flush", _after_flush):
+        return
+    event.listen(session, "after_flush", _after_flush)
+    event.listen(session, "do_orm_execute", _do_orm_execute)
@@ -0,0 +1,216 @@
+"""発注点・安全在庫の一括計算（固定の最低必要数を需要のばらつきとリードタイムから置き換える）。
+
+    安全在庫 = z × 週需要の標準偏差 × √(リードタイム週数)
+    発注点   = 週需要の平均 × リードタイム週数 + 安全在庫
+
+全商品をまとめて NumPy で計算し、結果を ReorderPolicy に保存したうえで Product.min_quantity に反映する。
+アラートや PDF は従来どおり current_stock < min_quantity で判定するため、読み取り側のクエリは変わらない。
+手入力で最低必要数を変えた商品（manual）は上書きしない。
+"""
+from __future__ import annotations
+
+import math
+import os
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import bindparam, exists, insert, select, true, update
+
+from app import db
+from app.models.inventory import DealerLeadTime, Product, ReorderPolicy
+
+
+# z 値の上限（5 ≒ サービス率 99.99997%。これより大きい値は入力ミスとみなす）
+MAX_SERVICE_Z = 5.0
+
+
+def _env_float(name: str, default: float, high: Optional[float] = None) -> float:
+    """環境変数の数値（数値でない・無限大・NaN・負・high 超の場合は既定値）。"""
+    try:
+        value = float(os.environ.get(name, default))
+    except ValueError:
+        return default
+    if not math.isfinite(value) or value < 0 or (high is not None and value > high):
+        return default
+    return value
+
+
+# 取引会社ごとの設定が無い場合のリードタイム（日）
+DEFAULT_LEAD_TIME_DAYS = int(_env_float("REORDER_DEFAULT_LEAD_TIME_DAYS", 7))
+# 欠品許容に対応する z 値（1.65 ≒ サービス率 95%）
+DEFAULT_SERVICE_Z = _env_float("REORDER_SERVICE_Z", 1.65, high=MAX_SERVICE_Z)
+
+_UPDATE_BATCH_SIZE = 1000
+
+
+def get_lead_times() -> Dict[str, int]:
+    """取引会社 -> リードタイム（日）。"""
+    return {row.dealer: row.lead_time_days for row in DealerLeadTime.query.all()}
+
+
+def set_lead_times(values: Dict[str, int]) -> int:
+    """リードタイムを登録・更新する（None は設定削除）。コミットは呼び出し側。"""
+    changed = 0
+    for dealer, days in values.items():
+        dealer = (dealer or "").strip()
+        if not dealer:
+            continue
+        row = db.session.get(DealerLeadTime, dealer)
+        if days is None:
+            if row is not None:
+                db.session.delete(row)
+                changed += 1
+            continue
+        days = int(days)
+        if days < 0:
+            raise ValueError("リードタイムは0以上で入力してください")
+        if row is None:
+            db.session.add(DealerLeadTime(dealer=dealer, lead_time_days=days))
+        else:
+            row.lead_time_days = days
+        changed += 1
+    return changed
+
+
+def set_manual_min_quantity(product_id: int, manual: bool = True) -> None:
+    """最低必要数を手入力したとき、自動計算で上書きしないよう印を付ける。"""
+    policy = db.session.get(ReorderPolicy, product_id)
+    if policy is None:
+        db.session.add(ReorderPolicy(product_id=product_id, manual=manual))
+    else:
+        policy.manual = manual
+
+
+def mark_manual_min_quantity(product_filter) -> None:
+    """条件に合う商品すべてに手入力の印を付ける（一括更新用。set_manual_min_quantity の集合版）。"""
+    table = ReorderPolicy.__table__
+    targets = select(Product.id).where(product_filter)
+    db.session.execute(update(table).where(table.c.product_id.in_(targets)).values(manual=True))
+    db.session.execute(insert(table).from_select(
+        ['product_id', 'manual'],
+        select(Product.id, true()).where(
+            product_filter, ~exists().where(table.c.product_id == Product.id)
+        ),
+    ))
+
+
+def compute_reorder_points(dealer: str = "", service_z: Optional[float] = None) -> Dict[str, int]:
+    """
+    発注点・安全在庫を一括計算して保存し、自動対象の商品の min_quantity を更新する。
+
+    Returns:
+        {'computed': 計算した商品数, 'updated': min_quantity を更新した商品数, 'skipped_manual': 手入力のため除外した数}
+    Raises:
+        ValueError: service_z が 0 以上 MAX_SERVICE_Z 以下の有限の数でない場合
+    """
+    z = DEFAULT_SERVICE_Z if service_z is None else float(service_z)
+    # 負の z は安全在庫を負にして全商品の最低必要数を下げてしまう
+    if not math.isfinite(z) or not 0 <= z <= MAX_SERVICE_Z:
+        raise ValueError(f"service_z は 0 以上 {MAX_SERVICE_Z:g} 以下で指定してください")
+
+    # NumPy は起動を重くするため計算時に読み込む
+    import numpy as np
+
+    from app.services.demand_forecast import MIN_DEMAND_WEEKS, load_weekly_matrix
+
+    product_ids, matrix = load_weekly_matrix(dealer)
+
+    # 需要の発生した週が少ない商品は推定が不安定なので対象外（手入力の最低必要数のまま）
+    demand_weeks = (matrix > 0).sum(axis=1)
+    keep = demand_weeks >= MIN_DEMAND_WEEKS
+    product_ids, y = product_ids[keep], matrix[keep]
+    if len(product_ids) == 0:
+        return {'computed': 0, 'updated': 0, 'skipped_manual': 0}
+
+    # 取扱開始（最初に需要があった週）以降で平均・標準偏差を計算
+    first = np.argmax(y > 0, axis=1)
+    active = np.arange(y.shape[1])[None, :] >= first[:, None]
+    n_active = active.sum(axis=1)
+    mean = np.where(active, y, 0).sum(axis=1) / n_active
+    std = np.sqrt(np.where(active, (y - mean[:, None]) ** 2, 0).sum(axis=1) / n_active)
+
+    # 商品の取引会社からリードタイムを引く
+    lead_times = get_lead_times()
+    dealer_of = _dealer_map(product_ids.tolist())
+    lead_days = np.array(
+        [lead_times.get(dealer_of.get(pid) or "", DEFAULT_LEAD_TIME_DAYS) for pid in product_ids.tolist()],
+        dtype=float,
+    )
+    lead_weeks = lead_days / 7.0
+    safety = np.ceil(z * std * np.sqrt(lead_weeks))
+    reorder_point = np.ceil(mean * lead_weeks + safety)
+
+    manual_ids = {
+        pid for (pid,) in db.session.query(ReorderPolicy.product_id).filter(ReorderPolicy.manual.is_(True))
+    }
+    existing = {pid for (pid,) in db.session.query(ReorderPolicy.product_id)}
+
+    now = datetime.utcnow()
+    policy_rows: List[dict] = []
+    min_qty_rows: List[dict] = []
+    for i, pid in enumerate(product_ids.tolist()):
+        policy_rows.append({
+            'b_product_id': pid,
+            'safety_stock': int(safety[i]),
+            'reorder_point': int(reorder_point[i]),
+            'lead_time_days': int(lead_days[i]),
+            'demand_mean_weekly': float(mean[i]),
+            'demand_std_weekly': float(std[i]),
+            'computed_at': now,
+        })
+        if pid not in manual_ids:
+            min_qty_rows.append({'id': pid, 'min_quantity': int(reorder_point[i]), 'updated_at': now})
+
+    # 既存行は UPDATE、新規は INSERT（いずれもまとめて実行）
+    policy_table = ReorderPolicy.__table__
+    update_rows = [r for r in policy_rows if r['b_product_id'] in existing]
+    insert_rows = [
+        {**{k: v for k, v in r.items() if k != 'b_product_id'}, 'product_id': r['b_product_id'], 'manual': False}
+        for r in policy_rows if r['b_product_id'] not in existing
+    ]
+    update_policy = (
+        update(policy_table)
+        .where(policy_table.c.product_id == bindparam('b_product_id'))
+        .values(
+            safety_stock=bindparam('safety_stock'),
+            reorder_point=bindparam('reorder_point'),
+            lead_time_days=bindparam('lead_time_days'),
+            demand_mean_weekly=bindparam('demand_mean_weekly'),
+            demand_std_weekly=bindparam('demand_std_weekly'),
+            computed_at=bindparam('computed_at'),
+        )
+    )
+    conn = db.session.connection()
+    for i in range(0, len(update_rows), _UPDATE_BATCH_SIZE):
+        conn.execute(update_policy, update_rows[i:i + _UPDATE_BATCH_SIZE])
+    for i in range(0, len(insert_rows), _UPDATE_BATCH_SIZE):
+        conn.execute(policy_table.insert(), insert_rows[i:i + _UPDATE_BATCH_SIZE])
+
+    # 主キー指定の一括 UPDATE（ORM 経由なのでデータバージョンも更新される）
+    for i in range(0, len(min_qty_rows), _UPDATE_BATCH_SIZE):
+        db.session.execute(update(Product), min_qty_rows[i:i + _UPDATE_BATCH_SIZE])
+
+    return {
+        'computed': len(policy_rows),
+        'updated': len(min_qty_rows),
+        'skipped_manual': len(policy_rows) - len(min_qty_rows),
+    }
+
+
+def _dealer_map(product_ids: List[int]) -> Dict[int, Optional[str]]:
+    """product_id -> 取引会社（IN 句が長くなりすぎないよう分割して引く）。"""
+    result: Dict[int, Optional[str]] = {}
+    for i in range(0, len(product_ids), _UPDATE_BATCH_SIZE):
+        chunk = product_ids[i:i + _UPDATE_BATCH_SIZE]
+        result.update(db.session.query(Product.id, Product.dealer).filter(Product.id.in_(chunk)).all())
+    return result
+
+
+def delete_reorder_policies(product_ids: List[int]) -> None:
+    """商品削除時に発注点の行も消す（SQLite では外部キーの CASCADE が効かないため明示的に削除）。"""
+    if not product_ids:
+        return
+    table = ReorderPolicy.__table__
+    for i in range(0, len(product_ids), _UPDATE_BATCH_SIZE):
+        chunk = product_ids[i:i + _UPDATE_BATCH_SIZE]
+        db.session.execute(table.delete().where(table.c.product_id.in_(chunk)))
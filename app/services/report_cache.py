@@ -0,0 +1,110 @@
+"""生成済みレポート（PDF/CSV）のディスクキャッシュ。
+
+キーは (レポート種別, 取引会社, ソート, データ版数)。Product への書き込みで版数が変わるため、
+データが変わらない限り同じファイルをそのまま返す。容量上限を超えたら最終利用が古い順に削除する。
+ファイルはロック内で開いたハンドルとして返すので、返した後に削除されても読み出しは続けられる。
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from typing import Any, BinaryIO, Optional, Sequence
+
+DEFAULT_CACHE_DIR = os.path.join("reports", "cache")
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+
+
+class ReportCache:
+    def __init__(self, cache_dir: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.cache_dir = cache_dir or os.environ.get("REPORT_CACHE_DIR", DEFAULT_CACHE_DIR)
+        if max_bytes is None:
+            try:
+                max_bytes = int(os.environ.get("REPORT_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES))
+            except ValueError:
+                max_bytes = DEFAULT_MAX_BYTES
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def _path_for(self, key_parts: Sequence[Any], suffix: str) -> str:
+        raw = "\x1f".join("" if p is None else str(p) for p in key_parts)
+        digest = hashlib.sha256(raw.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}{suffix}")
+
+    def get(self, key_parts: Sequence[Any], suffix: str = "") -> Optional[BinaryIO]:
+        """キャッシュ済みファイルを開いて返す（無ければ None）。ヒット時は最終利用時刻を更新する。閉じるのは呼び出し側。
+
+        削除（_evict）と競合しないようロック内で開く。
+        """
+        path = self._path_for(key_parts, suffix)
+        with self._lock:
+            try:
+                fileobj = open(path, "rb")
+            except OSError:
+                return None
+            try:
+                os.utime(path, None)
+            except OSError:
+                pass
+            return fileobj
+
+    def put_stream(self, key_parts: Sequence[Any], stream: BinaryIO, suffix: str = "") -> BinaryIO:
+        """ファイルオブジェクトの内容を保存し、開いて返す（書き込みは一時ファイル経由で原子的に置換）。
+
+        置換の前に開いておくので、直後に容量超過で削除されても返したハンドルは読める。閉じるのは呼び出し側。
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path_for(key_parts, suffix)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        fileobj = None
+        try:
+            with os.fdopen(fd, "wb") as out:
+                shutil.copyfileobj(stream, out)
+            fileobj = open(tmp_path, "rb")
+            os.replace(tmp_path, path)
+        except BaseException:
+            if fileobj is not None:
+                fileobj.close()
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        self._evict()
+        return fileobj
+
+    def _evict(self) -> None:
+        """合計サイズが上限を超えていれば、最終利用が古いファイルから削除する。"""
+        with self._lock:
+            entries = []
+            total = 0
+            try:
+                names = os.listdir(self.cache_dir)
+            except OSError:
+                return
+            for name in names:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+            if total <= self.max_bytes:
+                return
+            entries.sort()
+            for _mtime, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+
+
+report_cache = ReportCache()
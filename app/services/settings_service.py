@@ -0,0 +1,210 @@
+"""カテゴリ・取引会社・メーカーの一括設定（追加・名称変更・削除）。
+
+どの操作も値の数によらず 1 フィールドにつき 1 文で実行する（値ごとの UPDATE はしない）。
+    削除      field IN (...) の商品を未設定（NULL。メーカーは「未設定」）にする
+    名称変更  CASE で旧名 -> 新名を一度に置き換える（a->b と b->c を同時に指定しても連鎖しない）
+    追加      まだ使われていない値だけ管理用ダミー商品をまとめて登録する（カテゴリ・取引会社）
+管理用ダミー商品（カテゴリ管理用_* / 取引会社管理用_*）は値と一緒に名称変更・削除する
+（名称変更後の値が既に使われている場合は、変更元のダミー商品を削除する）。
+コミットは呼び出し側（失敗時はロールバックすれば全操作が取り消される）。
+"""
+from __future__ import annotations
+
+import uuid
+from typing import Dict, Iterable, List, Mapping, Optional
+
+from sqlalchemy import and_, case, delete, select, update
+
+from app import db
+from app.models.inventory import DealerLeadTime, Product
+
+SETTINGS_FIELDS = ('category', 'dealer', 'manufacturer')
+
+SYSTEM_MANUFACTURER = 'システム'
+# フィールド -> (ダミー商品名の接頭辞, 商品コードの接頭辞, ダミー商品に入れる他方のフィールド)
+_DUMMY_SPECS = {
+    'category': ('カテゴリ管理用_', 'CATEGORY', ('dealer', 'システム管理')),
+    'dealer': ('取引会社管理用_', 'DEALER', ('category', 'システム管理')),
+}
+# NULL にできないフィールドの「未設定」の値（CSV 取込と同じ）
+_UNSET_VALUES = {'manufacturer': '未設定'}
+
+
+def _clean(values: Optional[Iterable[str]]) -> List[str]:
+    """前後の空白を除き、空・重複を取り除く（順序は保つ）。"""
+    seen: Dict[str, None] = {}
+    for value in values or ():
+        value = (value or '').strip() if isinstance(value, str) else ''
+        if value:
+            seen.setdefault(value, None)
+    return list(seen)
+
+
+def _dummy_name_filter(field: str, values: List[str]):
+    prefix = _DUMMY_SPECS[field][0]
+    return and_(
+        Product.manufacturer == SYSTEM_MANUFACTURER,
+        Product.product_name.in_([prefix + v for v in values]),
+    )
+
+
+def _remove(field: str, values: List[str]) -> int:
+    column = getattr(Product, field)
+    if field in _DUMMY_SPECS:
+        db.session.execute(
+            delete(Product).where(_dummy_name_filter(field, values)),
+            execution_options={'synchronize_session': False},
+        )
+    result = db.session.execute(
+        update(Product).where(column.in_(values)).values({field: _UNSET_VALUES.get(field)}),
+        execution_options={'synchronize_session': False},
+    )
+    return result.rowcount or 0
+
+
+def _drop_redundant_dummies(field: str, mapping: Dict[str, str]) -> None:
+    """名称変更後の値が既に使われている（または複数の値が同じ名前になる）場合、変更元の管理用ダミー商品を消す。
+
+    消さずに付け替えると、同じ値の管理用ダミー商品が 2 つできる。
+    """
+    column = getattr(Product, field)
+    # この名称変更で別の名前に変わる値は「使われている」に含めない
+    taken = set(db.session.execute(
+        select(column).distinct().where(column.in_(list(set(mapping.values()))))
+    ).scalars()) - set(mapping)
+    redundant = []
+    for old, new in mapping.items():
+        if new in taken:
+            redundant.append(old)
+        taken.add(new)
+    if redundant:
+        db.session.execute(
+            delete(Product).where(_dummy_name_filter(field, redundant)),
+            execution_options={'synchronize_session': False},
+        )
+
+
+def _rename(field: str, mapping: Dict[str, str]) -> int:
+    column = getattr(Product, field)
+    values = {field: case(mapping, value=column, else_=column)}
+    if field in _DUMMY_SPECS:
+        _drop_redundant_dummies(field, mapping)
+        prefix = _DUMMY_SPECS[field][0]
+        # 管理用ダミー商品は値と同じ列を持つので、同じ文で商品名も付け替える
+        values['product_name'] = case(
+            {prefix + old: prefix + new for old, new in mapping.items()},
+            value=Product.product_name,
+            else_=Product.product_name,
+        )
+    result = db.session.execute(
+        update(Product).where(column.in_(list(mapping))).values(values),
+        execution_options={'synchronize_session': False},
+    )
+    if field == 'dealer':
+        _rename_lead_times(mapping)
+    return result.rowcount or 0
+
+
+def _rename_lead_times(mapping: Dict[str, str]) -> None:
+    """取引会社のリードタイム設定を新しい名前へ引き継ぐ（新しい名前に設定がある場合はそちらを残す）。"""
+    taken = set(db.session.execute(
+        select(DealerLeadTime.dealer).where(DealerLeadTime.dealer.in_(list(mapping.values())))
+    ).scalars())
+    movable = {old: new for old, new in mapping.items() if new not in taken and old not in mapping.values()}
+    if not movable:
+        return
+    db.session.execute(
+        update(DealerLeadTime)
+        .where(DealerLeadTime.dealer.in_(list(movable)))
+        .values(dealer=case(movable, value=DealerLeadTime.dealer)),
+        execution_options={'synchronize_session': False},
+    )
+
+
+def _add(field: str, values: List[str]) -> int:
+    """使われていない値を管理用ダミー商品で登録する。登録した件数を返す（メーカーは登録しない）。"""
+    if field not in _DUMMY_SPECS:
+        return 0
+    column = getattr(Product, field)
+    used = set(db.session.execute(select(column).distinct().where(column.in_(values))).scalars())
+    missing = [v for v in values if v not in used]
+    if not missing:
+        return 0
+    name_prefix, code_prefix, (other_field, other_value) = _DUMMY_SPECS[field]
+    db.session.add_all([
+        Product(**{
+            'product_code': f"{code_prefix}_{uuid.uuid4().hex[:12].upper()}",
+            'product_name': name_prefix + value,
+            'manufacturer': SYSTEM_MANUFACTURER,
+            field: value,
+            other_field: other_value,
+            'unit_price': 0,
+            'current_stock': 0,
+            'min_quantity': 0,
+        })
+        for value in missing
+    ])
+    db.session.flush()
+    return len(missing)
+
+
+def _fill_empty(field: str, value: str) -> int:
+    column = getattr(Product, field)
+    unset = column.is_(None)
+    if field in _UNSET_VALUES:
+        unset = unset | (column == _UNSET_VALUES[field])
+    result = db.session.execute(
+        update(Product).where(unset).values({field: value}),
+        execution_options={'synchronize_session': False},
+    )
+    return result.rowcount or 0
+
+
+def apply_settings_changes(
+    field: str,
+    *,
+    add: Optional[Iterable[str]] = None,
+    rename: Optional[Mapping[str, str]] = None,
+    remove: Optional[Iterable[str]] = None,
+    fill_empty: bool = False,
+) -> Dict[str, int]:
+    """値の削除 -> 名称変更 -> 追加の順に適用する。
+
+    fill_empty=True なら、未設定の商品に追加した値の先頭を設定する（従来の「追加」の動作）。
+
+    Returns:
+        {'added': 追加を指定した値の数（空・重複を除く）, 'removed': 未設定にした商品数, 'renamed': 名称を変えた商品数,
+         'registered': 新たに登録した値の数, 'filled': 未設定から設定した商品数}
+    Raises:
+        ValueError: フィールドや値が不正な場合
+    """
+    if field not in SETTINGS_FIELDS:
+        raise ValueError('無効なフィールドです')
+    add_values = _clean(add)
+    remove_values = _clean(remove)
+    mapping: Dict[str, str] = {}
+    for old, new in (rename or {}).items():
+        old = (old or '').strip()
+        new = (new or '').strip() if isinstance(new, str) else ''
+        if not old:
+            continue
+        if not new:
+            raise ValueError(f'"{old}" の新しい名前が空です')
+        if old != new:
+            mapping[old] = new
+    conflict = set(mapping) & set(remove_values)
+    if conflict:
+        raise ValueError(f'同じ値を名称変更と削除の両方に指定しています: {", ".join(sorted(conflict))}')
+    if not (add_values or remove_values or mapping):
+        raise ValueError('必要なパラメータが不足しています')
+
+    counts = {'added': len(add_values), 'removed': 0, 'renamed': 0, 'registered': 0, 'filled': 0}
+    if remove_values:
+        counts['removed'] = _remove(field, remove_values)
+    if mapping:
+        counts['renamed'] = _rename(field, mapping)
+    if add_values:
+        if fill_empty:
+            counts['filled'] = _fill_empty(field, add_values[0])
+        counts['registered'] = _add(field, add_values)
+    return counts
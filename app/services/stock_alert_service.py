@@ -0,0 +1,103 @@
+"""在庫不足アラート（StockAlert）の差分更新と読み出し。
+
+商品の在庫数・最低必要数・取引会社が変わったときだけ、その商品の行を作り直す
+（product_write_hooks で検知。対象を特定できない一括文の後は全件作り直す）。
+読み出しは StockAlert の行数（= アラート件数）に比例し、Product は主キーで引くだけにする。
+
+Product.__table__ に対する Core 文はフックを通らないため、起動時（init_database）に全件作り直す。
+"""
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import DateTime, case, delete, insert, literal, select
+
+from app import db
+from app.models.inventory import Product, StockAlert
+from app.services.product_write_hooks import add_product_write_listener
+
+# 不足数がこれを超えると緊急度「高」「中」（アラート画面・PDF と同じ基準）
+URGENCY_HIGH_SHORTAGE = 10
+URGENCY_MEDIUM_SHORTAGE = 5
+
+# アラートに影響する商品の列
+_WATCHED_COLUMNS = frozenset(("current_stock", "min_quantity", "dealer"))
+_BATCH_SIZE = 1000
+
+_PRODUCT = Product.__table__
+_ALERT = StockAlert.__table__
+
+
+def urgency_for(shortage: int) -> str:
+    if shortage > URGENCY_HIGH_SHORTAGE:
+        return 'high'
+    if shortage > URGENCY_MEDIUM_SHORTAGE:
+        return 'medium'
+    return 'low'
+
+
+def _chunks(values: Sequence[int], size: int = _BATCH_SIZE) -> Iterable[Sequence[int]]:
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def _alert_rows_select(now: datetime):
+    shortage = _PRODUCT.c.min_quantity - _PRODUCT.c.current_stock
+    urgency = case(
+        (shortage > URGENCY_HIGH_SHORTAGE, 'high'),
+        (shortage > URGENCY_MEDIUM_SHORTAGE, 'medium'),
+        else_='low',
+    )
+    return select(
+        _PRODUCT.c.id, _PRODUCT.c.dealer, shortage, urgency, literal(now, DateTime)
+    ).where(_PRODUCT.c.current_stock < _PRODUCT.c.min_quantity)
+
+
+def _refresh(conn, product_ids: Optional[Iterable[int]]) -> None:
+    """指定商品のアラート行を作り直す（product_ids=None なら全件）。"""
+    columns = ['product_id', 'dealer', 'shortage', 'urgency', 'updated_at']
+    rows = _alert_rows_select(datetime.utcnow())
+    if product_ids is None:
+        conn.execute(delete(_ALERT))
+        conn.execute(insert(_ALERT).from_select(columns, rows))
+        return
+    ids = sorted(set(product_ids))
+    for chunk in _chunks(ids):
+        conn.execute(delete(_ALERT).where(_ALERT.c.product_id.in_(chunk)))
+        conn.execute(insert(_ALERT).from_select(columns, rows.where(_PRODUCT.c.id.in_(chunk))))
+
+
+def refresh_stock_alerts(product_ids: Optional[List[int]] = None) -> None:
+    """アラートを作り直す（product_ids=None なら全件）。コミットは呼び出し側。"""
+    _refresh(db.session.connection(), product_ids)
+
+
+def rebuild_stock_alerts() -> None:
+    """起動時: 全件作り直す（フック導入前のデータや Core 文での更新を反映）。"""
+    refresh_stock_alerts()
+    db.session.commit()
+
+
+def get_stock_alerts(dealer: str = '') -> List[Tuple[Product, StockAlert]]:
+    """在庫不足の商品とアラート行（不足数の多い順）。"""
+    query = StockAlert.query
+    if dealer:
+        query = query.filter(StockAlert.dealer == dealer)
+    alerts = query.order_by(StockAlert.shortage.desc(), StockAlert.product_id).all()
+
+    products: Dict[int, Product] = {}
+    ids = [a.product_id for a in alerts]
+    for chunk in _chunks(ids):
+        for product in Product.query.filter(Product.id.in_(chunk)):
+            products[product.id] = product
+    return [(products[a.product_id], a) for a in alerts if a.product_id in products]
+
+
+def _on_product_write(conn, changed_ids: Optional[Set[int]], deleted_ids: Set[int]) -> None:
+    _refresh(conn, None if changed_ids is None else changed_ids | deleted_ids)
+
+
+def register_stock_alert_hooks() -> None:
+    """商品の書き込みフックにアラートの差分更新を登録する（create_app から呼ぶ）。"""
+    add_product_write_listener(_on_product_write, columns=_WATCHED_COLUMNS)
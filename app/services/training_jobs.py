@@ -0,0 +1,253 @@
+"""需要予測モデルの訓練をバックグラウンドジョブとして実行する。
+
+リクエストスレッドでは受け付けだけを行い、当てはめは別プロセス（n_jobs 個）で商品を分割して実行する。
+子プロセスには CPU 時間・メモリの上限を設定する。進捗と結果は models/jobs/<job_id>.json に書き出すので、
+どのワーカーからでも状態を参照できる。完了したモデルはレジストリ経由で原子的に置き換える。
+"""
+from __future__ import annotations
+
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, Optional
+
+import numpy as np
+
+from app.services.demand_forecast import (
+    MIN_DEMAND_WEEKS,
+    DemandForecastModel,
+    fit_demand_forecast,
+    load_weekly_matrix,
+)
+from app.services.model_registry import model_registry
+
+JOB_DIR = os.path.join("models", "jobs")
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_COMPLETED = "completed"
+STATUS_FAILED = "failed"
+_ACTIVE_STATUSES = (STATUS_QUEUED, STATUS_RUNNING)
+
+# 1 プロセスあたりに渡す商品数の目安（進捗の細かさ）
+_CHUNK_ROWS = 5000
+# この秒数以上更新の無い実行中ジョブは、ワーカー再起動などで止まったものとみなす
+_STALE_SECONDS = 3600
+# ジョブ開始のロックファイル（待ち時間の上限と、異常終了で残ったロックとみなす経過秒数）
+_START_LOCK_NAME = "start.lock"
+_START_LOCK_TIMEOUT = 10
+_START_LOCK_STALE_SECONDS = 60
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def training_settings() -> Dict[str, int]:
+    """訓練ジョブの資源設定（環境変数で変更可能）。"""
+    return {
+        "n_jobs": max(1, _env_int("ML_TRAIN_N_JOBS", 1)),
+        "memory_mb": _env_int("ML_TRAIN_MEMORY_MB", 1024),
+        "cpu_seconds": _env_int("ML_TRAIN_CPU_SECONDS", 600),
+    }
+
+
+def _limit_resources(memory_mb: int, cpu_seconds: int) -> None:
+    """子プロセスの初期化: メモリ（アドレス空間）と CPU 時間の上限、優先度を下げる。"""
+    try:
+        import resource
+    except ImportError:  # Windows など
+        return
+    if memory_mb > 0:
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    if cpu_seconds > 0:
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds))
+    try:
+        os.nice(10)
+    except OSError:
+        pass
+
+
+class TrainingJobManager:
+    def __init__(self, job_dir: str = JOB_DIR, registry=None):
+        self.job_dir = job_dir
+        self.registry = registry or model_registry
+        self._lock = threading.Lock()
+
+    def _path(self, job_id: str) -> str:
+        return os.path.join(self.job_dir, f"{job_id}.json")
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """ジョブの状態（存在しなければ None）。"""
+        if not job_id or not all(c in "0123456789abcdef" for c in job_id):
+            return None
+        try:
+            with open(self._path(job_id), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, job: Dict[str, Any]) -> None:
+        os.makedirs(self.job_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.job_dir, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(job, f, ensure_ascii=False)
+        os.replace(tmp_path, self._path(job["job_id"]))
+
+    def _update(self, job: Dict[str, Any], **changes: Any) -> None:
+        job.update(changes)
+        job["updated_at"] = datetime.utcnow().isoformat()
+        self._write(job)
+
+    def _active_job(self, dealer: str) -> Optional[Dict[str, Any]]:
+        try:
+            names = os.listdir(self.job_dir)
+        except OSError:
+            return None
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+            job = self.get(name[:-5])
+            if not job or job.get("dealer") != dealer or job.get("status") not in _ACTIVE_STATUSES:
+                continue
+            try:
+                idle = (datetime.utcnow() - datetime.fromisoformat(job["updated_at"])).total_seconds()
+            except (KeyError, TypeError, ValueError):
+                idle = _STALE_SECONDS
+            if idle < _STALE_SECONDS:
+                return job
+        return None
+
+    @contextmanager
+    def _start_lock(self) -> Iterator[None]:
+        """実行中ジョブの確認から登録までを、ワーカープロセス間でも排他する（O_EXCL で作るロックファイル）。"""
+        os.makedirs(self.job_dir, exist_ok=True)
+        path = os.path.join(self.job_dir, _START_LOCK_NAME)
+        deadline = time.monotonic() + _START_LOCK_TIMEOUT
+        while True:
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                pass
+            try:
+                if time.time() - os.path.getmtime(path) > _START_LOCK_STALE_SECONDS:
+                    os.remove(path)
+                    continue
+            except OSError:
+                continue  # 他のワーカーが解放した
+            if time.monotonic() > deadline:
+                raise TimeoutError("訓練ジョブの開始処理が混み合っています。しばらくしてから再実行してください")
+            time.sleep(0.05)
+        os.close(fd)
+        try:
+            yield
+        finally:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def start(self, app, dealer: str = "") -> Dict[str, Any]:
+        """訓練ジョブを開始する。同じ取引会社のジョブが実行中ならそれを返す。"""
+        with self._lock, self._start_lock():
+            active = self._active_job(dealer)
+            if active is not None:
+                return active
+            now = datetime.utcnow().isoformat()
+            job = {
+                "job_id": uuid.uuid4().hex,
+                "dealer": dealer,
+                "status": STATUS_QUEUED,
+                "progress": 0.0,
+                "message": "訓練を受け付けました",
+                "metrics": None,
+                "settings": training_settings(),
+                "created_at": now,
+                "updated_at": now,
+                "finished_at": None,
+            }
+            self._write(job)
+        thread = threading.Thread(target=self._run, args=(app, job), daemon=True)
+        thread.start()
+        return job
+
+    def _run(self, app, job: Dict[str, Any]) -> None:
+        dealer = job["dealer"]
+        settings = job["settings"]
+        try:
+            self._update(job, status=STATUS_RUNNING, message="注文履歴を読み込んでいます")
+            with app.app_context():
+                product_ids, matrix = load_weekly_matrix(dealer)
+            if np.count_nonzero(matrix) < 10:  # データが少なすぎる場合
+                self._update(
+                    job, status=STATUS_FAILED, message="学習に十分なデータがありません（最低10件必要）",
+                    finished_at=datetime.utcnow().isoformat(),
+                )
+                return
+
+            n_chunks = max(1, min(len(product_ids), max(settings["n_jobs"], -(-len(product_ids) // _CHUNK_ROWS))))
+            bounds = np.linspace(0, len(product_ids), n_chunks + 1).astype(int)
+            chunks = [(bounds[i], bounds[i + 1]) for i in range(n_chunks)]
+            self._update(job, message=f"当てはめ中（{len(product_ids)}商品 / {n_chunks}分割）")
+
+            results = []
+            # 子プロセスは fork せず spawn で起動（ワーカーのスレッドや DB 接続を引き継がない）
+            with ProcessPoolExecutor(
+                max_workers=settings["n_jobs"],
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_limit_resources,
+                initargs=(settings["memory_mb"], settings["cpu_seconds"]),
+            ) as executor:
+                futures = [
+                    executor.submit(fit_demand_forecast, product_ids[lo:hi], matrix[lo:hi])
+                    for lo, hi in chunks
+                ]
+                for done, future in enumerate(as_completed(futures), start=1):
+                    results.append(future.result())
+                    self._update(job, progress=round(done / len(futures), 3))
+
+            model = DemandForecastModel.concat(results)
+            if len(model) == 0:
+                self._update(
+                    job, status=STATUS_FAILED,
+                    message=f"学習に十分なデータがありません（需要のある週が{MIN_DEMAND_WEEKS}週以上の商品がありません）",
+                    finished_at=datetime.utcnow().isoformat(),
+                )
+                return
+
+            # モデルとスケーラーは 1 ファイルで置換するので、予測中のワーカーは新旧どちらかの完全な組を読む
+            self.registry.save(dealer, model, None)
+            metrics = {
+                "products": len(model),
+                "intermittent": int(model.intermittent.sum()),
+                "median_wape": round(float(np.median(model.wape)), 4),
+            }
+            dealer_info = f"（取引会社: {dealer}）" if dealer else ""
+            self._update(
+                job, status=STATUS_COMPLETED, progress=1.0, metrics=metrics,
+                message=(
+                    f"モデル訓練完了{dealer_info} - 対象商品: {metrics['products']}件"
+                    f"（間欠需要: {metrics['intermittent']}件）, 予測誤差(WAPE中央値): {metrics['median_wape']:.3f}"
+                ),
+                finished_at=datetime.utcnow().isoformat(),
+            )
+        except Exception as e:
+            self._update(
+                job, status=STATUS_FAILED, message=f"モデル訓練エラー: {str(e)}",
+                finished_at=datetime.utcnow().isoformat(),
+            )
+
+
+training_jobs = TrainingJobManager()
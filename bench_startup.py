@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+起動時間ベンチマーク: アプリ起動（create_app）までの import コストをモジュール別に計測する。
+
+    python bench_startup.py            # 起動時に読み込まれるパッケージの上位を表示
+    python bench_startup.py --services # 遅延読み込みのサービスも読み込んだ場合（初回利用時のコスト）
+    python bench_startup.py --json     # CI などで比較する場合
+
+計測は毎回新しいプロセスで `python -X importtime` を使って行う（import キャッシュの影響を受けない）。
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# 遅延読み込みしているサービス（--services 指定時に読み込む）
+LAZY_SERVICES = (
+    "app.services.csv_service",
+    "app.services.pdf_service",
+    "app.services.delivery_pdf_import_service",
+    "app.services.ml_service",
+    "app.services.training_jobs",
+    "app.services.arrow_service",
+)
+
+_CHILD_CODE = """
+import json, sys, time
+t0 = time.perf_counter()
+from app import create_app
+app = create_app()
+t1 = time.perf_counter()
+status = app.test_client().get('/health').status_code
+t2 = time.perf_counter()
+for name in {services!r}:
+    try:
+        __import__(name)
+    except ImportError:
+        pass
+t3 = time.perf_counter()
+print(json.dumps({{'create_app_ms': (t1 - t0) * 1000, 'first_health_ms': (t2 - t0) * 1000,
+                   'services_ms': (t3 - t2) * 1000, 'health_status': status}}))
+"""
+
+
+def run_child(load_services: bool):
+    """子プロセスで起動し、(importtime の出力, 計測結果, 最大 RSS[KB]) を返す。"""
+    env = dict(os.environ)
+    env.setdefault("DATABASE_URL", "sqlite:///:memory:")
+    code = _CHILD_CODE.format(services=LAZY_SERVICES if load_services else ())
+    before = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        sys.stderr.write(proc.stderr)
+        raise SystemExit(proc.returncode)
+    max_rss = max(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss, before)
+    timings = json.loads(proc.stdout.strip().splitlines()[-1])
+    return proc.stderr, timings, max_rss
+
+
+def parse_importtime(stderr: str):
+    """
+    `-X importtime` の出力をトップレベルのパッケージ別に集計する（self 時間の合計、ミリ秒）。
+    例: "import time:      1234 |       5678 |   pandas.core"
+    """
+    per_package = defaultdict(float)
+    total_us = 0
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_us_text, _cumulative, name = line.split(":", 1)[1].split("|", 2)
+            self_us = int(self_us_text)
+            name = name.strip()
+        except ValueError:
+            continue
+        per_package[name.split(".")[0]] += self_us / 1000
+        total_us += self_us
+    return per_package, total_us / 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="起動時の import コストを計測")
+    parser.add_argument("--services", action="store_true", help="遅延読み込みのサービスも読み込む")
+    parser.add_argument("--top", type=int, default=20, help="表示するパッケージ数")
+    parser.add_argument("--json", action="store_true", help="JSON で出力")
+    args = parser.parse_args()
+
+    stderr, timings, max_rss = run_child(args.services)
+    per_package, total_ms = parse_importtime(stderr)
+    ranked = sorted(per_package.items(), key=lambda kv: kv[1], reverse=True)[: args.top]
+
+    if args.json:
+        print(json.dumps({
+            **timings,
+            'import_total_ms': total_ms,
+            'max_rss_kb': max_rss,
+            'packages': {name: round(ms, 2) for name, ms in ranked},
+        }, ensure_ascii=False, indent=2))
+        return
+
+    print(f"create_app まで:      {timings['create_app_ms']:8.1f} ms")
+    print(f"最初の /health まで:  {timings['first_health_ms']:8.1f} ms (status {timings['health_status']})")
+    if args.services:
+        print(f"遅延サービス読み込み: {timings['services_ms']:8.1f} ms")
+    print(f"import 合計:          {total_ms:8.1f} ms")
+    print(f"最大 RSS:             {max_rss / 1024:8.1f} MB")
+    print()
+    print(f"{'パッケージ':<30}{'ms':>10}")
+    for name, ms in ranked:
+        print(f"{name:<30}{ms:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
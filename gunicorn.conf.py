@@ -0,0 +1,99 @@
+"""
+Gunicorn 本番設定（`gunicorn wsgi:app` でもカレントディレクトリのこのファイルが自動で読み込まれる）。
+
+- ワーカー数: WEB_CONCURRENCY（未設定なら CPU 数 × 2 + 1、GUNICORN_MAX_WORKERS で上限。SQLite の場合は 1）
+- gthread ワーカー: CSV/PDF の送信や DB 待ちなど I/O 待ちの多いルートをスレッドで並行処理
+- preload: アプリをマスターで 1 回だけ読み込み、fork 後に DB エンジンの接続プールを作り直す
+- マイグレーション: マスター起動時に migrate.py を 1 回だけ実行（各ワーカーで create_all しない）
+"""
+import multiprocessing
+import os
+import subprocess
+import sys
+import threading
+
+# 各プロセスの create_app ではバックグラウンド初期化をしない（on_starting で 1 回だけ実行）
+os.environ.setdefault("DB_INIT_ON_STARTUP", "0")
+
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+bind = f"0.0.0.0:{_env_int('PORT', 5000)}"
+
+_database_url = os.environ.get("DATABASE_URL") or os.environ.get("DATABASE_PUBLIC_URL") or "sqlite:///"
+if _database_url.startswith("sqlite"):
+    # SQLite は複数プロセスからの書き込みでロック待ちになるため、既定は 1 ワーカー（スレッドで並行処理）
+    _default_workers = 1
+else:
+    _default_workers = min(multiprocessing.cpu_count() * 2 + 1, _env_int("GUNICORN_MAX_WORKERS", 8))
+workers = max(_env_int("WEB_CONCURRENCY", _default_workers), 1)
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+threads = max(_env_int("GUNICORN_THREADS", 4), 1)
+timeout = _env_int("GUNICORN_TIMEOUT", 120)
+graceful_timeout = _env_int("GUNICORN_GRACEFUL_TIMEOUT", 30)
+keepalive = _env_int("GUNICORN_KEEPALIVE", 5)
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") != "0"
+# メモリ断片化・リーク対策として一定リクエストごとにワーカーを入れ替える（0 で無効）
+max_requests = _env_int("GUNICORN_MAX_REQUESTS", 1000)
+max_requests_jitter = _env_int("GUNICORN_MAX_REQUESTS_JITTER", 100)
+
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG") or None
+errorlog = "-"
+
+
+# on_starting で起動したマイグレーションのプロセス（when_ready で終了を待って結果を記録する）
+_migration = None
+
+
+def on_starting(server):
+    """マスター起動時に DB マイグレーションを別プロセスで 1 回だけ実行する。
+
+    従来のバックグラウンド初期化と同じく、完了を待たずにワーカーを起動して /health に応答できるようにする。
+    終了コードは when_ready で起動するスレッドが確認してログに出す。
+    """
+    global _migration
+    if os.environ.get("DB_MIGRATE_ON_START", "1") == "0":
+        return
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrate.py")
+    server.log.info("Running DB migration: %s", script)
+    try:
+        _migration = subprocess.Popen([sys.executable, script])
+    except OSError:
+        server.log.exception("DB migration could not be started: %s", script)
+
+
+def _wait_migration(server, process):
+    returncode = process.wait()
+    if returncode == 0:
+        server.log.info("DB migration finished")
+    else:
+        server.log.error(
+            "DB migration failed (exit code %s). Requests that need the database will fail "
+            "until it succeeds; run `python migrate.py` to see the error.",
+            returncode,
+        )
+
+
+def when_ready(server):
+    """マイグレーションの終了を待つスレッドを起動する（マスターの処理は止めない）。"""
+    if _migration is None:
+        return
+    threading.Thread(target=_wait_migration, args=(server, _migration), name="migration-wait", daemon=True).start()
+
+
+def post_fork(server, worker):
+    """fork 後にマスターから引き継いだ接続プールを破棄する（ソケットを親と共有しないため）。"""
+    if not server.cfg.preload_app:
+        return
+    from app import db
+
+    flask_app = worker.app.wsgi()
+    with flask_app.app_context():
+        for engine in db.engines.values():
+            # close=False: 親プロセスが持つ接続は閉じずに参照だけ捨てる
+            engine.dispose(close=False)
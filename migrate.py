@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+"""
+DB マイグレーション（テーブル作成・データ版数/注文集計の初期化・作業ディレクトリ作成）を 1 回だけ実行する。
+
+Gunicorn の複数ワーカー構成では各プロセスが create_all を走らせないよう、
+gunicorn.conf.py の起動時フックからこのスクリプトを 1 回だけ実行する。手動でも実行できる:
+
+    python migrate.py
+"""
+import os
+import sys
+
+# create_app 内のバックグラウンド初期化は行わず、ここで同期的に実行する
+os.environ['DB_INIT_ON_STARTUP'] = '0'
+
+from app import create_app, init_database
+
+
+def main():
+    app = create_app()
+    try:
+        init_database(app)
+    except Exception as e:
+        print(f"ERROR: DB migration failed: {e}", file=sys.stderr, flush=True)
+        return 1
+    print("DB migration completed", flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,11 @@
 import os
 from app import create_app
 
-app = create_app()
-
+# アプリはここでは作らない（gunicorn 等は wsgi.py の app を使う）。
+# 訓練ジョブの子プロセス（spawn）はこのファイルを __mp_main__ として読み直すため、
+# モジュールの読み込み時に create_app() すると子プロセスごとに DB 初期化が走る。
 if __name__ == '__main__':
+    app = create_app()
     # 本番環境では環境変数からポートを取得
     port = int(os.environ.get('PORT', 5000))
     debug = os.environ.get('FLASK_ENV') != 'production'
@@ -2,6 +2,7 @@
 """
 Railway/本番用: PORT を確実に読み取り Gunicorn を起動する。
 シェルでの $PORT 展開に依存しない。
+ワーカー数・スレッド数・preload・起動時マイグレーションは gunicorn.conf.py で設定する。
 """
 import os
 import sys
@@ -14,15 +15,15 @@ def main():
     except ValueError:
         port_int = 5000
     bind = f"0.0.0.0:{port_int}"
+    config = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gunicorn.conf.py")
     print(f"Starting gunicorn on {bind} (PORT={port})", flush=True)
     sys.stdout.flush()
     sys.stderr.flush()
     subprocess.run([
         "gunicorn",
+        "--config", config,
         "--bind", bind,
-        "--workers", "1",
-        "--timeout", "120",
-        "run:app",
+        "wsgi:app",
     ], check=True)
 
 if __name__ == "__main__":
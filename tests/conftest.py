@@ -0,0 +1,62 @@
+"""テスト共通の設定。SQLite の一時ファイルでアプリを作り、テストごとにテーブルを作り直す。"""
+import os
+
+import pytest
+
+# 起動時のバックグラウンド初期化はしない（テーブルは db フィクスチャで作る）
+os.environ['DB_INIT_ON_STARTUP'] = '0'
+
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    os.environ['DATABASE_URL'] = 'sqlite:///' + str(tmp_path_factory.mktemp('db') / 'test.db')
+    from app import create_app
+
+    application = create_app()
+    application.config['TESTING'] = True
+    return application
+
+
+@pytest.fixture
+def db(app):
+    from app import db as database
+    from app.services import inventory_page_service
+
+    with app.app_context():
+        database.create_all()
+        yield database
+        database.session.remove()
+        database.drop_all()
+    inventory_page_service._cache.clear()
+
+
+@pytest.fixture
+def client(app, db):
+    return app.test_client()
+
+
+@pytest.fixture
+def make_product(db):
+    """商品を登録してコミットする（指定しない項目は既定値）。"""
+    from app.models.inventory import Product
+
+    counter = {'n': 0}
+
+    def make(**fields):
+        counter['n'] += 1
+        n = counter['n']
+        values = {
+            'product_code': f'T{n:05d}',
+            'product_name': f'商品{n}',
+            'manufacturer': 'メーカー',
+            'unit_price': 100,
+            'current_stock': 10,
+            'min_quantity': 5,
+        }
+        values.update(fields)
+        product = Product(**values)
+        db.session.add(product)
+        db.session.commit()
+        return product
+
+    return make
@@ -0,0 +1,64 @@
+import pytest
+
+from app.models.inventory import Product, ReorderPolicy
+from app.services.bulk_patch_service import parse_patch, patch_products
+
+
+@pytest.mark.parametrize('patch', [
+    {'unit_price': 'nan'}, {'unit_price': float('inf')}, {'unit_price': -1},
+    {'current_stock': True}, {'min_quantity': 'abc'}, {'current_stock': float('inf')},
+    {'product_name': 'x'}, {},
+])
+def test_parse_patch_rejects_bad_values(patch):
+    with pytest.raises(ValueError):
+        parse_patch(patch)
+
+
+def test_parse_patch_converts_numbers():
+    assert parse_patch({'unit_price': '12.5', 'current_stock': '3', 'category': ' 消耗品 '}) == {
+        'unit_price': 12.5, 'current_stock': 3, 'category': '消耗品',
+    }
+
+
+def test_patch_by_ids(db, make_product):
+    first, second, untouched = make_product(), make_product(), make_product()
+    counts = patch_products({'category': '消耗品'}, product_ids=[first.id, str(second.id)])
+    db.session.commit()
+    assert counts['updated'] == 2
+    assert {p.id for p in Product.query.filter_by(category='消耗品')} == {first.id, second.id}
+    assert db.session.get(Product, untouched.id).category is None
+
+
+@pytest.mark.parametrize('product_ids', ['12', 12, [True], [None]])
+def test_patch_rejects_ids_that_are_not_a_list(db, make_product, product_ids):
+    make_product()
+    make_product()
+    with pytest.raises(ValueError):
+        patch_products({'category': '消耗品'}, product_ids=product_ids)
+    assert Product.query.filter_by(category='消耗品').count() == 0
+
+
+def test_bulk_category_route_rejects_a_string(client, make_product):
+    make_product()
+    make_product()
+    response = client.post('/api/products/bulk-category-update', json={'category': '消耗品', 'product_ids': '12'})
+    assert response.status_code == 400
+    assert Product.query.filter_by(category='消耗品').count() == 0
+
+
+def test_patch_by_filter_skips_system_dummies_and_marks_manual(db, make_product):
+    real = make_product(dealer='A')
+    other = make_product(dealer='B')
+    dummy = make_product(dealer='A', product_name='取引会社管理用_A', manufacturer='システム')
+    counts = patch_products({'min_quantity': 9}, filter_spec={'dealer': 'A'})
+    db.session.commit()
+    assert counts['updated'] == 1
+    assert db.session.get(Product, real.id).min_quantity == 9
+    assert db.session.get(Product, dummy.id).min_quantity == 5
+    assert db.session.get(Product, other.id).min_quantity == 5
+    assert db.session.get(ReorderPolicy, real.id).manual is True
+
+
+def test_filter_must_not_be_empty(db):
+    with pytest.raises(ValueError):
+        patch_products({'category': 'x'}, filter_spec={})
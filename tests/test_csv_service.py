@@ -0,0 +1,66 @@
+import pandas as pd
+import pytest
+
+from app.models.inventory import Product, ProductAlias
+from app.services.csv_service import CSVService
+from app.services.product_alias_service import load_alias_map
+from app.services.product_matching import ProductMatcher, find_best_product_match
+
+COLUMNS = ['manufacturer', 'product_name', 'unit_price', 'quantity']
+
+
+def _frame(*rows):
+    return pd.DataFrame(list(rows), columns=COLUMNS)
+
+
+def test_import_frames_matches_across_batches(db, make_product):
+    shampoo = make_product(product_name='シャンプー 500ml', current_stock=1, dealer='A')
+
+    ok, message = CSVService.import_inventory_frames(COLUMNS, [
+        _frame(('M', 'シャンプーX 500ml', 1.0, 2), ('M', 'リンス', 1.0, 3)),
+        # 前のバッチで登録したエイリアス・新規商品にも完全一致で紐づく
+        _frame(('M', 'シャンプーX 500ml', 1.0, 4), ('M', 'リンス', 1.0, 5)),
+    ], dealer='A', source='parquet')
+
+    assert ok, message
+    products = {p.product_name: p for p in Product.query.all()}
+    assert set(products) == {'シャンプー 500ml', 'リンス'}
+    assert products['シャンプー 500ml'].current_stock == 7
+    assert products['リンス'].current_stock == 8
+    assert [(a.product_id, a.alias_name, a.source) for a in ProductAlias.query.all()] == [
+        (shampoo.id, 'シャンプーX 500ml', 'parquet')
+    ]
+
+
+def test_import_frames_skips_ambiguous_rows(db, make_product):
+    make_product(product_name='カラーA 10 オレンジ')
+    make_product(product_name='カラーB 10 オレンジ')
+
+    ok, message = CSVService.import_inventory_frames(
+        COLUMNS, [_frame(('M', 'カラー 10 オレンジ', 1.0, 2))], dealer='A'
+    )
+
+    assert ok and '類似が曖昧でスキップ: 1件' in message
+    assert Product.query.count() == 2
+
+
+@pytest.mark.parametrize('candidate', [
+    'シャンプー 500ml', 'シャンプー　５００ＭＬ', 'シャンプーX 500ml', 'シャンプー 300ml', 'カラー 10 ピンク',
+    'カラー 10 オレンジ', 'トリートメント', '',
+])
+@pytest.mark.parametrize('dealer', ['', 'A', 'B'])
+def test_matcher_agrees_with_find_best_product_match(db, make_product, candidate, dealer):
+    make_product(product_name='シャンプー 500ml', dealer='A')
+    make_product(product_name='シャンプー 500ml', dealer='B')
+    make_product(product_name='シャンプー 300ml')
+    make_product(product_name='カラー 10 オレンジ', dealer='B')
+    other = make_product(product_name='トリートメント(旧)')
+    db.session.add(ProductAlias(product_id=other.id, alias_name='トリートメント'))
+    db.session.commit()
+    products = Product.query.all()
+    alias_map = load_alias_map(products)
+
+    expected = find_best_product_match(candidate, products, preferred_dealer=dealer, alias_map=alias_map)
+    actual = ProductMatcher(products, alias_map, preferred_dealer=dealer).match(candidate)
+
+    assert (actual[0], actual[2]) == (expected[0], expected[2])
@@ -0,0 +1,28 @@
+from app.services.duplicate_detection import find_near_duplicates
+
+
+def _clusters(products, **kwargs):
+    return sorted(sorted(c.ids) for c in find_near_duplicates(products, **kwargs))
+
+
+def test_normalized_duplicates_form_an_exact_cluster():
+    clusters = find_near_duplicates([
+        (1, 'シャンプー 500ml', 'M'),
+        (2, 'シャンプー　５００ＭＬ', 'M'),
+        (3, 'トリートメント', 'M'),
+    ])
+    assert [(sorted(c.ids), c.exact) for c in clusters] == [([1, 2], True)]
+
+
+def test_spelling_variants_cluster_but_colour_variants_do_not():
+    assert _clusters([
+        (1, 'ヘアカラー プロフェッショナル 10 オレンジ', 'M'),
+        (2, 'ヘアカラープロフェッショナル 10 オレンジ', 'M'),
+        (3, 'ヘアカラー プロフェッショナル 10 ピンク', 'M'),
+    ]) == [[1, 2]]
+
+
+def test_manufacturer_scope():
+    products = [(1, 'シャンプー 500ml', 'M1'), (2, 'シャンプー 500ml', 'M2')]
+    assert _clusters(products) == []
+    assert _clusters(products, same_manufacturer=False) == [[1, 2]]
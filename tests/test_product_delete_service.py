@@ -0,0 +1,44 @@
+import pytest
+
+from app.models.inventory import OrderHistory, Product, ProductAlias, ProductOrderStats
+from app.services.product_delete_service import delete_products
+
+
+def test_deletes_products_with_dependent_rows(db, make_product):
+    doomed = make_product()
+    kept = make_product()
+    for product in (doomed, kept):
+        db.session.add(OrderHistory(product_id=product.id, quantity=3))
+        db.session.add(ProductAlias(product_id=product.id, alias_name=f'別名{product.id}', source='csv'))
+    db.session.commit()
+
+    counts = delete_products([doomed.id])
+    db.session.commit()
+
+    assert counts == {'products': 1, 'order_history': 1, 'aliases': 1}
+    assert [p.id for p in Product.query.all()] == [kept.id]
+    assert {o.product_id for o in OrderHistory.query.all()} == {kept.id}
+    assert {a.product_id for a in ProductAlias.query.all()} == {kept.id}
+    assert {s.product_id for s in ProductOrderStats.query.all()} == {kept.id}
+
+
+def test_accepts_numeric_strings_in_a_list(db, make_product):
+    product = make_product()
+    assert delete_products([str(product.id)])['products'] == 1
+
+
+@pytest.mark.parametrize('product_ids', ['12', {'1': 1}, [True], [1.5], [None], ['x']])
+def test_rejects_anything_but_a_list_of_ids(db, make_product, product_ids):
+    make_product()
+    make_product()
+    with pytest.raises(ValueError):
+        delete_products(product_ids)
+    assert Product.query.count() == 2
+
+
+def test_bulk_delete_route_rejects_a_string(client, make_product):
+    make_product()
+    make_product()
+    response = client.post('/api/products/bulk-delete', json={'product_ids': '12'})
+    assert response.status_code == 400
+    assert Product.query.count() == 2
@@ -0,0 +1,145 @@
+import pytest
+
+from app.models.inventory import OrderHistory, Product, ProductAlias, ProductOrderStats, ReorderPolicy
+from app.services.product_merge_service import (
+    find_exact_duplicate_groups,
+    merge_duplicate_groups,
+    merge_product_groups,
+    merge_products,
+    remove_duplicate_system_dummies,
+)
+
+
+def _dummy(make_product, dealer='取引先A'):
+    return make_product(product_name=f'取引会社管理用_{dealer}', manufacturer='システム', dealer=dealer)
+
+
+def test_exact_groups_exclude_system_dummies(db, make_product):
+    _dummy(make_product)
+    _dummy(make_product)
+    first = make_product(product_name='シャンプー', dealer='取引先A')
+    second = make_product(product_name='シャンプー', dealer='取引先A')
+
+    assert [g['product_ids'] for g in find_exact_duplicate_groups()] == [[first.id, second.id]]
+    assert len(find_exact_duplicate_groups(system_dummies=True)) == 1
+
+
+def test_failed_group_does_not_abort_the_others(db, make_product):
+    first = make_product(product_name='シャンプー', current_stock=3)
+    second = make_product(product_name='シャンプー', current_stock=4)
+
+    result = merge_duplicate_groups([[first.id, 999999], [first.id, second.id]])
+    db.session.commit()
+
+    assert result['groups'] == 1 and result['merged'] == 1
+    assert result['failed'] == [{'product_ids': [first.id, 999999], 'error': '指定された商品の一部が見つかりません'}]
+    assert [(p.id, p.current_stock) for p in Product.query.all()] == [(first.id, 7)]
+
+
+def test_remove_duplicate_system_dummies_keeps_the_lowest_id(db, make_product):
+    kept = _dummy(make_product)
+    _dummy(make_product)
+    _dummy(make_product)
+    other = _dummy(make_product, dealer='取引先B')
+
+    assert remove_duplicate_system_dummies() == 2
+    db.session.commit()
+    assert sorted(p.id for p in Product.query.all()) == [kept.id, other.id]
+
+
+def test_clean_duplicates_route_merges_real_pairs_and_drops_duplicate_dummies(client, db, make_product):
+    dummy = _dummy(make_product)
+    _dummy(make_product)
+    first = make_product(product_name='シャンプー', dealer='取引先A', current_stock=2)
+    second = make_product(product_name='シャンプー', dealer='取引先A', current_stock=5)
+    db.session.add(OrderHistory(product_id=second.id, quantity=1))
+    db.session.commit()
+
+    response = client.post('/api/debug/clean-duplicates')
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['merged'] == 1 and body['removed_dummies'] == 1 and body['failed'] == []
+    assert sorted(p.id for p in Product.query.all()) == [dummy.id, first.id]
+    assert db.session.get(Product, first.id).current_stock == 7
+    assert [o.product_id for o in OrderHistory.query.all()] == [first.id]
+
+
+def test_fuzzy_duplicates_leave_out_system_dummies(client, db, make_product):
+    _dummy(make_product)
+    _dummy(make_product)
+    first = make_product(product_name='シャンプー 500ml')
+    second = make_product(product_name='シャンプー 500ml')
+
+    response = client.get('/api/debug/duplicate-products?mode=fuzzy')
+
+    assert response.status_code == 200
+    clusters = [sorted(int(pid) for pid in c['product_ids']) for c in response.get_json()['duplicates']]
+    assert clusters == [[first.id, second.id]]
+
+
+def test_merge_products_combines_fields_stock_history_and_names(db, make_product):
+    keep = make_product(product_name='シャンプー', unit_price=100, current_stock=2, min_quantity=3, dealer='A')
+    other = make_product(
+        product_name='シャンプー 500ml', unit_price=120, current_stock=5, min_quantity=8, dealer='B', category='ヘア'
+    )
+    db.session.add(OrderHistory(product_id=other.id, quantity=4))
+    db.session.add(ProductAlias(product_id=other.id, alias_name='旧シャンプー'))
+    db.session.add(ReorderPolicy(product_id=other.id, manual=True))
+    db.session.commit()
+    keep_id, other_id = keep.id, other.id
+
+    merged = merge_products(
+        [keep_id, other_id],
+        manufacturer_from=keep_id, product_name_from=other_id, unit_price_from=other_id, dealer_from=keep_id,
+    )
+
+    assert merged.id == keep_id
+    assert (merged.product_name, merged.unit_price, merged.dealer, merged.category) == ('シャンプー 500ml', 120, 'A', 'ヘア')
+    assert (merged.current_stock, merged.min_quantity) == (7, 8)
+    assert [p.id for p in Product.query.all()] == [keep_id]
+    assert [o.product_id for o in OrderHistory.query.all()] == [keep_id]
+    assert sorted(a.alias_name for a in ProductAlias.query.all()) == ['シャンプー', '旧シャンプー']
+    assert {a.product_id for a in ProductAlias.query.all()} == {keep_id}
+    assert db.session.get(ProductOrderStats, keep_id).order_count == 1
+    assert db.session.get(ReorderPolicy, other_id) is None
+
+
+def test_merge_products_rejects_a_source_outside_the_group(db, make_product):
+    first = make_product()
+    second = make_product()
+    with pytest.raises(ValueError):
+        merge_products(
+            [first.id, second.id],
+            manufacturer_from=first.id, product_name_from=999, unit_price_from=first.id, dealer_from=first.id,
+        )
+    assert Product.query.count() == 2
+
+
+def test_merge_product_groups_reports_bad_groups_and_merges_the_rest(db, make_product):
+    a, b, c, d = (make_product(current_stock=1).id for _ in range(4))
+    dummy = _dummy(make_product).id
+
+    results = merge_product_groups([
+        {'product_ids': [a, b]},
+        {'product_ids': [b, c]},                # 前のグループと重複
+        {'product_ids': [c, dummy]},            # システム管理用
+        {'product_ids': str(d)},                # 形式不正
+        {'product_ids': [c, d], 'keep_product_id': d},
+    ])
+    db.session.commit()
+
+    assert [r['success'] for r in results] == [True, False, False, False, True]
+    assert results[4]['product_id'] == d and results[4]['merged_ids'] == [c]
+    assert sorted(p.id for p in Product.query.all()) == [a, d, dummy]
+    assert db.session.get(Product, a).current_stock == 2
+
+
+def test_bulk_merge_route_rejects_when_no_group_is_valid(client, db, make_product):
+    first = make_product()
+
+    response = client.post('/api/products/merge/bulk', json={'groups': [{'product_ids': [first.id, 999]}]})
+
+    assert response.status_code == 400
+    assert response.get_json()['results'][0]['error'] == '指定された商品の一部が見つかりません'
+    assert Product.query.count() == 1
@@ -0,0 +1,91 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import insert
+
+from app.models.inventory import ProductChange
+from app.services.change_feed_service import latest_change_id
+from app.services.product_sync_service import (
+    InvalidSyncToken, get_product_changes, make_token, parse_token,
+)
+
+_CHANGE = ProductChange.__table__
+
+
+def test_token_round_trip():
+    at = datetime(2024, 5, 1, 12, 0, 0, 123000)
+    cursor = (datetime(2024, 5, 1, 11, 59, 0, 654321), 42)
+    version, parsed_at, parsed_cursor, pending = parse_token(make_token(300, at, cursor, [299, 250]))
+    assert (version, parsed_at, parsed_cursor, pending) == (300, at, cursor, [250, 299])
+    assert parse_token('17') == (17, None, None, [])
+
+
+@pytest.mark.parametrize('token', ['abc', '10-', '10~11', '300-1~50', '-1'])
+def test_invalid_tokens(token):
+    with pytest.raises(InvalidSyncToken):
+        parse_token(token)
+
+
+def test_late_commit_with_lower_id_is_returned(db, make_product):
+    first = make_product()
+    second = make_product()
+    version = latest_change_id()
+
+    # 版数 version+1 を採番した書き込みがまだコミットされていない間に、version+2 が先にコミットされた
+    db.session.execute(insert(_CHANGE).values(id=version + 2, product_id=first.id, op='upsert'))
+    db.session.commit()
+    result = get_product_changes(str(version))
+    assert result['upserted_ids'] == [first.id]
+    assert result['version'].endswith(f'~{version + 1}')
+
+    # 遅れてコミットされた version+1 も次の呼び出しで返る
+    db.session.execute(insert(_CHANGE).values(id=version + 1, product_id=second.id, op='upsert'))
+    db.session.commit()
+    result = get_product_changes(result['version'])
+    assert result['upserted_ids'] == [second.id]
+    assert '~' not in result['version']
+
+    result = get_product_changes(result['version'])
+    assert result['upserted_ids'] == []
+
+
+def test_rolled_back_id_stays_pending_without_resending(db, make_product):
+    product = make_product()
+    version = latest_change_id()
+    db.session.execute(insert(_CHANGE).values(id=version + 2, product_id=product.id, op='upsert'))
+    db.session.commit()
+    token = get_product_changes(str(version))['version']
+    # 採番されたままコミットされない版数は、範囲を外れるまで確認し続ける（商品は再送しない）
+    result = get_product_changes(token)
+    assert result['upserted_ids'] == []
+    assert result['version'].endswith(f'~{version + 1}')
+
+
+def test_system_dummies_are_reported_as_deleted(client, db, make_product):
+    make_product()
+    version = latest_change_id()
+    response = client.post('/api/settings/bulk-update', json={'field': 'dealer', 'add': ['新規取引会社']})
+    assert response.status_code == 200
+    result = get_product_changes(str(version))
+    assert result['upserted_ids'] == []
+    assert len(result['deleted_ids']) == 1
+
+
+def test_time_fallback_is_paged(db, make_product):
+    products = [make_product() for _ in range(5)]
+    version = latest_change_id()
+    db.session.execute(insert(_CHANGE).values(product_id=None, op='reset'))
+    db.session.commit()
+
+    seen, pages = [], 0
+    token = make_token(version)
+    while True:
+        result = get_product_changes(token, limit=2)
+        assert len(result['upserted_ids']) <= 2
+        seen += result['upserted_ids']
+        pages += 1
+        token = result['version']
+        if not result['has_more']:
+            break
+    assert sorted(seen) == [p.id for p in products]
+    assert pages == 3
@@ -0,0 +1,33 @@
+from sqlalchemy import func, select, update
+
+from app.models.inventory import Product, ProductChange, ReorderPolicy
+from app.services.reorder_service import mark_manual_min_quantity
+
+
+def _change_count(db):
+    return db.session.execute(select(func.count(ProductChange.id))).scalar()
+
+
+def test_bulk_update_logs_only_matching_products(db, make_product):
+    target = make_product(dealer='A')
+    make_product(dealer='B')
+    before = _change_count(db)
+    db.session.execute(
+        update(Product).where(Product.dealer == 'A').values(current_stock=0),
+        execution_options={'synchronize_session': False},
+    )
+    db.session.commit()
+    rows = db.session.execute(select(ProductChange.product_id).where(ProductChange.id > before)).scalars().all()
+    assert rows == [target.id]
+
+
+def test_statements_on_other_tables_are_not_product_writes(db, make_product):
+    for product in (make_product(dealer='A'), make_product(dealer='B')):
+        db.session.add(ReorderPolicy(product_id=product.id, manual=False))
+    db.session.commit()
+    before = _change_count(db)
+    # reorder_policy への文が副問い合わせで product を参照するだけなら、商品の変更として扱わない
+    mark_manual_min_quantity(Product.dealer == 'A')
+    db.session.commit()
+    assert _change_count(db) == before
+    assert {p.manual for p in ReorderPolicy.query.join(Product).filter(Product.dealer == 'A')} == {True}
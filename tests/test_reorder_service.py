@@ -0,0 +1,26 @@
+import pytest
+
+from app.models.inventory import Product
+from app.services import reorder_service
+
+
+@pytest.mark.parametrize('service_z', ['nan', 'inf', '-1', '5.5', 'abc'])
+def test_recompute_rejects_bad_service_z(client, db, make_product, service_z):
+    product = make_product(min_quantity=8)
+
+    response = client.post(f'/api/reorder/recompute?service_z={service_z}')
+
+    assert response.status_code == 400
+    assert db.session.get(Product, product.id).min_quantity == 8
+
+
+def test_recompute_accepts_a_valid_service_z(client, make_product):
+    make_product()
+    response = client.post('/api/reorder/recompute?service_z=2')
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize('raw', ['nan', 'inf', '-1', '9', 'x'])
+def test_env_service_z_falls_back_to_default(monkeypatch, raw):
+    monkeypatch.setenv('REORDER_SERVICE_Z', raw)
+    assert reorder_service._env_float('REORDER_SERVICE_Z', 1.65, high=reorder_service.MAX_SERVICE_Z) == 1.65
@@ -0,0 +1,28 @@
+import io
+
+from app.services.report_cache import ReportCache
+
+
+def test_get_returns_an_open_handle_that_survives_eviction(tmp_path):
+    cache = ReportCache(cache_dir=str(tmp_path), max_bytes=10)
+    cache.put_stream(('a',), io.BytesIO(b'12345'), '.pdf').close()
+
+    handle = cache.get(('a',), '.pdf')
+    # 別のリクエストの保存で容量を超え、開いているファイルが削除される
+    cache.put_stream(('b',), io.BytesIO(b'1234567890'), '.pdf').close()
+
+    with handle:
+        assert handle.read() == b'12345'
+    assert cache.get(('a',), '.pdf') is None
+
+
+def test_put_stream_returns_a_readable_handle_even_when_over_the_limit(tmp_path):
+    cache = ReportCache(cache_dir=str(tmp_path), max_bytes=1)
+
+    with cache.put_stream(('a',), io.BytesIO(b'too large'), '.pdf') as handle:
+        assert handle.read() == b'too large'
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_miss_returns_none(tmp_path):
+    assert ReportCache(cache_dir=str(tmp_path)).get(('missing',), '.pdf') is None
@@ -0,0 +1,8 @@
+"""WSGI エントリポイント（`gunicorn wsgi:app`）。
+
+run.py はモジュールの読み込み時にアプリを作らない（訓練ジョブの spawn 子プロセスが
+`python run.py` の __main__ を読み直したときに、アプリと起動時の DB 初期化が走らないようにするため）。
+"""
+from app import create_app
+
+app = create_app()